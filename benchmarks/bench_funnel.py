@@ -0,0 +1,347 @@
+"""End-to-end benchmark of the RSVP funnel.
+
+Each virtual guest goes through the whole flow (welcome, city, group, number of people,
+names, contact, Pix payment + QR image, confirmation) while the per-step latency is
+recorded. Run from the project root:
+
+    python -m benchmarks.bench_funnel --guests 200 --concurrency 8
+    python -m benchmarks.bench_funnel --seed-sizes 10000,100000 --output results.json
+    python -m benchmarks.bench_funnel --base-url http://127.0.0.1:8000   # running gunicorn
+    python -m benchmarks.bench_funnel --api   # JSON API (/api/rsvp) instead of the HTML steps
+
+Without --base-url the app runs in-process through the Flask test client, against a
+temporary SQLite database (or --database-url). Virtual guests are threads, so in-process
+numbers include GIL contention; use gunicorn for realistic throughput. Results (per-step
+p50/p95/p99, throughput, RSS growth, admin page scaling) are printed and written to JSON
+together with the git commit, so runs can be compared between commits.
+
+--base-url needs the server's ACCESS_PIN and ADMIN_PIN in the environment.
+"""
+import argparse
+import contextlib
+import datetime
+import http.cookiejar
+import io
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+DEFAULT_ENV = {
+    'SECRET_KEY': 'benchmark',
+    'ACCESS_PIN': 'bench-access',
+    'ADMIN_PIN': 'bench-admin',
+    'PIX_KEY': '123e4567-e89b-12d3-a456-426614174000',
+    'MERCHANT_NAME': 'Arraia da Laura',
+    'MERCHANT_CITY': 'Sao Jose',
+    'EVENT_ADDRESS': 'Benchmark',
+    # Every simulated guest comes from the same address; the limiter has its own benchmark
+    'RATE_LIMIT_BACKEND': 'off',
+}
+
+QR_IMAGE = re.compile(r'src="([^"]*/pix-qr/[^"]+)"')
+
+
+# --- HTTP clients ---
+
+class _Response(object):
+    def __init__(self, status, text):
+        self.status = status
+        self.text = text
+
+
+class TestClient(object):
+    """Flask test client, requests are handled in this process."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None, json_body=None):
+        response = self.client.open(path, method=method, data=data, json=json_body)
+        return _Response(response.status_code, response.get_data().decode('utf-8', 'replace'))
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPClient(object):
+    """Talks to a running server, keeping cookies like a browser (redirects not followed)."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect()
+        )
+
+    def request(self, method, path, data=None, json_body=None):
+        headers = {}
+        if json_body is not None:
+            body = json.dumps(json_body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        else:
+            body = urllib.parse.urlencode(data).encode('utf-8') if data is not None else None
+        request = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(request, timeout=30) as response:
+                return _Response(response.status, response.read().decode('utf-8', 'replace'))
+        except urllib.error.HTTPError as e:
+            return _Response(e.code, e.read().decode('utf-8', 'replace'))
+
+
+# --- Funnel ---
+
+def run_guest(client, guest_number, timings, errors):
+    """Goes through the whole RSVP flow once, recording (step, seconds) in timings."""
+    names = ['Convidado Numero', 'Acompanhante'][:1 + guest_number % 2]
+    steps = [
+        ('access', 'GET', f"/?access_pin={os.environ['ACCESS_PIN']}", None),
+        ('welcome', 'GET', '/welcome', None),
+        ('select_city GET', 'GET', '/city', None),
+        ('select_city POST', 'POST', '/city', {'city': 'Taubaté'}),
+        ('select_group GET', 'GET', '/group', None),
+        ('select_group POST', 'POST', '/group', {'group': 'Impostoras'}),
+        ('number_of_people GET', 'GET', '/number-of-people', None),
+        ('number_of_people POST', 'POST', '/number-of-people', {'num_people': str(len(names))}),
+        ('names_form GET', 'GET', '/names', None),
+        ('names_form POST', 'POST', '/names', {f'name_{i + 1}': name for i, name in enumerate(names)}),
+        ('contact_form GET', 'GET', '/contact', None),
+        ('contact_form POST', 'POST', '/contact', {'phone_number': '12999990000'}),
+        ('pix_payment_form', 'GET', '/pix-payment', None),
+        ('pix_qr', 'GET', None, None),
+        ('confirmation', 'GET', '/confirmation', None),
+    ]
+    qr_path = None
+    for step, method, path, data in steps:
+        if step == 'pix_qr':
+            if qr_path is None:
+                continue
+            path = qr_path
+        start = time.perf_counter()
+        response = client.request(method, path, data)
+        timings.append((step, time.perf_counter() - start))
+        if response.status >= 400:
+            errors.append(f"{step}: HTTP {response.status}")
+            return
+        if step == 'pix_payment_form':
+            match = QR_IMAGE.search(response.text)
+            qr_path = match.group(1) if match else None
+
+
+def run_guest_api(client, guest_number, timings, errors):
+    """Same RSVP through the JSON API: access, /api/rsvp, QR image and /api/rsvp/confirm."""
+    names = ['Convidado Numero', 'Acompanhante'][:1 + guest_number % 2]
+    steps = [
+        ('access', 'GET', f"/?access_pin={os.environ['ACCESS_PIN']}", None),
+        ('api_rsvp', 'POST', '/api/rsvp', {
+            'city': 'Taubaté', 'group': 'Impostoras', 'num_people': len(names),
+            'names': names, 'phone_number': '12999990000',
+        }),
+        ('pix_qr', 'GET', None, None),
+        ('api_rsvp_confirm', 'POST', '/api/rsvp/confirm', None),
+    ]
+    qr_path = None
+    for step, method, path, json_body in steps:
+        if step == 'pix_qr':
+            path = qr_path
+        start = time.perf_counter()
+        response = client.request(method, path, json_body=json_body)
+        timings.append((step, time.perf_counter() - start))
+        if response.status >= 400:
+            errors.append(f"{step}: HTTP {response.status}")
+            return
+        if step == 'api_rsvp':
+            qr_path = json.loads(response.text)['qr_image']
+
+
+def percentiles(samples):
+    if len(samples) < 2:
+        value = samples[0] * 1000 if samples else None
+        return {'count': len(samples), 'p50_ms': value, 'p95_ms': value, 'p99_ms': value}
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return {
+        'count': len(samples),
+        'p50_ms': round(cuts[49] * 1000, 3),
+        'p95_ms': round(cuts[94] * 1000, 3),
+        'p99_ms': round(cuts[98] * 1000, 3),
+    }
+
+
+def rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # Peak, not current, on macOS/BSD
+
+
+def run_funnel(make_client, guests, concurrency, run_guest=run_guest):
+    timings, errors = [], []
+    next_guest = iter(range(guests))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                guest_number = next(next_guest, None)
+            if guest_number is None:
+                return
+            try:
+                run_guest(make_client(), guest_number, timings, errors)
+            except Exception as e:
+                errors.append(f"guest {guest_number}: {e!r}")
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    by_step = {}
+    for step, seconds in timings:
+        by_step.setdefault(step, []).append(seconds)
+    return {
+        'guests': guests,
+        'concurrency': concurrency,
+        'elapsed_s': round(elapsed, 3),
+        'guests_per_s': round(guests / elapsed, 2),
+        'requests_per_s': round(len(timings) / elapsed, 2),
+        'errors': errors[:20],
+        'error_count': len(errors),
+        'steps': {step: percentiles(samples) for step, samples in by_step.items()},
+    }
+
+
+def measure_admin_page(make_client, samples):
+    client = make_client()
+    client.request('GET', f"/confirmed-guests?admin_pin={os.environ['ADMIN_PIN']}")
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        response = client.request('GET', '/confirmed-guests')
+        timings.append(time.perf_counter() - start)
+        if response.status != 200:
+            raise RuntimeError(f"/confirmed-guests returned HTTP {response.status}")
+    return percentiles(timings)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--guests', type=int, default=100, help="virtual guests going through the funnel")
+    parser.add_argument('--concurrency', type=int, default=4, help="guests running at the same time")
+    parser.add_argument('--base-url', help="benchmark a running server instead of the test client")
+    parser.add_argument('--database-url', help="database for the in-process app (default: temporary SQLite)")
+    parser.add_argument('--seed-sizes', default='', help="comma-separated RSVP counts to time /confirmed-guests at")
+    parser.add_argument('--admin-samples', type=int, default=5, help="requests per size for /confirmed-guests")
+    parser.add_argument('--api', action='store_true', help="go through the JSON API instead of the HTML steps")
+    parser.add_argument('--output', default='bench_funnel.json', help="JSON file for the results")
+    args = parser.parse_args()
+
+    for key, value in DEFAULT_ENV.items():
+        os.environ.setdefault(key, value)
+
+    results = {
+        'commit': git_commit(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'target': args.base_url or 'flask test client',
+        'flow': 'api' if args.api else 'html',
+    }
+    database_dir = None
+    quiet = contextlib.redirect_stdout(io.StringIO())  # The app prints a line per RSVP
+
+    if args.base_url:
+        def make_client():
+            return HTTPClient(args.base_url)
+        app = None
+    else:
+        if args.database_url:
+            os.environ['DATABASE_URL'] = args.database_url
+        else:
+            database_dir = tempfile.TemporaryDirectory()
+            os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(database_dir.name, 'bench.sqlite')}"
+        results['database'] = os.environ['DATABASE_URL'].split('://')[0]
+        from src.app import create_app, create_schema
+
+        app = create_app()
+        with app.app_context():
+            create_schema()
+
+        def make_client():
+            return TestClient(app)
+
+    rss_before = rss_kb()
+    with quiet:
+        results['funnel'] = run_funnel(make_client, args.guests, args.concurrency,
+                                       run_guest_api if args.api else run_guest)
+    journal = app.extensions.get('rsvp_journal') if app is not None else None
+    if journal is not None:
+        # Write-behind mode: time how long the queued confirmations take to reach the database
+        start = time.perf_counter()
+        with quiet:
+            journal.stop()
+        results['journal_drain_s'] = round(time.perf_counter() - start, 3)
+    if app is not None:
+        results['rss_kb'] = {'before': rss_before, 'after': rss_kb(), 'growth': rss_kb() - rss_before}
+
+    sizes = [int(size) for size in args.seed_sizes.split(',') if size.strip()]
+    if sizes:
+        if app is None:
+            sys.exit("--seed-sizes only works in-process (without --base-url)")
+        from benchmarks.seed_rsvps import seed_rsvps
+        from src.models import RSVP
+
+        results['confirmed_guests'] = {}
+        with app.app_context():
+            current = RSVP.query.count()
+        for size in sorted(sizes):
+            with app.app_context():
+                if size > current:
+                    current += seed_rsvps(size - current)
+            results['confirmed_guests'][str(size)] = measure_admin_page(make_client, args.admin_samples)
+
+    funnel = results['funnel']
+    print(f"{funnel['guests']} guests, concurrency {funnel['concurrency']}: "
+          f"{funnel['guests_per_s']} guests/s, {funnel['requests_per_s']} requests/s, "
+          f"{funnel['error_count']} errors")
+    print(f"{'step':24} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for step, stats in funnel['steps'].items():
+        print(f"{step:24} {stats['p50_ms']:9.2f} {stats['p95_ms']:9.2f} {stats['p99_ms']:9.2f}")
+    if 'journal_drain_s' in results:
+        print(f"RSVP journal drained in {results['journal_drain_s']} s")
+    if 'rss_kb' in results:
+        print(f"RSS growth: {results['rss_kb']['growth']} KiB")
+    for size, stats in results.get('confirmed_guests', {}).items():
+        print(f"/confirmed-guests with {size} RSVPs: p50 {stats['p50_ms']:.1f} ms, p95 {stats['p95_ms']:.1f} ms")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+    if database_dir is not None:
+        database_dir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
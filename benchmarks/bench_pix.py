@@ -0,0 +1,94 @@
+"""Micro-benchmark: pybrcode (+ qrcode/Pillow) vs the in-house src.brcode module.
+
+Run from the project root:
+    python -m benchmarks.bench_pix [iterations]
+
+Needs pybrcode, qrcode and Pillow installed for the reference path. Checks that both
+paths produce the same payload, then reports import time, latency per request and peak
+memory (tracemalloc) for building the payload and rendering the QR code image.
+
+tracemalloc only sees allocations made through Python's allocator: zlib's deflate state
+is counted for brcode, while Pillow's own C buffers are not counted for pybrcode.
+"""
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+PIX_KEY = os.getenv('PIX_KEY', '123e4567-e89b-12d3-a456-426614174000')
+MERCHANT_NAME = os.getenv('MERCHANT_NAME', 'Yuri Galindo')
+MERCHANT_CITY = os.getenv('MERCHANT_CITY', 'Sao Jose')
+
+SAMPLES = [
+    (1, "Maria"),
+    (2, "Ana Maria, Joao"),
+    (4, "Fulano de Tal, Beltrano da Silva, Ciclano Souza, Maria"),
+    (10, "Pedro, Paulo, Tiago, Joao, Andre, Filipe, Bartolomeu, Tome, Mateus, Simao"[:67] + "..."),
+]
+
+
+def _pix_id(names):
+    return names.replace(" ", "").replace(",", "")[:25]
+
+
+def reference(amount, names):
+    from pybrcode.pix import generate_simple_pix
+    pix_obj = generate_simple_pix(key=PIX_KEY, fullname=MERCHANT_NAME, city=MERCHANT_CITY,
+                                  value=15 * amount, description=names, pix_id=_pix_id(names))
+    return str(pix_obj), pix_obj.toBase64()
+
+
+def native(amount, names):
+    from src.brcode import build_pix_payload, qr_png
+    payload = build_pix_payload(key=PIX_KEY, name=MERCHANT_NAME, city=MERCHANT_CITY,
+                                value=15 * amount, txid=_pix_id(names), description=names)
+    return payload, qr_png(payload)
+
+
+def import_time(statement):
+    # Fresh interpreter so nothing is already in sys.modules
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', statement], check=True)
+    return time.perf_counter() - start
+
+
+def measure(func, iterations):
+    for sample in SAMPLES:
+        func(*sample)  # Warm up imports and lookup tables
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(*SAMPLES[i % len(SAMPLES)])
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    for sample in SAMPLES:
+        func(*sample)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed / iterations, peak
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    for amount, names in SAMPLES:
+        expected, _ = reference(amount, names)
+        actual, _ = native(amount, names)
+        if expected != actual:
+            sys.exit(f"Payload mismatch for {names!r}:\n  pybrcode: {expected}\n  brcode:   {actual}")
+    print(f"Payloads identical for {len(SAMPLES)} samples")
+
+    baseline = import_time('pass')
+    print(f"{'':10} {'import (ms)':>12} {'per request (ms)':>17} {'peak mem (KiB)':>15}")
+    for label, func, statement in (
+        ('pybrcode', reference, 'import pybrcode.pix, qrcode, PIL.Image'),
+        ('brcode', native, 'import src.brcode'),
+    ):
+        imported = (import_time(statement) - baseline) * 1000
+        per_request, peak = measure(func, iterations)
+        print(f"{label:10} {imported:12.1f} {per_request * 1000:17.2f} {peak / 1024:15.1f}")
+
+
+if __name__ == '__main__':
+    main()
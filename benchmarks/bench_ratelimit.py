@@ -0,0 +1,116 @@
+"""Rate limiter cost and behavior under a burst.
+
+Run from the project root:
+    python -m benchmarks.bench_ratelimit --processes 4
+
+1. Cost of one token take, for the 'memory' and 'sqlite' bucket backends.
+2. Sharing: several processes take from the same SQLite bucket at once; with no
+   refill exactly `burst` takes may succeed in total, however many workers there are.
+3. A refresh-happy guest: one session reloads the Pix payment page (payload + QR code)
+   in a loop through the Flask test client; served and rejected (429) requests are
+   counted and timed separately.
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.bench_funnel import DEFAULT_ENV
+
+
+def take_cost_us(buckets, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        buckets.take(f"default|ip:10.0.{i % 250}.{i % 7}", 1e9, 1e9)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def _take_process(path, burst, attempts, ready, results):
+    from src.ratelimit import SQLiteBuckets
+
+    buckets = SQLiteBuckets(path)
+    buckets.take('warm-up', 1e9, 1e9) # Opens the connection before the race
+    ready.wait()
+    start = time.perf_counter()
+    allowed = sum(1 for _ in range(attempts) if buckets.take('shared', 1e-9, burst) == 0)
+    results.put((allowed, time.perf_counter() - start))
+
+
+def shared_bucket(processes, burst, attempts):
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, 'ratelimit.sqlite')
+        context = multiprocessing.get_context('spawn')
+        ready = context.Barrier(processes)
+        results = context.Queue()
+        workers = [context.Process(target=_take_process, args=(path, burst, attempts, ready, results)) for _ in range(processes)]
+        for worker in workers:
+            worker.start()
+        outcomes = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        return sum(allowed for allowed, _ in outcomes), processes * attempts / max(elapsed for _, elapsed in outcomes)
+
+
+def refresh_happy_guest(requests):
+    from src.app import create_app, create_schema
+    from src.config import Config
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        app = create_app(type('BenchConfig', (Config,), {
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(work_dir, 'bench.sqlite')}",
+            'RATE_LIMIT_BACKEND': 'sqlite',
+            'RATE_LIMIT_PATH': os.path.join(work_dir, 'ratelimit.sqlite'),
+        }))
+        with app.app_context():
+            create_schema()
+        client = app.test_client()
+        client.get(f"/?access_pin={os.environ['ACCESS_PIN']}")
+        client.post('/city', data={'city': 'Taubaté'})
+        client.post('/group', data={'group': 'Impostoras'})
+        client.post('/number-of-people', data={'num_people': '2'})
+        client.post('/names', data={'name_1': 'Convidado Numero', 'name_2': 'Acompanhante'})
+        client.post('/contact', data={'phone_number': '12999990000'})
+
+        served, rejected = [], []
+        for i in range(requests):
+            # A different amount each time, so the Pix cache doesn't hide the QR code cost
+            with client.session_transaction() as session:
+                session['names'] = ['Convidado Numero', f'Acompanhante {chr(65 + i % 26)}{chr(65 + i // 26 % 26)}']
+            start = time.perf_counter()
+            response = client.get('/pix-payment')
+            elapsed = time.perf_counter() - start
+            (served if response.status_code == 200 else rejected).append(elapsed)
+        return served, rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20000, help="token takes per backend")
+    parser.add_argument('--processes', type=int, default=4, help="processes sharing one SQLite bucket")
+    parser.add_argument('--burst', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=100, help="Pix page reloads by one guest")
+    args = parser.parse_args()
+
+    for key, value in DEFAULT_ENV.items():
+        os.environ.setdefault(key, value)
+    from src.ratelimit import MemoryBuckets, SQLiteBuckets
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        print(f"take, memory: {take_cost_us(MemoryBuckets(), args.iterations):.1f} us")
+        print(f"take, sqlite: {take_cost_us(SQLiteBuckets(os.path.join(work_dir, 'rl.sqlite')), args.iterations // 4):.1f} us")
+
+    allowed, takes_per_s = shared_bucket(args.processes, args.burst, args.burst)
+    print(f"{args.processes} processes x {args.burst} takes on one bucket of {args.burst}: "
+          f"{allowed} allowed (expected {args.burst}), {takes_per_s:,.0f} takes/s")
+
+    served, rejected = refresh_happy_guest(args.requests)
+    def ms(values):
+        return f"{statistics.median(values) * 1000:.2f} ms" if values else "-"
+    print(f"{args.requests} Pix page reloads by one guest: {len(served)} served (median {ms(served)}), "
+          f"{len(rejected)} rejected with 429 (median {ms(rejected)})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Pix reconciliation throughput: bank statement lines matched and saved per second.
+
+Seeds a temporary SQLite database with RSVPs, writes a synthetic statement export with
+a payment for most of them (the txid in the description, like most banks show it),
+some without the txid, some paid twice and some unrelated credits, and times the
+parse + match + save pass of reconcile.py. Run from the project root:
+
+    python -m benchmarks.bench_reconcile --rsvps 20000 --lines 50000
+    python -m benchmarks.bench_reconcile --format ofx
+"""
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.bench_funnel import DEFAULT_ENV
+from benchmarks.seed_rsvps import seed_rsvps
+
+
+def _statement_lines(rsvps, count):
+    """Yields (posted_at, amount, description), in statement order."""
+    from src.utils import pix_description, pix_id_for, split_names
+
+    lines = []
+    for _, names_str, num_people, timestamp in rsvps:
+        paid_at = timestamp + datetime.timedelta(minutes=random.randint(0, 120))
+        amount = 15 * num_people
+        payer = split_names(names_str)[0]
+        roll = random.random()
+        if roll < 0.75:
+            txid = pix_id_for(pix_description(split_names(names_str)))
+            lines.append((paid_at, amount, f"PIX RECEBIDO - {payer.upper()} {txid}"))
+        elif roll < 0.85:
+            lines.append((paid_at, amount, f"PIX RECEBIDO - {payer.upper()}")) # Typed the key by hand
+        elif roll < 0.88:
+            txid = pix_id_for(pix_description(split_names(names_str)))
+            lines += [(paid_at, amount, f"PIX RECEBIDO - {payer.upper()} {txid}")] * 2 # Paid twice
+        if len(lines) >= count:
+            break
+    while len(lines) < count:
+        # Other credits and debits on the account
+        posted_at = datetime.datetime.utcnow() - datetime.timedelta(seconds=random.randint(0, 30 * 24 * 3600))
+        lines.append((posted_at, round(random.uniform(-500, 500), 2), f"TED {random.randint(1000, 9999)} EMPRESA LTDA"))
+    lines = lines[:count]
+    lines.sort(key=lambda line: line[0])
+    return lines
+
+
+def write_statement(path, lines, statement_format):
+    with open(path, 'w', encoding='cp1252', newline='') as statement:
+        if statement_format == 'ofx':
+            statement.write("OFXHEADER:100\nDATA:OFXSGML\n\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>\n")
+            for i, (posted_at, amount, description) in enumerate(lines):
+                statement.write(
+                    f"<STMTTRN>\n<TRNTYPE>{'CREDIT' if amount > 0 else 'DEBIT'}\n<DTPOSTED>{posted_at:%Y%m%d%H%M%S}[-3:BRT]\n"
+                    f"<TRNAMT>{amount:.2f}\n<FITID>{i}\n<MEMO>{description}\n</STMTTRN>\n"
+                )
+            statement.write("</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n")
+        else:
+            statement.write("Data;Histórico;Valor (R$)\n")
+            for posted_at, amount, description in lines:
+                statement.write(f"{posted_at:%d/%m/%Y %H:%M:%S};{description};{amount:.2f}".replace('.', ',') + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rsvps', type=int, default=20000, help="RSVPs in the database")
+    parser.add_argument('--lines', type=int, default=50000, help="lines in the statement")
+    parser.add_argument('--format', choices=('csv', 'ofx'), default='csv')
+    parser.add_argument('--seed', type=int, default=17)
+    args = parser.parse_args()
+
+    for key, value in DEFAULT_ENV.items():
+        os.environ.setdefault(key, value)
+    random.seed(args.seed)
+
+    from src.app import create_app, create_schema
+    from src.config import Config
+    from src.models import db, RSVP
+    from src.reconcile import open_statement, parse_statement, reconcile_statement
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        app = create_app(type('BenchConfig', (Config,), {
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(work_dir, 'reconcile.sqlite')}",
+        }))
+        statement_path = os.path.join(work_dir, f'extrato.{args.format}')
+        with app.app_context():
+            create_schema()
+            seed_rsvps(args.rsvps)
+            rsvps = db.session.query(RSVP.id, RSVP.names_str, RSVP.num_people, RSVP.timestamp).all()
+            random.shuffle(rsvps)
+            write_statement(statement_path, _statement_lines(rsvps, args.lines), args.format)
+
+            start = time.perf_counter()
+            with open(statement_path, 'rb') as statement:
+                run_id, counts = reconcile_statement(parse_statement(open_statement(statement), statement_path))
+            elapsed = time.perf_counter() - start
+            db.engine.dispose()
+
+    total = sum(counts.values())
+    print(f"{args.rsvps} RSVPs, {args.lines} {args.format} lines ({total} credits) in {elapsed:.2f}s: "
+          f"{args.lines / elapsed:,.0f} lines/s")
+    print(f"matched {counts['matched']}, ambiguous {counts['ambiguous']}, unmatched {counts['unmatched']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""Requests per second and tail latency of the gunicorn serving modes.
+
+Starts gunicorn (gunicorn.conf.py) once per worker class, with the same number of worker
+processes, against a fresh SQLite database, and runs the RSVP funnel of bench_funnel
+over HTTP. While the guests go through the funnel, --streams admin pages keep the live
+feed (Server-Sent Events) open, as an admin watching the confirmations would. Run from
+the project root:
+
+    python -m benchmarks.bench_serving --workers 2 --guests 100 --concurrency 16
+    python -m benchmarks.bench_serving --modes sync,gthread --streams 0
+
+gthread and gevent run with QR_RENDER_PROCESSES=1 (see src/qrpool.py); gevent is
+skipped if the package is not installed. The rate limiter is off, since every guest
+comes from the same address.
+"""
+import argparse
+import contextlib
+import http.client
+import io
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.bench_funnel import DEFAULT_ENV, HTTPClient, run_funnel
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_until_up(base_url, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {process.returncode}")
+        try:
+            urllib.request.urlopen(base_url + '/robots.txt', timeout=1).read()
+            return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn didn't start in time")
+
+
+def _admin_cookie(port, admin_pin):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    try:
+        connection.request('GET', f"/confirmed-guests?admin_pin={admin_pin}")
+        response = connection.getresponse()
+        response.read()
+        return (response.getheader('Set-Cookie') or '').split(';')[0]
+    finally:
+        connection.close()
+
+
+def _hold_stream(port, cookie, stop):
+    # An admin page with the live feed open: reads events until the benchmark ends
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+    try:
+        connection.request('GET', '/confirmed-guests/live', headers={'Cookie': cookie})
+        response = connection.getresponse()
+        while not stop.is_set():
+            try:
+                if not response.fp.readline():
+                    return
+            except socket.timeout:
+                pass
+    except OSError:
+        pass
+    finally:
+        connection.close()
+
+
+def _p50_p99(stats):
+    if not stats or stats['p50_ms'] is None:
+        return '-'
+    return f"{stats['p50_ms']:.1f}/{stats['p99_ms']:.1f}"
+
+
+def run_mode(mode, args, env):
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(env, GUNICORN_WORKER_CLASS=mode, GUNICORN_BIND=f"127.0.0.1:{port}", WEB_CONCURRENCY=str(args.workers))
+    if mode == 'gthread':
+        env['GUNICORN_THREADS'] = str(args.threads)
+    if mode != 'sync':
+        env['QR_RENDER_PROCESSES'] = '1'
+
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'src.wsgi:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    stop = threading.Event()
+    streams = []
+    try:
+        _wait_until_up(base_url, process)
+        cookie = _admin_cookie(port, env['ADMIN_PIN'])
+        for _ in range(args.streams):
+            stream = threading.Thread(target=_hold_stream, args=(port, cookie, stop))
+            stream.start()
+            streams.append(stream)
+        time.sleep(0.5)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = run_funnel(lambda: HTTPClient(base_url), args.guests, args.concurrency)
+    finally:
+        stop.set()
+        for stream in streams:
+            stream.join()
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=30)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', default='sync,gthread,gevent')
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn worker processes, the same for every mode")
+    parser.add_argument('--threads', type=int, default=4, help="threads per gthread worker")
+    parser.add_argument('--guests', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--streams', type=int, default=1, help="admin live feeds held open during the run")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    for key, value in DEFAULT_ENV.items():
+        env.setdefault(key, value)
+    os.environ.update({key: env[key] for key in DEFAULT_ENV})
+    env['RATE_LIMIT_BACKEND'] = 'off'
+
+    print(f"{args.workers} workers, {args.guests} guests, concurrency {args.concurrency}, {args.streams} live feed(s) open")
+    print(f"{'mode':8} {'req/s':>7} {'errors':>7} {'pix_qr p50/p99 ms':>19} {'confirm p50/p99 ms':>20}   worst step p99 ms")
+    for mode in args.modes.split(','):
+        if mode == 'gevent':
+            try:
+                import gevent # noqa: F401
+            except ImportError:
+                print(f"{mode:8} skipped, gevent is not installed")
+                continue
+        with tempfile.TemporaryDirectory() as work_dir:
+            env['DATABASE_URL'] = f"sqlite:///{os.path.join(work_dir, 'bench.sqlite')}"
+            env['RATE_LIMIT_PATH'] = os.path.join(work_dir, 'ratelimit.sqlite')
+            subprocess.run([sys.executable, '-m', 'flask', '--app', 'src.app', 'init-db'], env=env, check=True, stdout=subprocess.DEVNULL)
+            result = run_mode(mode, args, env)
+
+        steps = result['steps']
+        # run_funnel keeps percentiles per step only, so the overall tail is the worst step's
+        worst_step = max(steps, key=lambda step: steps[step]['p99_ms'] or 0, default=None)
+        worst = f"{steps[worst_step]['p99_ms']:9.1f} {worst_step}" if worst_step else '-'
+        print(f"{mode:8} {result['requests_per_s']:7} {result['error_count']:7} "
+              f"{_p50_p99(steps.get('pix_qr')):>19} {_p50_p99(steps.get('confirmation')):>20}   {worst}")
+
+if __name__ == '__main__':
+    main()
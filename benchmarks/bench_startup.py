@@ -0,0 +1,71 @@
+"""Cold start benchmark: how long a fresh process takes to import and build the app, and
+to answer its first requests. Run from the project root:
+
+    python -m benchmarks.bench_startup --runs 10
+
+Each run is a new Python process (nothing cached in memory, like a new gunicorn worker
+without --preload) against a temporary SQLite database that already has the schema.
+Also reports which of the heavier modules were imported before the first request.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.bench_funnel import DEFAULT_ENV
+
+HEAVY_MODULES = ['src.brcode', 'PIL', 'qrcode', 'psycopg2']
+
+CHILD = r'''
+import json, sys, time
+start = time.perf_counter()
+from src.app import create_app
+app = create_app()
+created = time.perf_counter()
+loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+client = app.test_client()
+client.get('/?access_pin=' + ACCESS_PIN)
+first = time.perf_counter()
+response = client.get('/welcome')
+welcome = time.perf_counter()
+print(json.dumps({
+    'create_app_ms': (created - start) * 1000,
+    'first_request_ms': (first - created) * 1000,
+    'welcome_ms': (welcome - first) * 1000,
+    'status': response.status_code,
+    'loaded_before_first_request': loaded,
+}))
+'''
+
+
+def run_once(env):
+    code = f"HEAVY_MODULES = {HEAVY_MODULES!r}\nACCESS_PIN = {env['ACCESS_PIN']!r}\n" + CHILD
+    output = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help="fresh processes to start")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    for key, value in DEFAULT_ENV.items():
+        env.setdefault(key, value)
+    with tempfile.TemporaryDirectory() as database_dir:
+        env['DATABASE_URL'] = f"sqlite:///{os.path.join(database_dir, 'startup.sqlite')}"
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'src.app', 'init-db'], env=env,
+                       capture_output=True, check=True)
+        results = [run_once(env) for _ in range(args.runs)]
+
+    for key in ('create_app_ms', 'first_request_ms', 'welcome_ms'):
+        samples = [result[key] for result in results]
+        print(f"{key:18} median {statistics.median(samples):8.1f}  min {min(samples):8.1f}  max {max(samples):8.1f}")
+    print(f"loaded before the first request: {', '.join(results[-1]['loaded_before_first_request']) or 'none'}")
+
+
+if __name__ == '__main__':
+    main()
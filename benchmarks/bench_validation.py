@@ -0,0 +1,119 @@
+"""Micro-benchmark: the funnel's validation hot path, before and after the catalog/validators refactor.
+
+Run from the project root:
+    python -m benchmarks.bench_validation [iterations]
+
+'before' reproduces the original views: group membership tested against a list, the
+name pattern compiled inside the view, each name field read from the form twice and
+the <option>s rendered by a Jinja loop.
+'after' uses src.catalog (frozen sets, precomputed <option> HTML) and src.validators.
+Both paths get the same inputs and must agree on every result.
+"""
+import re
+import sys
+import timeit
+
+from jinja2 import Template
+from werkzeug.datastructures import ImmutableMultiDict
+
+CITY_GROUP_OPTIONS = {
+    "São José dos Campos": ["Família do Yuri", "Cia. do Trailer", "Teatro da Cidade", "Família Froes", "Chicos e Chicas", "Javanês"],
+    "Taubaté": ["Família da Laura", "Café 🏳️‍🌈", "Impostoras", "Primos e Agregados", "Dança Comigo", "Mariposa Brasileiro", "Med Lucinda"]
+}
+
+GROUPS = [("Taubaté", "Med Lucinda"), ("São José dos Campos", "Javanês"), ("Taubaté", "Nenhum")]
+NAMES_FORM = ImmutableMultiDict({f'name_{i}': name for i, name in enumerate(
+    ["Ana Maria", "Joao Souza", "Pedro de Tal", "Maria Silva", "Beatriz Lima", "Yuri Galindo"], start=1)})
+PHONES = ["12999998888", "1299999888a", ""]
+
+
+# --- before: as in the original views ---
+
+def group_before(city, group):
+    groups = CITY_GROUP_OPTIONS.get(city, [])
+    return bool(group and group in groups)
+
+
+def names_before(form, num_people):
+    name_pattern = re.compile(r"^[a-zA-Z ]+$")
+    names = []
+    for i in range(1, num_people + 1):
+        name = form.get(f'name_{i}')
+        if not name or not name_pattern.match(name):
+            return None
+        names.append(name)
+    [form.get(f'name_{k}') or "" for k in range(1, num_people + 1)] # Re-read for the template
+    return names
+
+
+def phone_before(phone_number):
+    return bool(phone_number) and phone_number.isdigit() and len(phone_number) <= 20
+
+
+CITY_OPTIONS_TEMPLATE = Template(
+    '{% for city_option in cities %}<option value="{{ city_option }}" '
+    '{% if city_option == selected_city %}selected{% endif %}>{{ city_option }}</option>{% endfor %}',
+    autoescape=True,
+) # Compiled once, like Flask's template cache does
+
+
+def city_options_before(cities, selected):
+    return CITY_OPTIONS_TEMPLATE.render(cities=cities, selected_city=selected)
+
+
+# --- after: src.catalog and src.validators ---
+
+def after_functions():
+    from src.catalog import Catalog
+    from src.validators import validate_names, validate_phone, form_names
+
+    catalog = Catalog(CITY_GROUP_OPTIONS)
+
+    def group_after(city, group):
+        return catalog.is_group(city, group)
+
+    def names_after(form, num_people):
+        names = form_names(form, num_people)
+        return None if validate_names(names) else names
+
+    def phone_after(phone_number):
+        return validate_phone(phone_number) is None
+
+    def city_options_after(cities, selected):
+        return catalog.city_options(selected)
+
+    return group_after, names_after, phone_after, city_options_after
+
+
+def per_call_ns(func, args_list, iterations):
+    def run():
+        for args in args_list:
+            func(*args)
+    return timeit.timeit(run, number=iterations) / (iterations * len(args_list)) * 1e9
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    cities = tuple(CITY_GROUP_OPTIONS)
+    group_after, names_after, phone_after, city_options_after = after_functions()
+
+    cases = [
+        ('group in catalog', group_before, group_after, GROUPS),
+        ('6 names', names_before, names_after, [(NAMES_FORM, 6)]),
+        ('phone', phone_before, phone_after, [(phone,) for phone in PHONES]),
+        ('city <option>s', city_options_before, city_options_after, [(cities, "Taubaté"), (cities, None)]),
+    ]
+    for label, before, after, args_list in cases:
+        for args in args_list:
+            if label != 'city <option>s' and before(*args) != after(*args):
+                sys.exit(f"{label}: results differ for {args!r}")
+
+    print(f"{'':18} {'before (ns)':>12} {'after (ns)':>11} {'speedup':>8}")
+    for label, before, after, args_list in cases:
+        before_ns = per_call_ns(before, args_list, iterations)
+        after_ns = per_call_ns(after, args_list, iterations)
+        print(f"{label:18} {before_ns:12.0f} {after_ns:11.0f} {before_ns / after_ns:7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Confirmation throughput under concurrent writers, for each database engine profile.
+
+Several processes (like gunicorn workers), each with a few threads, save confirmations
+as fast as they can for a fixed time, through the same code path as the confirmation
+page (models.save_rsvps + commit). Run from the project root:
+
+    python -m benchmarks.bench_writers --processes 4 --threads 2 --seconds 5
+    python -m benchmarks.bench_writers --database-url postgresql://... --profiles default,postgres
+
+Without --database-url each profile gets a fresh temporary SQLite database. Failed
+writes (e.g. "database is locked") are counted as errors.
+"""
+import argparse
+import datetime
+import multiprocessing
+import os
+import secrets
+import statistics
+import tempfile
+import threading
+import time
+
+from benchmarks.bench_funnel import DEFAULT_ENV
+
+
+def _writer_process(database_url, profile, processes, threads, seconds, ready, results):
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['DB_ENGINE_PROFILE'] = profile
+    os.environ['WEB_CONCURRENCY'] = str(processes)
+    os.environ['GUNICORN_THREADS'] = str(threads)
+    from src.app import create_app
+    from src.models import db, save_rsvps
+
+    app = create_app()
+    latencies, errors = [], []
+    ready.wait() # Every process has imported the app
+    deadline = time.time() + seconds
+
+    def write():
+        with app.app_context():
+            while time.time() < deadline:
+                start = time.perf_counter()
+                try:
+                    save_rsvps([{
+                        'timestamp': datetime.datetime.utcnow(),
+                        'city': 'Taubaté',
+                        'group': 'Impostoras',
+                        'num_people': 2,
+                        'names': ['Convidado Numero', 'Acompanhante'],
+                        'phone': '12999990000',
+                        'confirmation_token': secrets.token_urlsafe(16),
+                    }])
+                    db.session.commit()
+                    latencies.append(time.perf_counter() - start)
+                except Exception as e:
+                    db.session.rollback()
+                    errors.append(type(e).__name__)
+
+    writers = [threading.Thread(target=write) for _ in range(threads)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    results.put((latencies, errors))
+
+
+def run_profile(database_url, profile, processes, threads, seconds):
+    from src.app import create_app, create_schema
+    from src.config import Config
+
+    # Config was read from the environment when it was first imported
+    app = create_app(type('BenchConfig', (Config,), {
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'DB_ENGINE_PROFILE': profile,
+    }))
+    with app.app_context():
+        create_schema()
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    ready = context.Barrier(processes)
+    workers = [
+        context.Process(target=_writer_process, args=(database_url, profile, processes, threads, seconds, ready, results))
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    latencies, errors = [], []
+    for _ in workers:
+        process_latencies, process_errors = results.get()
+        latencies += process_latencies
+        errors += process_errors
+    for worker in workers:
+        worker.join()
+
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else [0] * 99
+    return {
+        'confirmations_per_s': round(len(latencies) / seconds, 1),
+        'p50_ms': round(cuts[49] * 1000, 2),
+        'p95_ms': round(cuts[94] * 1000, 2),
+        'p99_ms': round(cuts[98] * 1000, 2),
+        'errors': len(errors),
+        'error_types': sorted(set(errors)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=4, help="writer processes (gunicorn workers)")
+    parser.add_argument('--threads', type=int, default=2, help="writer threads per process")
+    parser.add_argument('--seconds', type=float, default=5, help="how long each profile is measured")
+    parser.add_argument('--database-url', help="database to write to (default: temporary SQLite per profile)")
+    parser.add_argument('--profiles', help="comma-separated profiles (default: default and the one for the database)")
+    args = parser.parse_args()
+
+    for key, value in DEFAULT_ENV.items():
+        os.environ.setdefault(key, value)
+    tuned = 'postgres' if (args.database_url or '').startswith('postgresql') else 'sqlite'
+    profiles = args.profiles.split(',') if args.profiles else ['default', tuned]
+
+    print(f"{args.processes} processes x {args.threads} threads, {args.seconds:g} s per profile")
+    print(f"{'profile':10} {'conf/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for profile in profiles:
+        with tempfile.TemporaryDirectory() as database_dir:
+            database_url = args.database_url or f"sqlite:///{os.path.join(database_dir, 'writers.sqlite')}"
+            result = run_profile(database_url, profile, args.processes, args.threads, args.seconds)
+        print(f"{profile:10} {result['confirmations_per_s']:8} {result['p50_ms']:8} {result['p95_ms']:8} "
+              f"{result['p99_ms']:8} {result['errors']:7} {' '.join(result['error_types'])}")
+
+
+if __name__ == '__main__':
+    main()
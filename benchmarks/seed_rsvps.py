@@ -0,0 +1,73 @@
+"""Fills the RSVP (and Guest) tables with synthetic confirmations.
+
+Run from the project root, against the database in DATABASE_URL:
+    python -m benchmarks.seed_rsvps 100000
+
+Rows are inserted in batches with multi-row INSERTs, so a million rows take minutes,
+not hours. Never point this at the production database.
+"""
+import datetime
+import random
+import sys
+import time
+
+FIRST_NAMES = ['Ana', 'Joao', 'Maria', 'Pedro', 'Laura', 'Yuri', 'Julia', 'Lucas', 'Beatriz',
+               'Gabriel', 'Fernanda', 'Rafael', 'Camila', 'Bruno', 'Larissa', 'Thiago']
+LAST_NAMES = ['Silva', 'Souza', 'Oliveira', 'Santos', 'Lima', 'Pereira', 'Costa', 'Almeida']
+BATCH_SIZE = 5000
+
+
+def _random_rsvp(now, city_groups):
+    city, group = random.choice(city_groups)
+    num_people = random.randint(1, 4)
+    names = [f"{random.choice(FIRST_NAMES)} {random.choice(LAST_NAMES)}" for _ in range(num_people)]
+    return {
+        'timestamp': now - datetime.timedelta(seconds=random.randint(0, 30 * 24 * 3600)),
+        'city': city,
+        'group': group,
+        'num_people': num_people,
+        'names_str': ", ".join(names),
+        'phone': str(random.randint(11900000000, 11999999999)),
+    }, names
+
+
+def seed_rsvps(count, batch_size=BATCH_SIZE):
+    """Inserts count synthetic RSVPs. Must run inside an app context."""
+    from src.models import db, RSVP, Guest
+    from src.catalog import current_catalog
+    from src.utils import normalize_name
+
+    catalog = current_catalog()
+    city_groups = [(city, group) for city in catalog.cities for group in catalog.groups[city]]
+    now = datetime.datetime.utcnow()
+    inserted = 0
+    while inserted < count:
+        batch = [_random_rsvp(now, city_groups) for _ in range(min(batch_size, count - inserted))]
+        ids = db.session.scalars(
+            db.insert(RSVP).returning(RSVP.id, sort_by_parameter_order=True),
+            [rsvp for rsvp, _ in batch],
+        ).all()
+        db.session.execute(db.insert(Guest), [
+            {'rsvp_id': rsvp_id, 'name': name, 'name_normalized': normalize_name(name)}
+            for rsvp_id, (_, names) in zip(ids, batch)
+            for name in names
+        ])
+        db.session.commit()
+        inserted += len(batch)
+    return inserted
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    from src.app import create_app, create_schema
+
+    app = create_app()
+    start = time.perf_counter()
+    with app.app_context():
+        create_schema()
+        seed_rsvps(count)
+    print(f"Inserted {count} RSVPs in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""gunicorn settings: gunicorn -c gunicorn.conf.py src.wsgi:app
+
+The app is imported and warmed up once in the master process (preload_app), then forked,
+so workers start with Flask, SQLAlchemy, the compiled templates and the Pix/QR code
+already in memory instead of each paying for it on its first requests.
+Run 'flask --app src.app init-db' before the first start.
+
+Serving modes, selected by GUNICORN_WORKER_CLASS:
+    'sync'    - one request at a time per worker (default). A slow commit, a QR code
+                render or an open live feed on the admin page holds the whole worker.
+    'gthread' - GUNICORN_THREADS threads per worker (default 4).
+    'gevent'  - GUNICORN_WORKER_CONNECTIONS greenlets per worker (default 100), needs
+                the gevent package. Database calls only yield to other greenlets with
+                a cooperative driver: psycogreen for Postgres, patched below if installed.
+For gthread and gevent, set QR_RENDER_PROCESSES so the QR codes are rendered outside the
+worker, and ADMISSION_MAX_IN_FLIGHT to shed load before the worker's queue gets long.
+"""
+import multiprocessing
+import os
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+if worker_class == 'gevent':
+    # Patched before the app is preloaded, so the locks and sockets that the app and
+    # SQLAlchemy create are already cooperative
+    from gevent import monkey
+    monkey.patch_all()
+    try:
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    except ImportError:
+        pass
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:' + os.environ.get('PORT', '8000'))
+default_workers = multiprocessing.cpu_count() * 2 + 1 if worker_class == 'sync' else multiprocessing.cpu_count() + 1
+workers = int(os.environ.get('WEB_CONCURRENCY', default_workers))
+threads = int(os.environ.get('GUNICORN_THREADS', 4 if worker_class == 'gthread' else 1))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 100))
+# The Postgres engine profile sizes each worker's pool from these (see src/engine.py):
+# threads per worker, or worker_connections with gevent
+os.environ['GUNICORN_WORKER_CLASS'] = worker_class
+os.environ['WEB_CONCURRENCY'] = str(workers)
+os.environ['GUNICORN_THREADS'] = str(threads)
+os.environ['GUNICORN_WORKER_CONNECTIONS'] = str(worker_connections)
+preload_app = True
+
+
+def when_ready(server):
+    from src.app import warm_up
+    from src.wsgi import app
+
+    warm_up(app)
+    # Metric totals start over with the server, not with each worker (see src/metrics.py)
+    metrics_store = app.extensions.get('metrics_store')
+    if metrics_store is not None:
+        metrics_store.reset()
+
+
+def post_fork(server, worker):
+    # Connections opened in the master (there shouldn't be any) can't be shared with children
+    from src.models import db
+    from src.wsgi import app
+
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    # Start the QR render processes before the first guest needs one
+    from src.wsgi import app
+
+    qr_pool = app.extensions.get('qr_pool')
+    if qr_pool is not None:
+        qr_pool.warm_up()
+
+
+def worker_exit(server, worker):
+    from src.wsgi import app
+
+    # Write what is left in the RSVP journal before the worker goes away
+    journal = app.extensions.get('rsvp_journal')
+    if journal is not None:
+        journal.stop()
+    metrics_store = app.extensions.get('metrics_store')
+    if metrics_store is not None:
+        metrics_store.flush()
+    qr_pool = app.extensions.get('qr_pool')
+    if qr_pool is not None:
+        qr_pool.shutdown()
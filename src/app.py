@@ -1,54 +1,227 @@
+import csv
 import os # Moved import os to the top
-from dotenv import load_dotenv
-from flask import Flask, redirect, url_for, session, request, current_app, render_template, send_from_directory # Added request, current_app, render_template, send_from_directory
-from .config import Config # Updated import to be relative
-
-load_dotenv() # Ensure .env is loaded
+import click
+import sqlalchemy
+from sqlalchemy.schema import CreateColumn
+from flask import Flask, redirect, url_for, session, request, current_app, send_from_directory, jsonify
+from flask.cli import with_appcontext
+from werkzeug.middleware.proxy_fix import ProxyFix
+from .config import Config # Updated import to be relative. Config loads the .env file
 
 from .routes import rsvp_bp # Changed to relative import
-from .models import db, RSVP # Changed to relative import. db is initialized in models.py
+from .models import db, RSVP, Guest # Changed to relative import. db is initialized in models.py
+from .utils import normalize_name, split_names, pix_cache_info
+from .sessions import create_session_interface, regenerate_session_id
+from .assets import build_assets, init_assets
+from .metrics import init_metrics, render_metrics
+from .writebehind import init_write_behind
+from .engine import init_database
+from .pagecache import cached_page, init_page_cache
+from .catalog import init_catalog
+from .validators import MAX_NAME_LENGTH, MAX_PEOPLE, MAX_PHONE_DIGITS
+from .ratelimit import init_rate_limits
+from .qrpool import init_qr_pool
+from .reconcile import DEFAULT_WINDOW_HOURS, open_statement, parse_statement, reconcile_statement
 # Pix utilities are no longer directly used in app.py, they are used in the blueprint
 
-# Adjusted Flask app initialization for templates at root and instance folder
-app = Flask(__name__, template_folder='../templates', static_folder='../static', instance_relative_config=True)
-app.config.from_object(Config) # New configuration loading
-
-# Set the instance path to be at the project root level
-app.instance_path = os.path.abspath(os.path.join(app.root_path, '..', 'instance'))
-
-# Ensure the instance folder exists before configuring the database URI
-# or doing anything else that might depend on it.
-try:
-    os.makedirs(app.instance_path, exist_ok=True)
-except OSError:
-    # Handle the error appropriately if instance folder creation fails
-    # For now, we'll let it raise if it's a real issue other than "already exists"
-    pass 
-
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
-app.config['PIX_KEY'] = os.getenv('PIX_KEY')
-app.config['ACCESS_PIN'] = os.getenv('ACCESS_PIN') # Added for PIN protection
-app.config['ADMIN_PIN'] = os.getenv('ADMIN_PIN') # Added for admin access to confirmed guests
-app.config['EVENT_ADDRESS'] = os.getenv('EVENT_ADDRESS') # Added for event address
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 7776000 # Cache static files for 3 months
-
-db.init_app(app) # Initialize SQLAlchemy with the app
-
-# Create database tables if they don't exist
-# This requires the RSVP model to be imported before create_all is called.
-with app.app_context():
-    # RSVP model is imported from models.py
+# Endpoints that require the admin PIN instead of the guest PIN
+ADMIN_ENDPOINTS = {
+    'rsvp.confirmed_guests',
+    'rsvp.confirmed_guests_rows',
+    'rsvp.confirmed_guests_export',
+    'rsvp.search_guests',
+    'rsvp.duplicate_confirmations',
+    'rsvp.confirmed_guests_live',
+    'rsvp.reconcile_payments',
+    'rsvp.reconcile_results',
+    'metrics',
+}
+
+# JSON endpoints: they get a JSON error instead of the redirect to the access denied page
+API_ENDPOINTS = {
+    'rsvp.api_rsvp',
+    'rsvp.api_rsvp_confirm',
+}
+
+def create_app(config_object=Config):
+    """Builds the Flask app. Nothing here touches the database, so it's cheap to call in every worker."""
+    # Adjusted Flask app initialization for templates at root and instance folder
+    app = Flask(__name__, template_folder='../templates', static_folder='../static', instance_relative_config=True)
+    app.config.from_object(config_object) # New configuration loading
+
+    # Set the instance path to be at the project root level
+    app.instance_path = os.path.abspath(os.path.join(app.root_path, '..', 'instance'))
+
+    # Ensure the instance folder exists before configuring the database URI
+    # or doing anything else that might depend on it.
+    try:
+        os.makedirs(app.instance_path, exist_ok=True)
+    except OSError:
+        # Handle the error appropriately if instance folder creation fails
+        # For now, we'll let it raise if it's a real issue other than "already exists"
+        pass 
+
+    init_database(app) # Initialize SQLAlchemy with the app, using the engine profile from the config
+
+    # Keep the session data on the server, the cookie only holds the session id
+    session_interface = create_session_interface(app.config)
+    if session_interface is not None:
+        app.session_interface = session_interface
+
+    # Request timing (Server-Timing header and /metrics). Registered before the PIN check so
+    # that it times the whole request.
+    init_metrics(app, admin_endpoints=ADMIN_ENDPOINTS, counters=lambda: process_counters(app))
+    # Behind a proxy or a PaaS router, the client address is in X-Forwarded-For
+    if app.config.get('PROXY_FIX_X_FOR'):
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+    # Token buckets per client, checked before the PIN so that clients without it are limited too.
+    # Verified admins aren't limited, admin PIN guesses are; the page that explains the PIN must always load.
+    init_rate_limits(
+        app,
+        exempt={'access_denied', 'robots_txt'},
+        json_endpoints=API_ENDPOINTS,
+        admin_endpoints=ADMIN_ENDPOINTS,
+        landing_endpoints={'index', 'rsvp.welcome'},
+    )
+    app.before_request(require_pin_access)
+
+    app.register_blueprint(rsvp_bp) # Register the blueprint
+    app.add_url_rule('/access-denied', view_func=access_denied)
+    app.add_url_rule('/metrics', view_func=metrics)
+    app.add_url_rule('/robots.txt', view_func=robots_txt)
+    app.add_url_rule('/', view_func=index)
+
+    # Optional journal for confirmations, flushed to the database in batches
+    init_write_behind(app)
+
+    # Optional process pool for the QR code images (see qrpool.py)
+    init_qr_pool(app)
+
+    # Cities and groups offered in the funnel, reloaded when the file changes
+    init_catalog(app)
+
+    # Form limits for the HTML attributes, so they match the checks in validators.py
+    app.jinja_env.globals.update(
+        max_people=MAX_PEOPLE,
+        max_name_length=MAX_NAME_LENGTH,
+        max_phone_digits=MAX_PHONE_DIGITS,
+    )
+
+    # Pages that look the same for every guest are rendered once (see pagecache.py)
+    init_page_cache(app)
+
+    # Fingerprinted, precompressed static files, if 'build-assets' was run
+    init_assets(app)
+
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(build_assets_command)
+    app.cli.add_command(backfill_guests)
+    app.cli.add_command(flush_journal)
+    app.cli.add_command(reconcile_pix)
+    return app
+
+def create_schema():
+    """Creates missing tables, columns and indexes. Must run inside an app context."""
     db.create_all()
+    # create_all doesn't touch tables that already exist, so add columns and indexes created after the table
+    inspector = sqlalchemy.inspect(db.engine)
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    column_ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+                    connection.execute(sqlalchemy.text(f'ALTER TABLE {table.name} ADD COLUMN {column_ddl}'))
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+def warm_up(app):
+    """Loads what the first requests would otherwise load lazily.
+
+    Meant for a process that forks workers afterwards (gunicorn --preload), so that the
+    work is done once and shared. Doesn't open database connections, which can't be
+    shared across a fork.
+    """
+    from . import brcode
+    brcode.qr_png(brcode.build_pix_payload('00000000-0000-0000-0000-000000000000', 'Warm Up', 'Warm Up', 15, 'WarmUp'))
+    for template_name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(template_name)
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Creates the database tables and indexes that don't exist yet."""
+    create_schema()
+    print("Database schema is up to date.")
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    """Builds hashed, minified and precompressed static files into static/build."""
+    manifest = build_assets(current_app.static_folder)
+    print(f"Built {len(manifest)} static files into {os.path.join(current_app.static_folder, 'build')}")
+
+@click.command('backfill-guests')
+@with_appcontext
+def backfill_guests():
+    """Creates Guest rows for RSVPs saved before the guest table existed."""
+    batch_size = 500
+    total = 0
+    while True:
+        # RSVPs without any guest row yet; each batch is committed on its own
+        rsvps = (
+            db.session.query(RSVP.id, RSVP.names_str)
+            .filter(~db.exists().where(Guest.rsvp_id == RSVP.id))
+            .order_by(RSVP.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rsvps:
+            break
+        guests = [
+            {'rsvp_id': rsvp_id, 'name': name, 'name_normalized': normalize_name(name)}
+            for rsvp_id, names_str in rsvps
+            for name in split_names(names_str) or [names_str]
+        ]
+        db.session.execute(db.insert(Guest), guests)
+        db.session.commit()
+        total += len(rsvps)
+        print(f"Backfilled guests for {total} RSVPs")
+    print("Guest backfill complete.")
+
+@click.command('flush-journal')
+@with_appcontext
+def flush_journal():
+    """Moves the RSVPs queued in the write-behind journal to the database."""
+    journal = current_app.extensions.get('rsvp_journal')
+    if journal is None:
+        print("RSVP_WRITE_MODE is not 'journal', nothing to flush.")
+        return
+    print(f"Flushed {journal.flush()} RSVPs, {journal.pending()} still queued.")
+
+@click.command('reconcile-pix')
+@click.argument('statement', type=click.Path(exists=True, dir_okay=False))
+@click.option('--window-hours', default=DEFAULT_WINDOW_HOURS, show_default=True, help="How far a payment can be from its confirmation.")
+@with_appcontext
+def reconcile_pix(statement, window_hours):
+    """Matches the Pix payments in a bank statement (CSV or OFX) to the RSVPs."""
+    with open(statement, 'rb') as statement_file:
+        try:
+            run_id, counts = reconcile_statement(
+                parse_statement(open_statement(statement_file), statement), window_hours
+            )
+        except (ValueError, UnicodeError, csv.Error) as e:
+            raise click.ClickException(f"Could not read the statement: {e}")
+    print(f"Reconciliation {run_id}: {counts['matched']} matched, {counts['ambiguous']} ambiguous, {counts['unmatched']} unmatched.")
 
-@app.before_request
 def require_pin_access():
     # Allow access to the 'access_denied' route and static files without PIN
     if request.endpoint and (request.endpoint == 'access_denied' or request.endpoint.startswith('static') or request.endpoint == 'robots_txt'):
         return
 
-    # Check if this is the admin route
-    is_admin_route = request.endpoint == 'rsvp.confirmed_guests'
+    # Check if this is an admin route
+    is_admin_route = request.endpoint in ADMIN_ENDPOINTS
     
     access_pin = current_app.config.get('ACCESS_PIN')
     admin_pin = current_app.config.get('ADMIN_PIN')
@@ -64,10 +237,15 @@ def require_pin_access():
         if session.get('admin_verified'):
             return
 
+        # Scrapers like Prometheus can't keep a session, so they send the PIN as a bearer token
+        if request.headers.get('Authorization') == f"Bearer {admin_pin}":
+            return
+
         provided_pin = request.args.get('admin_pin')
 
         if provided_pin and provided_pin == admin_pin:
             session['admin_verified'] = True
+            regenerate_session_id()
             # Redirect to remove the admin_pin from the URL query parameters
             clean_path = request.path
             return redirect(clean_path)
@@ -88,8 +266,17 @@ def require_pin_access():
 
         provided_pin = request.args.get('access_pin')
 
+        if request.endpoint in API_ENDPOINTS:
+            # A redirect would turn the POST into a GET, so the PIN is accepted in place
+            if provided_pin and provided_pin == access_pin:
+                session['pin_verified'] = True
+                regenerate_session_id()
+                return
+            return jsonify(error="invalid_pin" if provided_pin else "no_pin"), 401
+
         if provided_pin and provided_pin == access_pin:
             session['pin_verified'] = True
+            regenerate_session_id()
             # Redirect to remove the access_pin from the URL query parameters
             clean_path = request.path
             return redirect(clean_path)
@@ -98,10 +285,7 @@ def require_pin_access():
             if request.endpoint != 'access_denied':
                 return redirect(url_for('access_denied', error=error_reason))
 
-app.register_blueprint(rsvp_bp) # Register the blueprint
-
 # Route for access denied page
-@app.route('/access-denied')
 def access_denied():
     error_type = request.args.get('error')
     title = "Opa, cadê a senha?"
@@ -124,19 +308,55 @@ def access_denied():
         message = "O link administrativo utilizado está errado."
         instructions = "Por favor, verifique o link correto ou entre em contato com a Laura."
     
-    return render_template('access_denied.html', title=title, message=message, instructions=instructions), 200
+    return cached_page('access_denied.html', title=title, message=message, instructions=instructions)
+
+def process_counters(app):
+    """Counters of the caches and pools in this process, for /metrics (see metrics.py)."""
+    cache = pix_cache_info()
+    counters = {
+        'pix_cache_hits_total': cache['hits'],
+        'pix_cache_misses_total': cache['misses'],
+    }
+    page_cache = app.extensions.get('page_cache')
+    if page_cache is not None:
+        page_cache_info = page_cache.info()
+        counters['page_cache_hits_total'] = page_cache_info['hits']
+        counters['page_cache_misses_total'] = page_cache_info['misses']
+    qr_pool = app.extensions.get('qr_pool')
+    if qr_pool is not None:
+        counters['qr_pool_rejected_total'] = qr_pool.rejected
+    admission = app.extensions.get('admission')
+    if admission is not None:
+        counters['admission_rejected_total'] = admission.rejected
+    return counters
+
+def metrics():
+    # Gauges are for the worker that answers; the journal is shared by all of them
+    gauges = {'pix_cache_entries': pix_cache_info()['size']}
+    page_cache = current_app.extensions.get('page_cache')
+    if page_cache is not None:
+        gauges['page_cache_entries'] = page_cache.info()['size']
+    journal = current_app.extensions.get('rsvp_journal')
+    if journal is not None:
+        gauges['rsvp_journal_pending'] = journal.pending()
+    admission = current_app.extensions.get('admission')
+    if admission is not None:
+        gauges['admission_in_flight'] = admission.in_flight
+    text = render_metrics(gauges)
+    return text, 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
 
-@app.route('/robots.txt')
 def robots_txt():
-    return send_from_directory(os.path.join(app.root_path, '..'), 'robots.txt')
+    return send_from_directory(os.path.join(current_app.root_path, '..'), 'robots.txt')
 
 # Main index route, redirects to the blueprint's starting point
-@app.route('/')
 def index():
     return redirect(url_for('rsvp.welcome'))
 
 # Pix Helper Functions and RSVP Model have been moved to utils.py and models.py respectively.
 
 if __name__ == '__main__':
-    # The instance folder creation is now done earlier
+    # Development server; in production run 'flask --app src.app init-db' once and gunicorn (see gunicorn.conf.py)
+    app = create_app()
+    with app.app_context():
+        create_schema()
     app.run(debug=True, port=5001) 
\ No newline at end of file
@@ -0,0 +1,217 @@
+"""Static asset build and serving.
+
+'flask --app src.app build-assets' copies everything in static/ to static/build/ with a
+content hash in the file name, minifies CSS and SVG, writes WebP/AVIF versions of the
+images (when smaller) and .gz/.br versions of text files, and records it all in
+static/build/manifest.json.
+
+When the manifest exists, url_for('static', ...) points to the hashed files, which are
+served with a one year immutable cache, picking the best image format and precompressed
+encoding the browser accepts. Without a build, static files are served as before.
+"""
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import re
+import shutil
+
+from flask import request, send_file
+
+BUILD_DIR = 'build'
+MANIFEST_NAME = 'manifest.json'
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Worth precompressing (text, plus .ico which is usually uncompressed bitmaps)
+COMPRESSIBLE_EXTENSIONS = {'.css', '.svg', '.js', '.webmanifest', '.ico', '.txt'}
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg'}
+# Image formats to try, best first, with the mimetype browsers put in the Accept header
+IMAGE_VARIANTS = (('avif', 'image/avif'), ('webp', 'image/webp'))
+# Precompressed encodings, best first: (Accept-Encoding token, file suffix)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+mimetypes.add_type('application/manifest+json', '.webmanifest')
+
+_NUMBER = re.compile(r'-?\d+\.\d+')
+_CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+# --- Build ---
+
+def _fingerprint(relative_path, content):
+    root, extension = os.path.splitext(relative_path)
+    return f"{root}.{hashlib.sha256(content).hexdigest()[:10]}{extension}"
+
+
+def minify_css(text):
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{}:;,>])\s*', r'\1', text)
+    return text.replace(';}', '}').strip()
+
+
+def _short_number(match):
+    # Three decimals is far below a pixel at the sizes these drawings are shown
+    number = f"{float(match.group(0)):.3f}".rstrip('0').rstrip('.')
+    return '0' if number == '-0' else number
+
+
+def minify_svg(text):
+    text = re.sub(r'<!--.*?-->', '', text, flags=re.S)
+    text = _NUMBER.sub(_short_number, text)
+    if '<text' not in text:
+        # Whitespace only matters inside text elements
+        text = re.sub(r'\s+', ' ', text)
+        text = re.sub(r'>\s+<', '><', text)
+    return text.strip()
+
+
+def _image_variant(content, image_format):
+    try:
+        from PIL import Image  # Only needed to build, never at runtime
+    except ImportError:
+        return None
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+            output = io.BytesIO()
+            image.save(output, format=image_format.upper(), quality=80 if image_format == 'webp' else 60)
+            return output.getvalue()
+    except (OSError, KeyError, ValueError):
+        # Pillow built without support for this format
+        return None
+
+
+def compress(content, encoding):
+    """Returns content compressed with encoding (gzip or br), or None if br is unavailable."""
+    if encoding == 'gzip':
+        return gzip.compress(content, 9, mtime=0)
+    try:
+        import brotli  # Optional, .br files are skipped without it
+    except ImportError:
+        return None
+    return brotli.compress(content, quality=11)
+
+
+def build_assets(static_folder):
+    """Builds static/build/ and its manifest. Returns the manifest."""
+    build_folder = os.path.join(static_folder, BUILD_DIR)
+    shutil.rmtree(build_folder, ignore_errors=True)
+
+    sources = []
+    for directory, subdirectories, files in os.walk(static_folder):
+        subdirectories[:] = [d for d in subdirectories if os.path.join(directory, d) != build_folder]
+        for name in files:
+            path = os.path.join(directory, name)
+            sources.append(os.path.relpath(path, static_folder).replace(os.sep, '/'))
+    # CSS last, so url() references can be rewritten to the hashed files
+    sources.sort(key=lambda relative_path: (relative_path.endswith('.css'), relative_path))
+
+    manifest = {}
+    for relative_path in sources:
+        with open(os.path.join(static_folder, relative_path), 'rb') as f:
+            content = f.read()
+        extension = os.path.splitext(relative_path)[1].lower()
+
+        if extension == '.css':
+            text = minify_css(content.decode('utf-8'))
+            css_dir = os.path.dirname(relative_path)
+
+            def hashed_url(match):
+                target = os.path.normpath(os.path.join(css_dir, match.group(2))).replace(os.sep, '/')
+                entry = manifest.get(target)
+                if entry is None:
+                    return match.group(0)
+                return f'url("{os.path.relpath(entry["path"], css_dir or ".")}")'
+
+            content = _CSS_URL.sub(hashed_url, text).encode('utf-8')
+        elif extension == '.svg':
+            content = minify_svg(content.decode('utf-8')).encode('utf-8')
+
+        hashed_path = _fingerprint(relative_path, content)
+        entry = {'path': hashed_path, 'variants': {}, 'encodings': []}
+        output_path = os.path.join(build_folder, hashed_path)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path, 'wb') as f:
+            f.write(content)
+
+        if extension in IMAGE_EXTENSIONS:
+            for image_format, _ in IMAGE_VARIANTS:
+                variant = _image_variant(content, image_format)
+                if variant is not None and len(variant) < len(content):
+                    with open(f"{output_path}.{image_format}", 'wb') as f:
+                        f.write(variant)
+                    entry['variants'][image_format] = f"{hashed_path}.{image_format}"
+        elif extension in COMPRESSIBLE_EXTENSIONS:
+            for encoding, suffix in ENCODINGS:
+                compressed = compress(content, encoding)
+                if compressed is not None and len(compressed) < len(content):
+                    with open(output_path + suffix, 'wb') as f:
+                        f.write(compressed)
+                    entry['encodings'].append(encoding)
+
+        manifest[relative_path] = entry
+
+    with open(os.path.join(build_folder, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return manifest
+
+
+# --- Serving ---
+
+def init_assets(app):
+    """Serves the built assets if static/build/manifest.json exists."""
+    manifest_path = os.path.join(app.static_folder, BUILD_DIR, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    # Hashed path (as requested under /static/) -> manifest entry
+    built = {f"{BUILD_DIR}/{entry['path']}": entry for entry in manifest.values()}
+    build_folder = os.path.join(app.static_folder, BUILD_DIR)
+    default_static_view = app.view_functions['static']
+
+    @app.url_defaults
+    def hashed_static_url(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = f"{BUILD_DIR}/{manifest[values['filename']]['path']}"
+
+    def serve_static(filename):
+        entry = built.get(filename)
+        if entry is None:
+            return default_static_view(filename=filename)
+
+        path = os.path.join(build_folder, entry['path'])
+        mimetype = mimetypes.guess_type(entry['path'])[0] or 'application/octet-stream'
+        content_encoding = None
+        vary = None
+        if entry['variants']:
+            vary = 'Accept'
+            for image_format, image_mimetype in IMAGE_VARIANTS:
+                # Exact match only: every browser sends */*, which doesn't mean it can decode AVIF
+                accepted = any(value == image_mimetype and quality > 0 for value, quality in request.accept_mimetypes)
+                if image_format in entry['variants'] and accepted:
+                    path = os.path.join(build_folder, entry['variants'][image_format])
+                    mimetype = image_mimetype
+                    break
+        elif entry['encodings']:
+            vary = 'Accept-Encoding'
+            for encoding, suffix in ENCODINGS:
+                if encoding in entry['encodings'] and encoding in request.accept_encodings:
+                    path += suffix
+                    content_encoding = encoding
+                    break
+
+        response = send_file(path, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE, conditional=True)
+        if content_encoding:
+            response.headers['Content-Encoding'] = content_encoding
+        if vary:
+            response.vary.add(vary)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    app.view_functions['static'] = serve_static
@@ -0,0 +1,554 @@
+"""Pix BR Code (EMV QR) payload builder and QR code renderer.
+
+Replaces the pybrcode + qrcode + Pillow stack used by the payment page. The payload is
+byte-identical to pybrcode's generate_simple_pix() for the same key, name, city, value
+and txid, and the QR code is rendered straight to SVG or a 1-bit PNG without Pillow.
+
+The QR encoder only implements what Pix needs: error correction level L and numeric,
+alphanumeric and byte segments. Segments are split and masks chosen like the qrcode
+library does (as pybrcode called it), so the modules match what qrcode draws for the
+same text and the code has the same version (size).
+"""
+import re
+import struct
+import unicodedata
+import zlib
+
+# --- EMV / BR Code payload ---
+
+# CRC16-CCITT (poly 0x1021, init 0xFFFF, no reflection, no final xor), as required by the
+# BR Code spec for field 63.
+_CRC16_TABLE = []
+for _byte in range(256):
+    _crc = _byte << 8
+    for _ in range(8):
+        _crc = ((_crc << 1) ^ 0x1021) if _crc & 0x8000 else (_crc << 1)
+    _CRC16_TABLE.append(_crc & 0xFFFF)
+
+
+def crc16_ccitt(data, crc=0xFFFF):
+    table = _CRC16_TABLE
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ table[(crc >> 8) ^ byte]
+    return crc
+
+
+def _tlv(field_id, value):
+    # Length is the number of characters, like pybrcode does
+    if len(value) > 99:
+        raise ValueError(f"Valor muito longo para o campo {field_id:02d}.")
+    return f"{field_id:02d}{len(value):02d}{value}"
+
+
+def _ascii_fold(text):
+    # Drops accents ("São José" -> "Sao Jose") and control characters. pybrcode uses
+    # unidecode for this, which gives the same result for Portuguese text.
+    folded = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    return folded.translate({ord(c): None for c in '\n\t\r'})
+
+
+def normalize_pix_key(key):
+    """Validates a Pix key and returns it in the format used inside the payload."""
+    if '@' in key:
+        key_type = 'email'
+    elif len(key) < 16 and '(' in key:
+        key_type = 'phone'
+    elif '.' in key and '/' in key:
+        key_type = 'cnpj'
+    elif '.' in key and '-' in key:
+        key_type = 'cpf'
+    else:
+        key_type = 'random'
+    key = key.strip().replace(' ', '')
+
+    if key_type == 'email':
+        if not re.match(r'^\w+([\.-]?\w+)*@\w+([\.-]?\w+)*(\.\w{2,3})+', key):
+            raise ValueError("Chave Pix (e-mail) inválida.")
+    elif key_type == 'phone':
+        if not re.match(r'\(\d{2}\)\d{4,5}\-\d{4}', key):
+            raise ValueError("Chave Pix (telefone) inválida.")
+        key = re.sub(r'[\(\-\)]', '', key)
+        if '+55' not in key:
+            key = f'+55{key}'
+    elif key_type in ('cpf', 'cnpj'):
+        key = re.sub(r'[\.\/\-]', '', key)
+        if not key.isdigit() or len(key) != (11 if key_type == 'cpf' else 14):
+            raise ValueError(f"Chave Pix ({key_type.upper()}) inválida.")
+    elif len(key) != 36:
+        raise ValueError("Chave Pix (aleatória) inválida.")
+    return key
+
+
+def build_pix_payload(key, name, city, value, txid, description=None):
+    """Builds the Pix "Copia e Cola" string (static BR Code, single use)."""
+    key = normalize_pix_key(key)
+    name = _ascii_fold(name)
+    city = _ascii_fold(city)
+    if not 0 < len(name) < 26:
+        raise ValueError("O nome do recebedor deve ter entre 1 e 25 caracteres.")
+    if not 0 < len(city) < 16:
+        raise ValueError("A cidade do recebedor deve ter entre 1 e 15 caracteres.")
+    if not 0 < len(_ascii_fold(txid)) < 26:
+        raise ValueError("O identificador da transação deve ter entre 1 e 25 caracteres.")
+
+    account_info = _tlv(0, 'BR.GOV.BCB.PIX') + _tlv(1, key)
+    # The description only goes in if it fits in the 99 characters of field 26
+    if description and 0 < len(description) <= 73 - len(key):
+        account_info += _tlv(2, description)
+
+    payload = (
+        _tlv(0, '01')
+        + _tlv(1, '12')
+        + _tlv(26, account_info)
+        + _tlv(52, '0000')
+        + _tlv(53, '986')
+        + _tlv(54, f"{value:.2f}")
+        + _tlv(58, 'BR')
+        + _tlv(59, name)
+        + _tlv(60, city)
+        + _tlv(62, _tlv(5, txid))
+        + '6304'
+    )
+    return payload + f"{crc16_ccitt(payload.encode('utf-8')):04X}"
+
+
+# --- QR code (error correction level L) ---
+
+# Per version (index 0 unused): error correction codewords per block and number of blocks
+_ECC_CODEWORDS_PER_BLOCK = (
+    None, 7, 10, 15, 20, 26, 18, 20, 24, 30, 18, 20, 24, 26, 30, 22, 24, 28, 30, 28, 28,
+    28, 28, 30, 30, 26, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30,
+)
+_NUM_ECC_BLOCKS = (
+    None, 1, 1, 1, 1, 1, 2, 2, 2, 2, 4, 4, 4, 4, 4, 6, 6, 6, 6, 7, 8,
+    8, 9, 9, 10, 12, 12, 12, 13, 14, 15, 16, 17, 18, 19, 19, 20, 21, 22, 24, 25,
+)
+_FORMAT_ECL_BITS = 1  # Level L
+
+_GF_EXP = [0] * 512
+_GF_LOG = [0] * 256
+_value = 1
+for _i in range(255):
+    _GF_EXP[_i] = _value
+    _GF_LOG[_value] = _i
+    _value <<= 1
+    if _value & 0x100:
+        _value ^= 0x11D
+for _i in range(255, 512):
+    _GF_EXP[_i] = _GF_EXP[_i - 255]
+
+_rs_generators = {}
+
+
+def _rs_generator(degree):
+    generator = _rs_generators.get(degree)
+    if generator is None:
+        generator = [1]
+        for i in range(degree):
+            next_generator = generator + [0]
+            for j, coef in enumerate(generator):
+                if coef:
+                    next_generator[j + 1] ^= _GF_EXP[_GF_LOG[coef] + i]
+            generator = next_generator
+        generator = generator[1:]
+        _rs_generators[degree] = generator
+    return generator
+
+
+def _rs_remainder(data, degree):
+    generator = _rs_generator(degree)
+    result = [0] * degree
+    for byte in data:
+        factor = byte ^ result[0]
+        result = result[1:] + [0]
+        if factor:
+            log_factor = _GF_LOG[factor]
+            for i, coef in enumerate(generator):
+                result[i] ^= _GF_EXP[_GF_LOG[coef] + log_factor]
+    return result
+
+
+def _num_raw_data_modules(version):
+    result = (16 * version + 128) * version + 64
+    if version >= 2:
+        num_align = version // 7 + 2
+        result -= (25 * num_align - 10) * num_align - 55
+        if version >= 7:
+            result -= 36
+    return result
+
+
+def _num_data_codewords(version):
+    return (_num_raw_data_modules(version) // 8
+            - _ECC_CODEWORDS_PER_BLOCK[version] * _NUM_ECC_BLOCKS[version])
+
+
+def _alignment_positions(version):
+    if version == 1:
+        return []
+    num_align = version // 7 + 2
+    step = 26 if version == 32 else (version * 4 + num_align * 2 + 1) // (num_align * 2 - 2) * 2
+    size = version * 4 + 17
+    positions = [size - 7 - i * step for i in range(num_align - 1)]
+    return [6] + positions[::-1]
+
+
+def _bch_bits(data, generator, degree):
+    # data followed by its BCH error correction bits (format and version information)
+    remainder = data
+    for _ in range(degree):
+        remainder = (remainder << 1) ^ ((remainder >> (degree - 1)) * generator)
+    return (data << degree) | remainder
+
+
+_MODE_NUMERIC, _MODE_ALPHANUMERIC, _MODE_BYTE = 1, 2, 4
+_ALPHANUMERIC = b'0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:'
+# Bits of the character count, for versions 1-9, 10-26 and 27-40
+_COUNT_BITS = {
+    _MODE_NUMERIC: (10, 12, 14),
+    _MODE_ALPHANUMERIC: (9, 11, 13),
+    _MODE_BYTE: (8, 16, 16),
+}
+
+
+def _split(data, pattern):
+    # (matched, chunk) pairs covering data, like qrcode's util._optimal_split
+    while data:
+        match = pattern.search(data)
+        if not match:
+            break
+        if match.start():
+            yield False, data[:match.start()]
+        yield True, data[match.start():match.end()]
+        data = data[match.end():]
+    if data:
+        yield False, data
+
+
+def _segments(data, minimum=20):
+    """Splits data into (mode, bytes) segments like qrcode's optimal_data_chunks.
+
+    Runs of at least minimum digits go in numeric mode, then runs of at least minimum
+    alphanumeric characters (uppercase EMV fields) in alphanumeric mode, the rest in
+    byte mode. minimum=20 is the qrcode default that pybrcode used.
+    """
+    alphanumeric = b'[' + re.escape(_ALPHANUMERIC) + b']'
+    if len(data) <= minimum:
+        numeric_pattern = re.compile(rb'^\d+$')
+        alphanumeric_pattern = re.compile(b'^' + alphanumeric + b'+$')
+    else:
+        repeat = b'{%d,}' % minimum
+        numeric_pattern = re.compile(rb'\d' + repeat)
+        alphanumeric_pattern = re.compile(alphanumeric + repeat)
+    segments = []
+    for is_numeric, chunk in _split(data, numeric_pattern):
+        if is_numeric:
+            segments.append((_MODE_NUMERIC, chunk))
+            continue
+        for is_alphanumeric, sub_chunk in _split(chunk, alphanumeric_pattern):
+            segments.append((_MODE_ALPHANUMERIC if is_alphanumeric else _MODE_BYTE, sub_chunk))
+    return segments
+
+
+def _append_bits(bits, value, length):
+    bits += [(value >> i) & 1 for i in range(length - 1, -1, -1)]
+
+
+def _segment_bits(segments, version):
+    size_class = 0 if version < 10 else (1 if version < 27 else 2)
+    bits = []
+    for mode, chunk in segments:
+        _append_bits(bits, mode, 4)
+        _append_bits(bits, len(chunk), _COUNT_BITS[mode][size_class])
+        if mode == _MODE_NUMERIC:
+            for i in range(0, len(chunk), 3):
+                digits = chunk[i:i + 3]
+                _append_bits(bits, int(digits), len(digits) * 3 + 1)
+        elif mode == _MODE_ALPHANUMERIC:
+            for i in range(0, len(chunk), 2):
+                pair = chunk[i:i + 2]
+                if len(pair) == 2:
+                    _append_bits(bits, _ALPHANUMERIC.index(pair[0]) * 45 + _ALPHANUMERIC.index(pair[1]), 11)
+                else:
+                    _append_bits(bits, _ALPHANUMERIC.index(pair[0]), 6)
+        else:
+            for byte in chunk:
+                _append_bits(bits, byte, 8)
+    return bits
+
+
+def _encode_codewords(bits, version):
+    bits = list(bits)
+    capacity_bits = _num_data_codewords(version) * 8
+    bits += [0] * min(4, capacity_bits - len(bits))
+    bits += [0] * (-len(bits) % 8)
+    codewords = [int(''.join(map(str, bits[i:i + 8])), 2) for i in range(0, len(bits), 8)]
+    pad = 0xEC
+    while len(codewords) < capacity_bits // 8:
+        codewords.append(pad)
+        pad ^= 0xEC ^ 0x11
+
+    # Split into blocks, add error correction and interleave
+    num_blocks = _NUM_ECC_BLOCKS[version]
+    ecc_len = _ECC_CODEWORDS_PER_BLOCK[version]
+    raw_codewords = _num_raw_data_modules(version) // 8
+    num_short_blocks = num_blocks - raw_codewords % num_blocks
+    short_block_len = raw_codewords // num_blocks - ecc_len
+
+    data_blocks, ecc_blocks = [], []
+    start = 0
+    for i in range(num_blocks):
+        length = short_block_len + (0 if i < num_short_blocks else 1)
+        block = codewords[start:start + length]
+        start += length
+        data_blocks.append(block)
+        ecc_blocks.append(_rs_remainder(block, ecc_len))
+
+    result = []
+    for i in range(short_block_len + 1):
+        for block in data_blocks:
+            if i < len(block):
+                result.append(block[i])
+    for i in range(ecc_len):
+        for block in ecc_blocks:
+            result.append(block[i])
+    return result
+
+
+class _Matrix(object):
+    def __init__(self, version):
+        self.version = version
+        self.size = version * 4 + 17
+        self.modules = [[False] * self.size for _ in range(self.size)]
+        self.is_function = [[False] * self.size for _ in range(self.size)]
+        self._draw_function_patterns()
+
+    def _set_function(self, x, y, dark):
+        self.modules[y][x] = dark
+        self.is_function[y][x] = True
+
+    def _draw_finder(self, cx, cy):
+        for dy in range(-4, 5):
+            for dx in range(-4, 5):
+                x, y = cx + dx, cy + dy
+                if 0 <= x < self.size and 0 <= y < self.size:
+                    distance = max(abs(dx), abs(dy))
+                    self._set_function(x, y, distance not in (2, 4))
+
+    def _draw_function_patterns(self):
+        size = self.size
+        for i in range(size):
+            self._set_function(6, i, i % 2 == 0)
+            self._set_function(i, 6, i % 2 == 0)
+        self._draw_finder(3, 3)
+        self._draw_finder(size - 4, 3)
+        self._draw_finder(3, size - 4)
+
+        positions = _alignment_positions(self.version)
+        last = len(positions) - 1
+        for i, px in enumerate(positions):
+            for j, py in enumerate(positions):
+                if (i == 0 and j == 0) or (i == 0 and j == last) or (i == last and j == 0):
+                    continue
+                for dy in range(-2, 3):
+                    for dx in range(-2, 3):
+                        self._set_function(px + dx, py + dy, max(abs(dx), abs(dy)) != 1)
+
+        # Reserve the format and version areas; they are filled in after masking
+        self.draw_information(None)
+
+    def draw_information(self, mask):
+        """Draws the format (and version) bits for mask, or leaves them light if mask is None."""
+        size = self.size
+        if mask is None:
+            bits = 0
+        else:
+            bits = _bch_bits(_FORMAT_ECL_BITS << 3 | mask, 0x537, 10) ^ 0x5412
+        for i in range(6):
+            self._set_function(8, i, (bits >> i) & 1 == 1)
+        self._set_function(8, 7, (bits >> 6) & 1 == 1)
+        self._set_function(8, 8, (bits >> 7) & 1 == 1)
+        self._set_function(7, 8, (bits >> 8) & 1 == 1)
+        for i in range(9, 15):
+            self._set_function(14 - i, 8, (bits >> i) & 1 == 1)
+        for i in range(8):
+            self._set_function(size - 1 - i, 8, (bits >> i) & 1 == 1)
+        for i in range(8, 15):
+            self._set_function(8, size - 15 + i, (bits >> i) & 1 == 1)
+        self._set_function(8, size - 8, mask is not None)  # The "dark module"
+
+        if self.version >= 7:
+            bits = 0 if mask is None else _bch_bits(self.version, 0x1F25, 12)
+            for i in range(18):
+                dark = (bits >> i) & 1 == 1
+                a, b = size - 11 + i % 3, i // 3
+                self._set_function(a, b, dark)
+                self._set_function(b, a, dark)
+
+    def draw_codewords(self, codewords):
+        size = self.size
+        total_bits = len(codewords) * 8
+        i = 0
+        right = size - 1
+        while right >= 1:
+            if right == 6:
+                right = 5
+            for vertical in range(size):
+                for j in range(2):
+                    x = right - j
+                    upward = ((right + 1) & 2) == 0
+                    y = size - 1 - vertical if upward else vertical
+                    if not self.is_function[y][x] and i < total_bits:
+                        self.modules[y][x] = (codewords[i >> 3] >> (7 - (i & 7))) & 1 == 1
+                        i += 1
+            right -= 2
+
+
+_MASK_CONDITIONS = (
+    lambda x, y: (x + y) % 2 == 0,
+    lambda x, y: y % 2 == 0,
+    lambda x, y: x % 3 == 0,
+    lambda x, y: (x + y) % 3 == 0,
+    lambda x, y: (x // 3 + y // 2) % 2 == 0,
+    lambda x, y: x * y % 2 + x * y % 3 == 0,
+    lambda x, y: (x * y % 2 + x * y % 3) % 2 == 0,
+    lambda x, y: ((x + y) % 2 + x * y % 3) % 2 == 0,
+)
+
+# Rows are handled as ints while choosing the mask (bit size-1-x is column x), so masking
+# is one XOR per row and most of the scoring runs in C.
+_mask_rows_cache = {}  # (version, mask) -> list of row ints
+_SAME_COLOR_RUN = re.compile(r'0{5,}|1{5,}')
+_FINDER_LIKE = re.compile(r'(?=10111010000|00001011101)')
+
+
+def _mask_rows(matrix, mask):
+    key = (matrix.version, mask)
+    rows = _mask_rows_cache.get(key)
+    if rows is None:
+        condition = _MASK_CONDITIONS[mask]
+        size = matrix.size
+        rows = []
+        for y in range(size):
+            function_row = matrix.is_function[y]
+            bits = 0
+            for x in range(size):
+                if not function_row[x] and condition(x, y):
+                    bits |= 1 << (size - 1 - x)
+            rows.append(bits)
+        _mask_rows_cache[key] = rows
+    return rows
+
+
+def _penalty_score(rows, size):
+    score = 0
+    lines = [format(row, f'0{size}b') for row in rows]
+    # Rows and columns in one string; the separator stops runs and patterns at the edges
+    text = ' '.join(lines + [''.join(column) for column in zip(*lines)])
+    # Adjacent modules of the same color (N1) and finder-like patterns (N3)
+    score += sum(len(run) - 2 for run in _SAME_COLOR_RUN.findall(text))
+    score += 40 * len(_FINDER_LIKE.findall(text))
+
+    # 2x2 blocks of the same color (N2)
+    pair_mask = (1 << (size - 1)) - 1
+    for row, next_row in zip(rows, rows[1:]):
+        same_vertical = ~(row ^ next_row)
+        same_block = same_vertical & (same_vertical >> 1) & ~(row ^ (row >> 1)) & pair_mask
+        score += 3 * bin(same_block).count('1')
+
+    # Balance of dark modules (N4), 10 points per full 5% away from 50%. Scored like
+    # the qrcode library so both pick the same mask for the same matrix.
+    dark = sum(bin(row).count('1') for row in rows)
+    total = size * size
+    score += abs(dark * 100 - total * 50) // (total * 5) * 10
+    return score
+
+
+def qr_matrix(text, mask=None):
+    """Returns the QR code for text as a list of rows of booleans (True = dark), no border."""
+    segments = _segments(text.encode('utf-8'))
+    bits_by_size_class = {}
+    for version in range(1, 41):
+        size_class = 0 if version < 10 else (1 if version < 27 else 2)
+        if size_class not in bits_by_size_class:
+            bits_by_size_class[size_class] = _segment_bits(segments, version)
+        bits = bits_by_size_class[size_class]
+        if len(bits) <= _num_data_codewords(version) * 8:
+            break
+    else:
+        raise ValueError("Texto longo demais para um QR Code.")
+
+    matrix = _Matrix(version)
+    matrix.draw_codewords(_encode_codewords(bits, version))
+    size = matrix.size
+    rows = [int(''.join('1' if dark else '0' for dark in row), 2) for row in matrix.modules]
+
+    if mask is None:
+        # Masks are scored with the format/version areas left light, like the qrcode
+        # library does, so both pick the same mask.
+        best_score = None
+        for candidate in range(8):
+            masked = [row ^ bits for row, bits in zip(rows, _mask_rows(matrix, candidate))]
+            score = _penalty_score(masked, size)
+            if best_score is None or score < best_score:
+                mask, best_score = candidate, score
+
+    masked = [row ^ bits for row, bits in zip(rows, _mask_rows(matrix, mask))]
+    matrix.modules = [[c == '1' for c in format(row, f'0{size}b')] for row in masked]
+    matrix.draw_information(mask)
+    return matrix.modules
+
+
+def qr_svg(text, border=4):
+    """Renders the QR code as a compact SVG: one path, one horizontal run per segment."""
+    modules = qr_matrix(text)
+    size = len(modules) + border * 2
+    path = []
+    for y, row in enumerate(modules):
+        x = 0
+        while x < len(row):
+            if row[x]:
+                start = x
+                while x < len(row) and row[x]:
+                    x += 1
+                path.append(f"M{start + border},{y + border}h{x - start}v1h-{x - start}z")
+            else:
+                x += 1
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" '
+        f'shape-rendering="crispEdges"><rect width="100%" height="100%" fill="#fff"/>'
+        f'<path d="{"".join(path)}"/></svg>'
+    )
+
+
+def _png_chunk(chunk_type, data):
+    chunk = chunk_type + data
+    return struct.pack('>I', len(data)) + chunk + struct.pack('>I', zlib.crc32(chunk) & 0xFFFFFFFF)
+
+
+def qr_png(text, box_size=10, border=4):
+    """Renders the QR code as a 1-bit grayscale PNG (same geometry as pybrcode's image)."""
+    modules = qr_matrix(text)
+    width = (len(modules) + border * 2) * box_size
+    row_bytes = (width + 7) // 8
+
+    blank_row = b'\x00' + b'\xff' * row_bytes
+    raw = bytearray(blank_row * (border * box_size))
+    quiet_zone = '1' * (border * box_size)
+    padding = '1' * (row_bytes * 8 - width)
+    for row in modules:
+        # 1 = white, 0 = black in 1-bit grayscale
+        bits = quiet_zone + ''.join('0' * box_size if dark else '1' * box_size for dark in row)
+        line = b'\x00' + int(bits + quiet_zone + padding, 2).to_bytes(row_bytes, 'big')
+        raw += line * box_size
+    raw += blank_row * (border * box_size)
+
+    # A row is under 100 bytes and repeats box_size times, so a 2 KiB window compresses as
+    # well as the default 32 KiB one, with a deflate state of ~16 KiB instead of ~256 KiB
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 11, 4)
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, width, 1, 0, 0, 0, 0))
+        + _png_chunk(b'IDAT', compressor.compress(raw) + compressor.flush())
+        + _png_chunk(b'IEND', b'')
+    )
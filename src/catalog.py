@@ -0,0 +1,111 @@
+"""City and group catalog, loaded from a JSON file (cities.json, or CITY_CATALOG_PATH):
+
+    {"City": ["Group", ...], ...}
+
+Everything the funnel needs is computed once per load: frozen sets for validating the
+submitted city and group, and the <option> HTML for the selection pages, one version per
+preselected value. The file's modification time is checked at most every
+CATALOG_CHECK_INTERVAL seconds, so an edited catalog takes effect without a restart. A
+file that can't be loaded leaves the previous catalog in place.
+"""
+import json
+import os
+import threading
+import time
+
+from flask import current_app
+from markupsafe import Markup, escape
+
+CATALOG_CHECK_INTERVAL = 2 # Seconds
+
+
+def _options_html(values):
+    """{selected value: <option> HTML}, with None for no selection."""
+    options = [(value, escape(value)) for value in values]
+    return {
+        selected: Markup(''.join(
+            f'<option value="{escaped}"{" selected" if value == selected else ""}>{escaped}</option>'
+            for value, escaped in options
+        ))
+        for selected in (None, *values)
+    }
+
+
+class Catalog(object):
+    """One loaded version of the catalog. Never modified, a reload builds a new one."""
+
+    def __init__(self, city_groups, version=None):
+        self.version = version
+        self.cities = tuple(city_groups)
+        self.groups = {city: tuple(groups) for city, groups in city_groups.items()}
+        self.city_set = frozenset(self.cities)
+        self.group_sets = {city: frozenset(groups) for city, groups in self.groups.items()}
+        self._city_options = _options_html(self.cities)
+        self._group_options = {city: _options_html(groups) for city, groups in self.groups.items()}
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding='utf-8') as catalog_file:
+            version = os.fstat(catalog_file.fileno()).st_mtime_ns
+            city_groups = json.load(catalog_file)
+        if not isinstance(city_groups, dict) or not all(
+            isinstance(city, str) and isinstance(groups, list) and all(isinstance(group, str) for group in groups)
+            for city, groups in city_groups.items()
+        ):
+            raise ValueError(f"{path} must map each city to a list of groups")
+        return cls(city_groups, version)
+
+    def is_city(self, city):
+        return city in self.city_set
+
+    def is_group(self, city, group):
+        groups = self.group_sets.get(city)
+        return groups is not None and group in groups
+
+    def city_options(self, selected=None):
+        options = self._city_options
+        return options.get(selected, options[None])
+
+    def group_options(self, city, selected=None):
+        options = self._group_options.get(city)
+        if options is None:
+            return Markup('')
+        return options.get(selected, options[None])
+
+
+class CatalogLoader(object):
+    def __init__(self, path):
+        self.path = path
+        self._catalog = Catalog.from_file(path) # A broken catalog at startup is an error
+        self._checked_at = time.monotonic()
+        self._failed_version = None # Modification time of a file that failed to load, not retried
+        self._lock = threading.Lock()
+
+    def get(self):
+        """The current catalog, reloaded first if the file changed."""
+        now = time.monotonic()
+        if now - self._checked_at > CATALOG_CHECK_INTERVAL:
+            with self._lock:
+                if now - self._checked_at > CATALOG_CHECK_INTERVAL:
+                    self._checked_at = now
+                    self._reload_if_changed()
+        return self._catalog
+
+    def _reload_if_changed(self):
+        try:
+            version = os.stat(self.path).st_mtime_ns
+            if version not in (self._catalog.version, self._failed_version):
+                self._catalog = Catalog.from_file(self.path)
+        except (OSError, ValueError) as e:
+            self._failed_version = version if not isinstance(e, OSError) else None
+            print(f"Error reloading the city catalog {self.path}, keeping the previous one: {e}")
+
+
+def current_catalog():
+    return current_app.extensions['catalog'].get()
+
+
+def init_catalog(app):
+    """Loads the catalog from CITY_CATALOG_PATH (default: cities.json in the project root) into app.extensions['catalog']."""
+    path = app.config.get('CITY_CATALOG_PATH') or os.path.abspath(os.path.join(app.root_path, '..', 'cities.json'))
+    app.extensions['catalog'] = CatalogLoader(path)
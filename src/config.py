@@ -4,5 +4,46 @@ from dotenv import load_dotenv
 load_dotenv()
 
 class Config(object):
+    SECRET_KEY = os.environ.get('SECRET_KEY')
+    PIX_KEY = os.environ.get('PIX_KEY')
+    MERCHANT_NAME = os.environ.get('MERCHANT_NAME') # Pix receiver name and city, as shown in the guest's bank app
+    MERCHANT_CITY = os.environ.get('MERCHANT_CITY')
+    ACCESS_PIN = os.environ.get('ACCESS_PIN') # Added for PIN protection
+    ADMIN_PIN = os.environ.get('ADMIN_PIN') # Added for admin access to confirmed guests
+    EVENT_ADDRESS = os.environ.get('EVENT_ADDRESS') # Added for event address
+    SEND_FILE_MAX_AGE_DEFAULT = 7776000 # Cache static files for 3 months
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
-    SQLALCHEMY_TRACK_MODIFICATIONS = False 
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Engine tuning: 'auto', 'postgres', 'sqlite' or 'default' (see engine.py)
+    DB_ENGINE_PROFILE = os.environ.get('DB_ENGINE_PROFILE', 'auto')
+    DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', 0)) # Postgres connections for all workers together, 0 for no cap
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 5000))
+    DB_BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000)) # SQLite wait for a locked database
+    # Where session data is kept: 'sql', 'memory', 'redis' or 'cookie' (see sessions.py)
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'sql')
+    SESSION_REDIS_URL = os.environ.get('SESSION_REDIS_URL', 'redis://localhost:6379/0')
+    SESSION_LIFETIME = int(os.environ.get('SESSION_LIFETIME', 7 * 24 * 3600)) # Seconds
+    # 'direct' writes each confirmation to the database, 'journal' queues it in a local file
+    # that is flushed in batches by a background thread (see writebehind.py)
+    RSVP_WRITE_MODE = os.environ.get('RSVP_WRITE_MODE', 'direct')
+    RSVP_JOURNAL_PATH = os.environ.get('RSVP_JOURNAL_PATH') # Default: instance/rsvp_journal.sqlite
+    RSVP_JOURNAL_MAX_PENDING = int(os.environ.get('RSVP_JOURNAL_MAX_PENDING', 1000))
+    RSVP_JOURNAL_BATCH_SIZE = int(os.environ.get('RSVP_JOURNAL_BATCH_SIZE', 100))
+    RSVP_JOURNAL_FLUSH_INTERVAL = float(os.environ.get('RSVP_JOURNAL_FLUSH_INTERVAL', 0.5)) # Seconds
+    # /metrics totals: 'sqlite' adds up all the workers, 'memory' shows the worker that answers (see metrics.py)
+    METRICS_BACKEND = os.environ.get('METRICS_BACKEND', 'sqlite')
+    METRICS_PATH = os.environ.get('METRICS_PATH') # Default: instance/metrics.sqlite
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5)) # Seconds
+    SERVER_TIMING_PUBLIC = os.environ.get('SERVER_TIMING_PUBLIC', '') == '1' # Server-Timing header for every request, not only admins
+    PAGE_CACHE_MAX_ENTRIES = int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', 128)) # Rendered pages kept (see pagecache.py), 0 disables it
+    CITY_CATALOG_PATH = os.environ.get('CITY_CATALOG_PATH') # Cities and groups (see catalog.py), default: cities.json in the project root
+    # Per-client token buckets (see ratelimit.py): 'sqlite' (shared by the workers), 'memory' or 'off'
+    RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'sqlite')
+    RATE_LIMIT_PATH = os.environ.get('RATE_LIMIT_PATH') # Default: instance/ratelimit.sqlite
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR', 0)) # Proxies in front of the app that set X-Forwarded-For, 0 uses the socket address
+    ADMISSION_MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', 0)) # Requests per worker before a 503, 0 disables it
+    ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 1)) # Seconds
+    # Processes per worker rendering the Pix QR codes (see qrpool.py), 0 renders them in the request
+    QR_RENDER_PROCESSES = int(os.environ.get('QR_RENDER_PROCESSES', 0))
+    QR_RENDER_MAX_PENDING = int(os.environ.get('QR_RENDER_MAX_PENDING', 0)) # Default: 4 per process
+    QR_RENDER_TIMEOUT = float(os.environ.get('QR_RENDER_TIMEOUT', 10)) # Seconds
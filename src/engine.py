@@ -0,0 +1,131 @@
+"""Database engine tuning profiles, selected by DB_ENGINE_PROFILE:
+    'auto'     - 'postgres' or 'sqlite' depending on the database URL (default)
+    'postgres' - connection pool sized for the gunicorn workers/threads, pre-ping, statement timeout
+    'sqlite'   - WAL journal, synchronous=NORMAL and a busy timeout, set on every new connection
+    'default'  - SQLAlchemy's defaults, nothing tuned
+
+Every gunicorn worker has its own pool. A request can hold two connections at once (the
+view's db.session and the SQL session store), plus one for the write-behind flush
+thread, so the pool gets 2 * concurrency + 1 connections, where concurrency is the
+threads per worker, or the greenlets per worker (worker_connections) with gevent.
+DB_MAX_CONNECTIONS caps the total over all workers, to stay under the server's
+max_connections; with gevent it should always be set, since greenlets past the cap wait
+for a connection cooperatively but 100 greenlets per worker would otherwise mean 201
+connections each.
+"""
+import os
+import sqlite3
+import threading
+
+from sqlalchemy import event
+
+from .models import db
+
+PROFILES = ('auto', 'postgres', 'sqlite', 'default')
+
+
+def _profile_name(config):
+    profile = config.get('DB_ENGINE_PROFILE', 'auto')
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown DB_ENGINE_PROFILE: {profile}")
+    if profile != 'auto':
+        return profile
+    url = config.get('SQLALCHEMY_DATABASE_URI') or ''
+    if url.startswith('postgresql'):
+        return 'postgres'
+    if url.startswith('sqlite'):
+        return 'sqlite'
+    return 'default'
+
+
+def postgres_pool_size(workers, concurrency, max_connections=None):
+    """Returns (pool_size, max_overflow) for one worker process running concurrency requests at once."""
+    pool_size = concurrency + 1
+    max_overflow = concurrency
+    if max_connections:
+        # Whole budget split between the workers, at least one connection each
+        per_worker = max(1, max_connections // max(1, workers))
+        pool_size = min(pool_size, per_worker)
+        max_overflow = max(0, min(max_overflow, per_worker - pool_size))
+    return pool_size, max_overflow
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the selected profile."""
+    profile = _profile_name(config)
+    if profile == 'postgres':
+        # All set by gunicorn.conf.py
+        if os.environ.get('GUNICORN_WORKER_CLASS') == 'gevent':
+            concurrency = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS') or 100)
+        else:
+            concurrency = int(os.environ.get('GUNICORN_THREADS') or 1)
+        pool_size, max_overflow = postgres_pool_size(
+            int(os.environ.get('WEB_CONCURRENCY') or 1),
+            concurrency,
+            int(config.get('DB_MAX_CONNECTIONS') or 0),
+        )
+        return {
+            'pool_size': pool_size,
+            'max_overflow': max_overflow,
+            'pool_timeout': 10,
+            'pool_recycle': 1800, # Before proxies and PgBouncer drop idle connections
+            'pool_pre_ping': True,
+            'connect_args': {'options': f"-c statement_timeout={int(config.get('DB_STATEMENT_TIMEOUT_MS', 5000))}"},
+        }
+    if profile == 'sqlite':
+        # The driver's own lock wait, in seconds; busy_timeout below covers the same for SQLite itself
+        return {'connect_args': {'timeout': int(config.get('DB_BUSY_TIMEOUT_MS', 5000)) / 1000}}
+    return {}
+
+
+def _sqlite_pragmas(busy_timeout_ms):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # WAL lets readers work while a confirmation is written; NORMAL only syncs at checkpoints,
+        # which in WAL mode can lose the last commits on power loss but never corrupts the database
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout_ms)}')
+        cursor.close()
+    return set_pragmas
+
+
+def init_database(app):
+    """Initializes db for the app with the engine profile from the config.
+
+    SQLALCHEMY_ENGINE_OPTIONS set explicitly in the config win over the profile.
+    """
+    profile = _profile_name(app.config)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    db.init_app(app)
+
+    if profile == 'sqlite':
+        with app.app_context():
+            event.listen(db.engine, 'connect', _sqlite_pragmas(app.config.get('DB_BUSY_TIMEOUT_MS', 5000)))
+
+
+class LocalSQLite(object):
+    """A local SQLite file shared by the threads and workers on the machine (rate limit buckets, RSVP journal).
+
+    Each thread of each process gets its own autocommit connection in WAL mode, created with
+    the given synchronous level and schema; callers manage transactions with BEGIN/COMMIT.
+    """
+
+    def __init__(self, path, schema, timeout=5, synchronous='NORMAL'):
+        self.path = path
+        self.schema = schema
+        self.timeout = timeout
+        self.synchronous = synchronous
+        self._local = threading.local()
+
+    def connect(self):
+        # One connection per thread and process (connections can't cross a fork)
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(f'PRAGMA synchronous={self.synchronous}')
+            connection.execute(self.schema)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
@@ -0,0 +1,88 @@
+"""Streaming export of the RSVPs for admins (/confirmed-guests.csv and .jsonl).
+
+Rows are read from the database in batches of EXPORT_BATCH_SIZE and written out as CSV or
+JSON Lines chunk by chunk, so memory use doesn't grow with the table. When the client
+accepts gzip, the chunks are compressed on the fly (gzip_chunks) with Content-Encoding:
+gzip, instead of building the whole file first.
+"""
+import csv
+import datetime
+import io
+import json
+import zlib
+
+from .models import db, RSVP
+
+# Rows fetched from the database per round trip (server-side cursor on Postgres)
+EXPORT_BATCH_SIZE = 500
+
+EXPORT_COLUMNS = ['id', 'timestamp', 'city', 'group', 'num_people', 'names', 'phone', 'amount']
+
+
+def parse_export_filters(args):
+    """Reads the optional city/group/since filters from the query string.
+
+    Raises ValueError if 'since' is not an ISO date or datetime.
+    """
+    since = args.get('since')
+    return {
+        'city': args.get('city') or None,
+        'group': args.get('group') or None,
+        'since': datetime.datetime.fromisoformat(since) if since else None,
+    }
+
+
+def _export_batches(city=None, group=None, since=None):
+    query = db.select(
+        RSVP.id, RSVP.timestamp, RSVP.city, RSVP.group, RSVP.num_people, RSVP.names_str, RSVP.phone
+    ).order_by(RSVP.id)
+    if city:
+        query = query.where(RSVP.city == city)
+    if group:
+        query = query.where(RSVP.group == group)
+    if since:
+        query = query.where(RSVP.timestamp >= since)
+
+    # yield_per streams the rows instead of loading the whole result
+    result = db.session.execute(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    for batch in result.partitions():
+        yield [
+            {
+                'id': row.id,
+                'timestamp': row.timestamp.isoformat(sep=' ', timespec='seconds') if row.timestamp else '',
+                'city': row.city,
+                'group': row.group,
+                'num_people': row.num_people,
+                'names': row.names_str,
+                'phone': row.phone,
+                'amount': 15 * row.num_people,
+            }
+            for row in batch
+        ]
+
+
+def csv_chunks(filters):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    yield buffer.getvalue()
+    for batch in _export_batches(**filters):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue()
+
+
+def jsonl_chunks(filters):
+    for batch in _export_batches(**filters):
+        yield ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in batch)
+
+
+def gzip_chunks(chunks):
+    """Compresses a stream of text chunks on the fly (gzip container)."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode('utf-8'))
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,152 @@
+"""Live feed of new RSVPs for the admin page, as Server-Sent Events.
+
+Confirmations saved by this process are published to an in-process pub/sub and pushed
+to the open streams right away. RSVPs saved by other workers (or flushed from the
+write-behind journal elsewhere) are picked up by polling for ids above the last one
+sent, which is an index range read on the primary key, never a full-table query.
+
+Each event is one RSVP; the page adds it to its table and counters itself, skipping ids
+it already has. Streams end after STREAM_MAX_SECONDS, and the browser's EventSource
+reconnects with Last-Event-ID to continue where it stopped; the polls after a reconnect
+go POLL_OVERLAP ids back from it too.
+
+A sync gunicorn worker can't hold a stream: it serves nothing else meanwhile, and the
+arbiter kills it after its timeout (30 s by default). There the feed falls back to
+polling: each request sends the RSVPs after Last-Event-ID - POLL_OVERLAP and ends, and
+the EventSource comes back after POLL_INTERVAL.
+"""
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+from .models import db, RSVP
+
+POLL_INTERVAL = 5 # Seconds between database polls, for RSVPs saved by other workers
+HEARTBEAT_INTERVAL = 15 # Keeps proxies from closing an idle stream
+STREAM_MAX_SECONDS = 300
+RECONNECT_MS = 3000
+# Ids below the last one sent that are polled again: with concurrent writers a lower id
+# can be committed after a higher one
+POLL_OVERLAP = 20
+POLL_LIMIT = 200
+
+
+class RSVPFeed(object):
+    """In-process pub/sub: each open stream has a bounded queue of RSVP events."""
+
+    def __init__(self, max_queued=1000):
+        self.max_queued = max_queued
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        subscription = queue.Queue(self.max_queued)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(event)
+            except queue.Full:
+                pass # A stream that fell behind catches up through polling
+
+
+feed = RSVPFeed()
+
+
+def rsvp_event(rsvp_id, timestamp, city, group, names_str, num_people, phone):
+    return {
+        'id': rsvp_id,
+        'timestamp': timestamp.strftime('%d/%m/%Y %H:%M') if timestamp else '',
+        'city': city,
+        'group': group,
+        'names_str': names_str,
+        'num_people': num_people,
+        'phone': phone,
+    }
+
+
+def publish_rsvps(rsvps, ids):
+    """Publishes saved RSVPs (dicts as given to models.save_rsvps, ids as returned by it)."""
+    for rsvp in rsvps:
+        feed.publish(rsvp_event(
+            ids[rsvp['confirmation_token']], rsvp['timestamp'], rsvp['city'], rsvp['group'],
+            ", ".join(rsvp['names']), rsvp['num_people'], rsvp['phone'],
+        ))
+
+
+def _poll(after_id):
+    rows = (
+        db.session.query(RSVP.id, RSVP.timestamp, RSVP.city, RSVP.group, RSVP.names_str, RSVP.num_people, RSVP.phone)
+        .filter(RSVP.id > after_id)
+        .order_by(RSVP.id)
+        .limit(POLL_LIMIT)
+        .all()
+    )
+    # Don't keep a pooled connection while the stream waits
+    db.session.close()
+    return [rsvp_event(*row) for row in rows]
+
+
+def _format(event):
+    return f"id: {event['id']}\nevent: rsvp\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+def rsvp_stream(since, last_event_id=None, poll_only=False):
+    """Yields the SSE stream of RSVPs with id > since. Needs an app context (stream_with_context).
+
+    last_event_id is the last id the browser got before reconnecting. With poll_only,
+    sends the RSVPs already saved and ends (for sync workers).
+    """
+    last_id = max(since, last_event_id or 0)
+    if poll_only:
+        events = [event for event in _poll(max(since, last_id - POLL_OVERLAP)) if event['id'] > since]
+        yield f"retry: {POLL_INTERVAL * 1000}\n\n" + ''.join(_format(event) for event in events)
+        return
+
+    subscription = feed.subscribe()
+    sent = set()
+    sent_order = deque()
+    started = time.monotonic()
+    next_poll = started
+    last_write = started
+    try:
+        yield f"retry: {RECONNECT_MS}\n\n"
+        while time.monotonic() - started < STREAM_MAX_SECONDS:
+            events = []
+            now = time.monotonic()
+            if now >= next_poll:
+                events += _poll(max(since, last_id - POLL_OVERLAP))
+                next_poll = now + POLL_INTERVAL
+            try:
+                events.append(subscription.get(timeout=max(0.0, min(next_poll, last_write + HEARTBEAT_INTERVAL) - now)))
+            except queue.Empty:
+                pass
+
+            chunks = []
+            for event in events:
+                if event['id'] <= since or event['id'] in sent:
+                    continue
+                sent.add(event['id'])
+                sent_order.append(event['id'])
+                if len(sent_order) > 10 * POLL_LIMIT:
+                    sent.discard(sent_order.popleft())
+                last_id = max(last_id, event['id'])
+                chunks.append(_format(event))
+            if not chunks and time.monotonic() - last_write >= HEARTBEAT_INTERVAL:
+                chunks.append(": keepalive\n\n")
+            if chunks:
+                last_write = time.monotonic()
+                yield ''.join(chunks)
+    finally:
+        feed.unsubscribe(subscription)
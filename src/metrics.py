@@ -0,0 +1,321 @@
+"""Per-request instrumentation.
+
+Admin pages get a Server-Timing header with their total time, database queries, template
+rendering and Pix generation; guests don't see how the server spends its time, unless
+SERVER_TIMING_PUBLIC is set (e.g. when profiling a test deploy). The same numbers are
+aggregated per endpoint and exposed in the Prometheus text format by the admin-only
+/metrics route.
+
+Each worker process counts in memory. With METRICS_BACKEND='sqlite' (default) a thread in
+every worker copies its totals to a local SQLite file every METRICS_FLUSH_INTERVAL seconds,
+and /metrics adds up the totals of all the workers, including the ones that have exited,
+so the counters don't go backwards when the scrape lands on another worker. gunicorn
+empties the file when it starts (see gunicorn.conf.py). With 'memory' /metrics only shows
+the worker that answered. Gauges always describe the worker that answered.
+"""
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import before_render_template, current_app, g, has_app_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .engine import LocalSQLite
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Parts of a request that are timed separately: name -> (metric name, Server-Timing description)
+TIMED_PARTS = {
+    'db': ('db_query', 'Banco de dados'),
+    'tpl': ('template_render', 'Templates'),
+    'pix': ('pix_generation', 'Pix/QR Code'),
+}
+
+
+
+def _new_histogram():
+    return {'buckets': [0] * len(LATENCY_BUCKETS), 'count': 0, 'sum': 0.0}
+
+
+def _new_totals():
+    return {'count': 0, 'sum': 0.0}
+
+
+_lock = threading.Lock()
+_requests = defaultdict(_new_histogram)  # endpoint -> latency histogram
+_parts = defaultdict(_new_totals)  # (endpoint, part) -> totals
+_statuses = defaultdict(int)  # (endpoint, status code) -> count
+_version = 0  # Requests counted so far, to skip flushing an idle worker
+
+
+def _add_part(part, elapsed):
+    # Only counts work done while handling a request
+    if not has_app_context() or 'request_timings' not in g:
+        return
+    timing = g.request_timings.setdefault(part, [0, 0.0])
+    timing[0] += 1
+    timing[1] += elapsed
+
+
+@contextmanager
+def timed(part):
+    """Adds the time spent in the block to the current request's timing for part."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _add_part(part, time.perf_counter() - start)
+
+
+# A connection runs one statement at a time, so one start time per connection is enough
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_start'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop('query_start', None)
+    if start is not None:
+        _add_part('db', time.perf_counter() - start)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    # A failed query never reaches after_cursor_execute; don't let its start time linger
+    if context.connection is not None:
+        context.connection.info.pop('query_start', None)
+
+
+def _before_render_template(sender, template, context, **extra):
+    if 'request_timings' in g:
+        g.template_starts.append(time.perf_counter())
+
+
+def _template_rendered(sender, template, context, **extra):
+    if 'request_timings' in g and g.template_starts:
+        _add_part('tpl', time.perf_counter() - g.template_starts.pop())
+
+
+def _start_request():
+    g.request_start = time.perf_counter()
+    g.request_timings = {}
+    g.template_starts = []
+
+
+def _finish_request(response):
+    if 'request_start' not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_start
+    endpoint = request.endpoint or 'unmatched'
+
+    global _version
+    with _lock:
+        _version += 1
+        histogram = _requests[endpoint]
+        for i, upper_bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= upper_bound:
+                histogram['buckets'][i] += 1
+        histogram['count'] += 1
+        histogram['sum'] += elapsed
+        _statuses[(endpoint, response.status_code)] += 1
+        for part, (count, seconds) in g.request_timings.items():
+            totals = _parts[(endpoint, part)]
+            totals['count'] += count
+            totals['sum'] += seconds
+    store = current_app.extensions.get('metrics_store')
+    if store is not None:
+        store.start()
+
+    # Admin pages only (they passed the admin PIN check); the session isn't read here, so
+    # static files and cached pages don't get a Vary: Cookie
+    if not (request.endpoint in current_app.extensions['server_timing_endpoints']
+            or current_app.config.get('SERVER_TIMING_PUBLIC')):
+        return response
+    server_timing = [f'app;dur={elapsed * 1000:.1f}']
+    for part, (count, seconds) in g.request_timings.items():
+        server_timing.append(f'{part};desc="{TIMED_PARTS[part][1]} ({count}x)";dur={seconds * 1000:.1f}')
+    response.headers['Server-Timing'] = ', '.join(server_timing)
+    return response
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _snapshot(counters=None):
+    """This process' totals, as JSON-serializable lists. counters is a function returning more {name: total}."""
+    with _lock:
+        snapshot = {
+            'requests': [[endpoint, h['buckets'], h['count'], h['sum']] for endpoint, h in _requests.items()],
+            'statuses': [[endpoint, status, count] for (endpoint, status), count in _statuses.items()],
+            'parts': [[endpoint, part, t['count'], t['sum']] for (endpoint, part), t in _parts.items()],
+        }
+    snapshot['counters'] = counters() if counters else {}
+    return snapshot
+
+
+def _merge(snapshots):
+    """Adds up the snapshots of several processes into (requests, statuses, parts, counters)."""
+    requests = defaultdict(_new_histogram)
+    statuses = defaultdict(int)
+    parts = defaultdict(_new_totals)
+    counters = defaultdict(int)
+    for snapshot in snapshots:
+        for endpoint, buckets, count, seconds in snapshot['requests']:
+            histogram = requests[endpoint]
+            histogram['buckets'] = [a + b for a, b in zip(histogram['buckets'], buckets)]
+            histogram['count'] += count
+            histogram['sum'] += seconds
+        for endpoint, status, count in snapshot['statuses']:
+            statuses[(endpoint, status)] += count
+        for endpoint, part, count, seconds in snapshot['parts']:
+            parts[(endpoint, part)]['count'] += count
+            parts[(endpoint, part)]['sum'] += seconds
+        for name, value in snapshot['counters'].items():
+            counters[name] += value
+    return requests, statuses, parts, counters
+
+
+class SharedMetrics(object):
+    """Totals of every worker process, in a local SQLite file shared by the workers on the machine."""
+
+    def __init__(self, path, counters=None, flush_interval=5):
+        # Metrics are worth little after a crash, so don't wait for the disk
+        self._db = LocalSQLite(
+            path,
+            'CREATE TABLE IF NOT EXISTS process_metrics ('
+            ' process TEXT PRIMARY KEY,'
+            ' data TEXT NOT NULL,'
+            ' updated_at REAL NOT NULL)',
+            synchronous='OFF',
+        )
+        self.counters = counters
+        self.flush_interval = flush_interval
+        self._process = None
+        self._flushed_version = None
+        self._start_lock = threading.Lock()
+        self._thread_pid = None
+
+    def start(self):
+        """Starts the flush thread in this process if it isn't running (threads don't survive a fork)."""
+        if self._thread_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread_pid == os.getpid():
+                return
+            # A pid can be reused by a later worker, whose totals start over
+            self._process = f"{os.getpid()}-{secrets.token_hex(4)}"
+            self._flushed_version = None
+            threading.Thread(target=self._run, name='metrics-flush', daemon=True).start()
+            self._thread_pid = os.getpid()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"Error saving the metrics of this worker: {e}")
+
+    def flush(self):
+        """Saves this process' totals, if it counted requests since the last time."""
+        if self._process is None or self._flushed_version == _version:
+            return
+        version = _version
+        data = json.dumps(_snapshot(self.counters))
+        self._db.connect().execute(
+            'INSERT INTO process_metrics (process, data, updated_at) VALUES (?, ?, ?)'
+            ' ON CONFLICT (process) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at',
+            (self._process, data, time.time()),
+        )
+        self._flushed_version = version
+
+    def collect(self):
+        """Returns the totals of all the processes, this one up to date, as _merge does."""
+        self.flush()
+        rows = self._db.connect().execute('SELECT data FROM process_metrics').fetchall()
+        return _merge(json.loads(data) for data, in rows)
+
+    def reset(self):
+        self._db.connect().execute('DELETE FROM process_metrics')
+
+
+def render_metrics(gauges=None):
+    """Returns all metrics in the Prometheus text exposition format. Needs an app context.
+
+    gauges maps more metric names to their value in this process, e.g. {'x_entries': 3}.
+    """
+    store = current_app.extensions.get('metrics_store')
+    if store is not None:
+        requests, statuses, parts, counters = store.collect()
+    else:
+        requests, statuses, parts, counters = _merge([_snapshot(current_app.extensions.get('metrics_counters'))])
+
+    lines = [
+        '# HELP http_request_duration_seconds Request latency per endpoint.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    for endpoint, histogram in sorted(requests.items()):
+        label = f'endpoint="{_escape(endpoint)}"'
+        for upper_bound, count in zip(LATENCY_BUCKETS, histogram['buckets']):
+            lines.append(f'http_request_duration_seconds_bucket{{{label},le="{upper_bound}"}} {count}')
+        lines.append(f'http_request_duration_seconds_bucket{{{label},le="+Inf"}} {histogram["count"]}')
+        lines.append(f'http_request_duration_seconds_sum{{{label}}} {histogram["sum"]:.6f}')
+        lines.append(f'http_request_duration_seconds_count{{{label}}} {histogram["count"]}')
+
+    lines += [
+        '# HELP http_responses_total Responses per endpoint and status code.',
+        '# TYPE http_responses_total counter',
+    ]
+    for (endpoint, status), count in sorted(statuses.items()):
+        lines.append(f'http_responses_total{{endpoint="{_escape(endpoint)}",status="{status}"}} {count}')
+
+    for part, (name, description) in TIMED_PARTS.items():
+        lines += [
+            f'# HELP {name}_seconds_total Time spent in {description} per endpoint.',
+            f'# TYPE {name}_seconds_total counter',
+        ]
+        counts = []
+        for (endpoint, timed_part), totals in sorted(parts.items()):
+            if timed_part == part:
+                label = f'endpoint="{_escape(endpoint)}"'
+                lines.append(f'{name}_seconds_total{{{label}}} {totals["sum"]:.6f}')
+                counts.append(f'{name}_total{{{label}}} {totals["count"]}')
+        lines += [f'# TYPE {name}_total counter'] + counts
+
+    for name, value in sorted(counters.items()):
+        lines += [f'# TYPE {name} counter', f'{name} {value}']
+    for name, value in (gauges or {}).items():
+        lines += [f'# TYPE {name} gauge', f'{name} {value}']
+    return '\n'.join(lines) + '\n'
+
+
+def init_metrics(app, admin_endpoints=(), counters=None):
+    """Registers the timing hooks. Call before any other before_request so it sees the whole request.
+
+    admin_endpoints get the Server-Timing header. counters is a function returning more
+    {name: total} of this process for /metrics, called without an app context.
+    """
+    app.extensions['server_timing_endpoints'] = frozenset(admin_endpoints)
+    app.extensions['metrics_counters'] = counters
+    backend = app.config.get('METRICS_BACKEND', 'sqlite')
+    if backend == 'sqlite':
+        app.extensions['metrics_store'] = SharedMetrics(
+            app.config.get('METRICS_PATH') or os.path.join(app.instance_path, 'metrics.sqlite'),
+            counters,
+            flush_interval=float(app.config.get('METRICS_FLUSH_INTERVAL', 5)),
+        )
+    elif backend != 'memory':
+        raise ValueError(f"Unknown METRICS_BACKEND: {backend}")
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    before_render_template.connect(_before_render_template, app)
+    template_rendered.connect(_template_rendered, app)
@@ -1,6 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import IntegrityError
 import datetime
 
+from .utils import normalize_name
+
 # Initialize SQLAlchemy instance. It will be bound to the Flask app in app.py
 db = SQLAlchemy()
 
@@ -12,6 +15,165 @@ class RSVP(db.Model):
     num_people = db.Column(db.Integer, nullable=False)
     names_str = db.Column(db.String(500), nullable=False)  # Storing names as a comma-separated string
     phone = db.Column(db.String(20), nullable=False)
+    # Issued at the Pix payment step; a repeated confirmation with the same token is not saved again
+    confirmation_token = db.Column(db.String(64), nullable=True, unique=True, index=True)
+    duplicate_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Repeats collapsed into this row
+    journal_claim = db.Column(db.String(16), nullable=True)  # Write-behind batch that inserted the row (see writebehind.py)
+
+    # One row per person, written together with the RSVP
+    guests = db.relationship('Guest', backref='rsvp', lazy=True, cascade='all, delete-orphan')
+
+    # Covers the admin listing: filter by city/group, ordered by timestamp
+    __table_args__ = (
+        db.Index('ix_rsvp_city_group_timestamp', 'city', 'group', 'timestamp'),
+    )
+
+    def __repr__(self):
+        return f'<RSVP {self.id}>'
+
+
+class Guest(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    rsvp_id = db.Column(db.Integer, db.ForeignKey('rsvp.id'), nullable=False, index=True)
+    name = db.Column(db.String(100), nullable=False)  # As typed by the guest
+    name_normalized = db.Column(db.String(100), nullable=False, index=True)  # See utils.normalize_name
+
+    def __repr__(self):
+        return f'<Guest {self.id} {self.name}>'
+
+
+class ServerSession(db.Model):
+    # Session data for the 'sql' session backend (see sessions.py)
+    sid = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<ServerSession {self.sid}>'
+
+
+class PaymentMatch(db.Model):
+    # One bank statement line and what it was matched to (see reconcile.py)
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.String(32), nullable=False, index=True)  # One run per imported statement
+    line_number = db.Column(db.Integer, nullable=False)
+    posted_at = db.Column(db.DateTime, nullable=True)
+    amount = db.Column(db.Numeric(10, 2), nullable=False)
+    description = db.Column(db.String(500), nullable=False)
+    status = db.Column(db.String(20), nullable=False)  # 'matched', 'ambiguous' or 'unmatched'
+    rsvp_id = db.Column(db.Integer, db.ForeignKey('rsvp.id'), nullable=True, index=True)
+    candidate_ids = db.Column(db.String(200), nullable=True)  # Comma-separated RSVP ids when ambiguous
+    note = db.Column(db.String(200), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
 
     def __repr__(self):
-        return f'<RSVP {self.id}>' 
\ No newline at end of file
+        return f'<PaymentMatch {self.id} {self.status}>'
+
+def _insert_new_rsvps(rows):
+    """Inserts the RSVP rows whose confirmation_token isn't saved yet. Returns {token: id} of those inserted."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        return dict(db.session.execute(
+            insert(RSVP)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=['confirmation_token'])
+            .returning(RSVP.confirmation_token, RSVP.id)
+        ).all())
+
+    # Other databases (MySQL...): one INSERT per row in a SAVEPOINT; a token that was
+    # already saved fails on the unique index and only its savepoint is rolled back
+    inserted = {}
+    for row in rows:
+        try:
+            with db.session.begin_nested():
+                result = db.session.execute(db.insert(RSVP).values(row))
+            inserted[row['confirmation_token']] = result.inserted_primary_key[0]
+        except IntegrityError:
+            pass
+    return inserted
+
+
+def _count_duplicate(token, repeats):
+    update = (
+        db.update(RSVP)
+        .where(RSVP.confirmation_token == token)
+        .values(duplicate_count=RSVP.duplicate_count + repeats)
+    )
+    if db.session.get_bind().dialect.update_returning:
+        return db.session.execute(update.returning(RSVP.id)).scalar()
+    db.session.execute(update)
+    return db.session.execute(db.select(RSVP.id).where(RSVP.confirmation_token == token)).scalar()
+
+
+def _take_over_claim(token, previous_claim, claim):
+    """Moves a row inserted by previous_claim to claim. Returns its id, or None if another claim or request inserted it."""
+    result = db.session.execute(
+        db.update(RSVP)
+        .where(RSVP.confirmation_token == token, RSVP.journal_claim == previous_claim)
+        .values(journal_claim=claim)
+    )
+    if not result.rowcount:
+        return None
+    return db.session.execute(db.select(RSVP.id).where(RSVP.confirmation_token == token)).scalar()
+
+
+def count_repeated_rsvp(token):
+    """Counts a repeated confirmation of an RSVP that was already saved. Returns its id, or None if there is none.
+
+    The caller commits.
+    """
+    return _count_duplicate(token, 1)
+
+
+def save_rsvps(rsvps):
+    """Inserts RSVPs and their guests with one multi-row INSERT each, skipping repeated confirmations.
+
+    rsvps are dicts with city, group, num_people, names (list), phone, confirmation_token,
+    timestamp and optionally duplicate_count (repeats already collapsed by the caller),
+    journal_claim and previous_claim (the write-behind batch, see writebehind.py).
+    Uses INSERT ... ON CONFLICT (confirmation_token) DO NOTHING on Postgres and SQLite
+    (one INSERT per RSVP elsewhere), so a token that was already saved costs an index
+    probe; its row's duplicate_count is increased instead.
+    Returns {confirmation_token: rsvp id}. The caller commits.
+    """
+    rows = [
+        {
+            'timestamp': rsvp['timestamp'],
+            'city': rsvp['city'],
+            'group': rsvp['group'],
+            'num_people': rsvp['num_people'],
+            'names_str': ", ".join(rsvp['names']), # Names as a comma-separated string
+            'phone': rsvp['phone'],
+            'confirmation_token': rsvp['confirmation_token'],
+            'duplicate_count': rsvp.get('duplicate_count', 0),
+            'journal_claim': rsvp.get('journal_claim'),
+        }
+        for rsvp in rsvps
+    ]
+    inserted = _insert_new_rsvps(rows)
+
+    guests = []
+    ids = dict(inserted)
+    for rsvp in rsvps:
+        token = rsvp['confirmation_token']
+        if token in inserted:
+            guests += [
+                {'rsvp_id': inserted[token], 'name': name, 'name_normalized': normalize_name(name)}
+                for name in rsvp['names']
+            ]
+        else:
+            # A journal batch whose worker died after inserting it isn't a repeat. Repeats queued
+            # between that insert and this retry aren't counted either, which is the safe side.
+            if rsvp.get('previous_claim'):
+                ids[token] = _take_over_claim(token, rsvp['previous_claim'], rsvp['journal_claim'])
+                if ids[token] is not None:
+                    continue
+            # Reload, double tap or prefetch: count it on the row that was already saved
+            ids[token] = _count_duplicate(token, 1 + rsvp.get('duplicate_count', 0))
+    if guests:
+        db.session.execute(db.insert(Guest), guests)
+    return ids
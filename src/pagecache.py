@@ -0,0 +1,122 @@
+"""Rendered-page cache for the pages that look the same for every guest.
+
+cached_page(template_name, **context) renders the template once per distinct context and
+keeps the HTML, its gzip/brotli versions and a strong ETag, so repeated hits skip Jinja
+and conditional requests get a 304. The key includes the endpoint, the context and the
+template files' modification time, so editing a template takes effect without a restart.
+
+Only pass values that fully determine the page: anything read inside the template from
+the session or the request (form errors, previous answers) must be in the context, or
+the page must be rendered with render_template instead.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, render_template, request
+
+from .assets import ENCODINGS, compress
+
+# The template folder is checked for changes at most this often (seconds)
+TEMPLATES_VERSION_TTL = 2
+
+
+class PageCache(object):
+    def __init__(self, template_folder, max_entries=128):
+        self.template_folder = template_folder
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._version_checked_at = 0
+
+    def templates_version(self):
+        now = time.monotonic()
+        if self._version is None or now - self._version_checked_at > TEMPLATES_VERSION_TTL:
+            mtimes = [
+                os.stat(os.path.join(directory, name)).st_mtime_ns
+                for directory, _, files in os.walk(self.template_folder)
+                for name in files
+            ]
+            self._version = max(mtimes, default=0)
+            self._version_checked_at = now
+        return self._version
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def store(self, key, html):
+        body = html.encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        entry = {'etag': digest, 'bodies': {None: body}}
+        for encoding, _ in ENCODINGS:
+            compressed = compress(body, encoding)
+            if compressed is not None and len(compressed) < len(body):
+                entry['bodies'][encoding] = compressed
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def info(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+
+def cached_page(template_name, status=200, **context):
+    """Like render_template, but served from the page cache, with an ETag and precompressed bodies."""
+    cache = current_app.extensions.get('page_cache')
+    if cache is None:
+        return render_template(template_name, **context), status
+
+    key = (
+        request.endpoint,
+        request.script_root, # url_for output depends on it
+        template_name,
+        tuple(sorted(context.items())),
+        cache.templates_version(),
+    )
+    entry = cache.get(key)
+    if entry is None:
+        entry = cache.store(key, render_template(template_name, **context))
+
+    encoding = None
+    for candidate, _ in ENCODINGS:
+        if candidate in entry['bodies'] and candidate in request.accept_encodings:
+            encoding = candidate
+            break
+    # Each encoding is a different representation, so it gets its own strong ETag
+    etag = f"{entry['etag']}-{encoding}" if encoding else entry['etag']
+
+    if status == 200 and request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(entry['bodies'][encoding], status=status, mimetype='text/html')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    # The pages are behind the access PIN: browsers may keep them, but must revalidate
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def init_page_cache(app):
+    """Enables the page cache unless PAGE_CACHE_MAX_ENTRIES is 0. It is in app.extensions['page_cache']."""
+    max_entries = int(app.config.get('PAGE_CACHE_MAX_ENTRIES', 128))
+    if max_entries > 0:
+        app.extensions['page_cache'] = PageCache(os.path.join(app.root_path, app.template_folder), max_entries)
@@ -0,0 +1,104 @@
+"""Process pool for rendering Pix QR code PNGs (QR_RENDER_PROCESSES > 0).
+
+Rendering a QR code is ~10 ms of pure CPU. In a threaded or gevent worker that time
+holds the GIL (or the event loop), so every other request in the worker waits for it.
+With the pool, the render runs in a separate process and the request thread or
+greenlet only waits on a pipe.
+
+The pool is bounded: at most QR_RENDER_MAX_PENDING renders are queued or running per
+worker. A request that can't get a slot within QR_RENDER_TIMEOUT seconds gets a 503
+instead of growing the queue, and so does one whose render is lost because a pool
+process died (the pool is started again for the next render). The Pix payload itself
+(a string and a CRC) stays inline: it costs less than sending it to another process.
+
+Pool processes are started with 'spawn', never forked from a worker that has threads
+or greenlets, and lazily in each gunicorn worker (a pool can't cross a fork).
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .utils import render_qr_png
+
+
+class QRPoolBusy(Exception):
+    pass
+
+
+class QRRenderPool(object):
+    def __init__(self, processes, max_pending=None, timeout=10):
+        self.processes = processes
+        self.max_pending = max_pending or 4 * processes
+        self.timeout = timeout
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+
+    def _get_executor(self):
+        if self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor_pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('spawn'))
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def _drop_executor(self, executor):
+        # A pool process died (OOM, crash): the executor refuses new work, so the next render builds a new one
+        with self._lock:
+            if self._executor is executor and self._executor_pid == os.getpid():
+                self._executor_pid = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _reject(self):
+        with self._lock:
+            self.rejected += 1
+        return QRPoolBusy()
+
+    def render(self, payload_string):
+        """Renders the QR code PNG in a pool process. Raises QRPoolBusy if the pool stays full."""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise self._reject()
+        executor = self._get_executor()
+        try:
+            future = executor.submit(render_qr_png, payload_string)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._drop_executor(executor)
+            raise self._reject()
+        # The slot is freed when the render ends, not when this request stops waiting,
+        # so renders that timed out but still run count against max_pending
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel() # Only works if it hasn't started yet
+            raise self._reject()
+        except BrokenProcessPool:
+            self._drop_executor(executor)
+            raise self._reject()
+
+    def warm_up(self):
+        # Starts the pool processes and their imports before the first guest needs them
+        executor = self._get_executor()
+        for future in [executor.submit(render_qr_png, 'warm-up') for _ in range(self.processes)]:
+            future.result()
+
+    def shutdown(self):
+        if self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor_pid = None
+
+
+def init_qr_pool(app):
+    """Sets up the QR render pool if QR_RENDER_PROCESSES > 0. It is in app.extensions['qr_pool']."""
+    processes = int(app.config.get('QR_RENDER_PROCESSES') or 0)
+    if processes > 0:
+        app.extensions['qr_pool'] = QRRenderPool(
+            processes,
+            max_pending=int(app.config.get('QR_RENDER_MAX_PENDING') or 0),
+            timeout=float(app.config.get('QR_RENDER_TIMEOUT', 10)),
+        )
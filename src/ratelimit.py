@@ -0,0 +1,277 @@
+"""Per-client rate limiting and admission control.
+
+Rate limiting: every client has a token bucket per endpoint budget (RATE_LIMITS below,
+overridable with the RATE_LIMITS config dict). A bucket holds up to `burst` tokens and
+refills at `per_minute` tokens per minute; each request takes one, and a request that
+finds the bucket empty gets a 429 with Retry-After. The client is the session id when
+the browser sent a valid session cookie, and the IP address otherwise, so dropping the
+cookie doesn't buy a fresh bucket. Two budgets are always per IP address:
+    'landing' - the invite link (GET of the welcome page with the right access PIN) opened
+                without a session cookie, looser because guests behind one carrier NAT or
+                router share the address
+    'admin'   - admin pages requested without admin_verified in the session or a valid
+                bearer token, strict because those are PIN guesses
+Buckets live in one of the backends selected by
+RATE_LIMIT_BACKEND:
+    'sqlite' - local SQLite file shared by the workers on the machine (default)
+    'memory' - dict in the worker process; each worker then allows the whole budget
+    'off'    - no rate limiting
+
+Admission control: a WSGI middleware counts the requests in flight in the worker and
+answers 503 with Retry-After, before the session is loaded or any view runs, once
+ADMISSION_MAX_IN_FLIGHT is reached. A sync worker only ever has one request in flight,
+so this is for threaded and gevent workers, where a burst would otherwise pile up
+requests that all get slow together.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from flask import current_app, jsonify, request, session
+from werkzeug.wsgi import ClosingIterator
+
+from .engine import LocalSQLite
+from .pagecache import cached_page
+
+# endpoint -> (per_minute, burst); endpoints not listed share the None budget, and a
+# budget of None exempts the endpoint
+RATE_LIMITS = {
+    'rsvp.pix_payment_form': (12, 6), # Builds the Pix payload and the QR code
+    'rsvp.pix_qr': (30, 10),
+    'rsvp.confirmation': (6, 3), # Database write
+    'rsvp.api_rsvp': (12, 6),
+    'rsvp.api_rsvp_confirm': (6, 3),
+    'static': None,
+    None: (120, 60),
+    'landing': (300, 100),
+    'admin': (3, 5),
+}
+
+# Buckets untouched for this long are full again and are deleted
+BUCKET_IDLE_SECONDS = 3600
+
+
+def _refill(tokens, updated_at, now, per_minute, burst):
+    return min(burst, tokens + (now - updated_at) * per_minute / 60)
+
+
+def _retry_after(tokens, per_minute):
+    # Seconds until the bucket has one token again
+    return (1 - tokens) * 60 / per_minute
+
+
+class MemoryBuckets(object):
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._buckets = {} # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, key, per_minute, burst):
+        """Takes a token. Returns 0 if there was one, else the seconds to wait for it."""
+        now = time.time()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = _refill(tokens, updated_at, now, per_minute, burst)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return _retry_after(tokens, per_minute)
+            self._buckets[key] = (tokens - 1, now)
+            if len(self._buckets) > self.max_entries:
+                self._evict(now)
+        return 0
+
+    def _evict(self, now):
+        # Caller must hold self._lock
+        for key in [key for key, (_, updated_at) in self._buckets.items() if now - updated_at > BUCKET_IDLE_SECONDS]:
+            del self._buckets[key]
+        if len(self._buckets) > self.max_entries:
+            self._buckets.clear() # Emptying gives everyone a full bucket, which is the safe side
+
+
+class SQLiteBuckets(object):
+    # Idle buckets are deleted every this many takes
+    EVICT_EVERY = 1000
+
+    def __init__(self, path):
+        # Buckets are worth nothing after a crash, so don't wait for the disk
+        self._db = LocalSQLite(
+            path,
+            'CREATE TABLE IF NOT EXISTS bucket ('
+            ' key TEXT PRIMARY KEY,'
+            ' tokens REAL NOT NULL,'
+            ' updated_at REAL NOT NULL)',
+            synchronous='OFF',
+        )
+        self._takes = 0
+
+    def take(self, key, per_minute, burst):
+        """Takes a token. Returns 0 if there was one, else the seconds to wait for it."""
+        connection = self._db.connect()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT tokens, updated_at FROM bucket WHERE key = ?', (key,)).fetchone()
+            tokens = _refill(row[0], row[1], now, per_minute, burst) if row else burst
+            wait = 0 if tokens >= 1 else _retry_after(tokens, per_minute)
+            connection.execute(
+                'INSERT INTO bucket (key, tokens, updated_at) VALUES (?, ?, ?)'
+                ' ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at',
+                (key, tokens - 1 if not wait else tokens, now),
+            )
+            self._takes += 1
+            if self._takes % self.EVICT_EVERY == 0:
+                connection.execute('DELETE FROM bucket WHERE updated_at < ?', (now - BUCKET_IDLE_SECONDS,))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return wait
+
+
+def _ip_key():
+    return 'ip:' + (request.remote_addr or '')
+
+
+def client_key():
+    """The session id if the browser sent a valid session cookie, else the IP address."""
+    sid = getattr(session, 'sid', None)
+    if sid and not getattr(session, 'new', True):
+        return 'session:' + sid
+    return _ip_key()
+
+
+def _budget_and_key(limits):
+    """The RATE_LIMITS budget name and the client key for the request, or None if it isn't limited."""
+    if request.endpoint in limits['exempt']:
+        return None
+
+    if request.endpoint in limits['admin_endpoints']:
+        admin_pin = current_app.config.get('ADMIN_PIN')
+        if session.get('admin_verified'):
+            return None
+        # A right PIN is let through, so a guesser on the same address can't lock the admin out
+        if admin_pin and (request.headers.get('Authorization') == f"Bearer {admin_pin}"
+                          or request.args.get('admin_pin') == admin_pin):
+            return None
+        return 'admin', _ip_key()
+
+    key = client_key()
+    access_pin = current_app.config.get('ACCESS_PIN')
+    if (key.startswith('ip:') and request.method == 'GET' and request.endpoint in limits['landing_endpoints']
+            and access_pin and request.args.get('access_pin') == access_pin):
+        return 'landing', key
+
+    budget_name = request.endpoint if request.endpoint in limits['budgets'] else None
+    if limits['budgets'][budget_name] is None:
+        return None
+    return budget_name, key
+
+
+def _limit_request():
+    limits = current_app.extensions['rate_limits']
+    limited = _budget_and_key(limits)
+    if limited is None:
+        return
+    budget_name, key = limited
+
+    per_minute, burst = limits['budgets'][budget_name]
+    try:
+        wait = limits['buckets'].take(f"{budget_name or 'default'}|{key}", per_minute, burst)
+    except sqlite3.Error as e:
+        # A limiter problem must not take the site down with it
+        print(f"Error checking the rate limit, request allowed: {e}")
+        return
+    if not wait:
+        return
+
+    message = "Muitas tentativas em pouco tempo. Espere alguns segundos e tente novamente."
+    if request.endpoint in limits['json_endpoints']:
+        response = jsonify(error=message)
+        response.status_code = 429
+    else:
+        response = cached_page('error.html', status=429, error_message=message)
+    response.headers['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+class AdmissionControl(object):
+    """WSGI middleware: 503 once max_in_flight requests are in flight in this process."""
+
+    def __init__(self, wsgi_app, max_in_flight, retry_after=1, exempt_paths=()):
+        self.wsgi_app = wsgi_app
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self.exempt_paths = tuple(exempt_paths)
+        self.in_flight = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO', '').startswith(self.exempt_paths):
+            return self.wsgi_app(environ, start_response)
+        with self._lock:
+            admitted = self.in_flight < self.max_in_flight
+            if admitted:
+                self.in_flight += 1
+            else:
+                self.rejected += 1
+        if not admitted:
+            body = "Estamos com muitos acessos agora. Tente novamente em alguns segundos.".encode('utf-8')
+            start_response('503 Service Unavailable', [
+                ('Content-Type', 'text/plain; charset=utf-8'),
+                ('Content-Length', str(len(body))),
+                ('Retry-After', str(self.retry_after)),
+                ('Cache-Control', 'no-store'),
+            ])
+            return [body]
+        try:
+            app_iter = self.wsgi_app(environ, start_response)
+        except BaseException:
+            self._release()
+            raise
+        # Streamed responses (exports, the live feed) stay in flight until they are closed
+        return ClosingIterator(app_iter, [self._release])
+
+
+def init_rate_limits(app, exempt=(), json_endpoints=(), admin_endpoints=(), landing_endpoints=()):
+    """Sets up rate limiting (app.extensions['rate_limits']) and admission control (app.extensions['admission']).
+
+    exempt endpoints are never limited; json_endpoints get a JSON 429 instead of the error page;
+    admin_endpoints and landing_endpoints get the 'admin' and 'landing' budgets described above.
+    """
+    backend = app.config.get('RATE_LIMIT_BACKEND', 'sqlite')
+    if backend == 'sqlite':
+        buckets = SQLiteBuckets(app.config.get('RATE_LIMIT_PATH') or os.path.join(app.instance_path, 'ratelimit.sqlite'))
+    elif backend == 'memory':
+        buckets = MemoryBuckets()
+    elif backend != 'off':
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
+
+    if backend != 'off':
+        app.extensions['rate_limits'] = {
+            'buckets': buckets,
+            'budgets': {**RATE_LIMITS, **(app.config.get('RATE_LIMITS') or {})},
+            'exempt': frozenset(exempt),
+            'admin_endpoints': frozenset(admin_endpoints),
+            'landing_endpoints': frozenset(landing_endpoints),
+            'json_endpoints': frozenset(json_endpoints),
+        }
+        app.before_request(_limit_request)
+
+    max_in_flight = int(app.config.get('ADMISSION_MAX_IN_FLIGHT') or 0)
+    if max_in_flight > 0:
+        # Static files and the metrics scrape are cheap and must keep working under load
+        admission = AdmissionControl(
+            app.wsgi_app,
+            max_in_flight,
+            retry_after=int(app.config.get('ADMISSION_RETRY_AFTER', 1)),
+            exempt_paths=(app.static_url_path + '/', '/metrics'),
+        )
+        app.wsgi_app = admission
+        app.extensions['admission'] = admission
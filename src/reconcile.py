@@ -0,0 +1,317 @@
+"""Pix reconciliation: matches bank statement lines to RSVPs.
+
+The statement (CSV or OFX, as exported by the bank) is read line by line and never held
+in memory. The RSVPs are loaded once into two hash indexes:
+    pix id (the txid generate_pix_payload derives from the names) -> RSVPs
+    amount in cents (15 * num_people)                             -> RSVPs, by time
+so each statement line costs a few dictionary lookups, not a scan of the RSVPs.
+
+A line is 'matched' when its description contains exactly one unpaid RSVP's pix id with
+the right amount, paid within the time window around the confirmation. Statement times
+are Brasília local time (STATEMENT_TIMEZONE) and are converted to UTC, like
+RSVP.timestamp, before they are compared. Everything else
+is 'ambiguous' (several candidates, a pix id with the wrong amount, an RSVP paid twice,
+or only amount and time fit) or 'unmatched', for a person to check.
+"""
+import bisect
+import csv
+import datetime
+import functools
+import io
+import re
+import uuid
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from .models import db, RSVP, PaymentMatch
+from .utils import pix_description, pix_id_for, split_names, normalize_name
+
+STATEMENT_TIMEZONE = 'America/Sao_Paulo' # Time zone of the dates in the bank's exports
+PRICE_PER_PERSON_CENTS = 1500
+DEFAULT_WINDOW_HOURS = 48
+SAVE_BATCH_SIZE = 1000
+MAX_CANDIDATES = 20 # Saved per ambiguous line
+
+# CSV header names (normalized) for each field, as used by Brazilian banks and in English
+CSV_COLUMNS = {
+    'posted_at': ('data', 'data lancamento', 'data do lancamento', 'data movimento', 'date', 'posted', 'dtposted'),
+    'amount': ('valor', 'valor (r$)', 'valor r$', 'amount', 'trnamt', 'credito', 'entrada'),
+    'description': ('descricao', 'historico', 'detalhes', 'identificador', 'memo', 'description', 'lancamento', 'name'),
+}
+DATE_FORMATS = ('%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y', '%d/%m/%y', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d')
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+_OFX_OFFSET = re.compile(r'\[([+-]?\d+(?:\.\d+)?)(?::[^\]]*)?\]')
+_WORD_SEPARATORS = re.compile(r'[\s/|;-]+')
+_OFX_TAG = re.compile(r'<(/?)(\w+)>([^<]*)')
+
+
+class StatementLine(object):
+    __slots__ = ('line_number', 'posted_at', 'amount', 'description')
+
+    def __init__(self, line_number, posted_at, amount, description):
+        self.line_number = line_number
+        self.posted_at = posted_at
+        self.amount = amount
+        self.description = description
+
+
+# --- Parsing ---
+
+def parse_amount(text):
+    """'1.234,56', '1234.56', 'R$ 30,00' -> Decimal."""
+    text = text.replace('R$', '').replace(' ', '').strip()
+    if ',' in text and text.rfind(',') > text.rfind('.'):
+        text = text.replace('.', '').replace(',', '.') # Brazilian format
+    else:
+        text = text.replace(',', '')
+    return Decimal(text)
+
+
+def parse_date(text, formats=DATE_FORMATS):
+    """Parses text with the first of formats that fits. A list of formats is reordered with that one first."""
+    text = text.strip()
+    for i, date_format in enumerate(formats):
+        try:
+            parsed = datetime.datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+        if i and isinstance(formats, list):
+            formats.insert(0, formats.pop(i))
+        return parsed
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def statement_timezone():
+    try:
+        return ZoneInfo(STATEMENT_TIMEZONE)
+    except ZoneInfoNotFoundError:
+        # No time zone database on this system (pip install tzdata); Brasília has had no
+        # daylight saving time since 2019
+        return datetime.timezone(datetime.timedelta(hours=-3))
+
+
+def statement_time_to_utc(posted_at):
+    """Naive local statement time -> naive UTC time, as RSVP.timestamp."""
+    if posted_at is None:
+        return None
+    return posted_at.replace(tzinfo=statement_timezone()).astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def parse_ofx_date(text):
+    # YYYYMMDD[HHMMSS[.XXX]][[-3:BRT]]. Returned in local time, like the CSV exports, so a
+    # date with another offset is moved to STATEMENT_TIMEZONE.
+    text = text.strip()
+    digits = text[:14]
+    try:
+        posted_at = datetime.datetime.strptime(digits, '%Y%m%d%H%M%S' if len(digits) == 14 else '%Y%m%d')
+    except ValueError:
+        return None
+    offset = _OFX_OFFSET.search(text)
+    if offset:
+        zone = datetime.timezone(datetime.timedelta(hours=float(offset.group(1))))
+        posted_at = posted_at.replace(tzinfo=zone).astimezone(statement_timezone()).replace(tzinfo=None)
+    return posted_at
+
+
+def _csv_field_indexes(header):
+    normalized = [normalize_name(column) for column in header]
+    indexes = {}
+    for field, names in CSV_COLUMNS.items():
+        for i, column in enumerate(normalized):
+            if column in names:
+                indexes[field] = i
+                break
+    missing = [field for field in ('amount', 'description') if field not in indexes]
+    if missing:
+        raise ValueError(f"Colunas não encontradas no extrato: {', '.join(missing)}")
+    return indexes
+
+
+def parse_csv_statement(text_stream):
+    """Yields StatementLines from a CSV export (',' or ';' separated, with a header row)."""
+    sample = text_stream.read(4096)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(_chain(sample, text_stream), dialect)
+
+    indexes = None
+    date_formats = list(DATE_FORMATS) # A statement uses one format, tried first once found
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        if indexes is None:
+            indexes = _csv_field_indexes(row)
+            continue
+        try:
+            amount = parse_amount(row[indexes['amount']])
+        except (InvalidOperation, IndexError):
+            continue # Balance lines, footers
+        posted_at = parse_date(row[indexes['posted_at']], date_formats) if 'posted_at' in indexes else None
+        yield StatementLine(reader.line_num, posted_at, amount, row[indexes['description']].strip())
+
+
+def _chain(sample, text_stream):
+    # Puts the sniffed sample back in front of the rest of the stream, line by line
+    rest = io.StringIO(sample + text_stream.readline())
+    yield from rest
+    yield from text_stream
+
+
+def parse_ofx_statement(text_stream):
+    """Yields StatementLines from an OFX export (SGML or XML flavor)."""
+    transaction = None
+    for line_number, line in enumerate(text_stream, start=1):
+        for closing, tag, value in _OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if not closing:
+                    transaction = {'line_number': line_number}
+                elif transaction is not None:
+                    line_item = _ofx_line(transaction)
+                    if line_item is not None:
+                        yield line_item
+                    transaction = None
+            elif transaction is not None and not closing:
+                transaction[tag] = value.strip()
+
+
+def _ofx_line(transaction):
+    try:
+        amount = Decimal(transaction.get('TRNAMT', '').replace(',', '.'))
+    except InvalidOperation:
+        return None
+    description = ' '.join(filter(None, (transaction.get('NAME'), transaction.get('MEMO'))))
+    return StatementLine(transaction['line_number'], parse_ofx_date(transaction.get('DTPOSTED', '')), amount, description)
+
+
+def parse_statement(text_stream, filename=''):
+    if filename.lower().endswith('.ofx'):
+        return parse_ofx_statement(text_stream)
+    return parse_csv_statement(text_stream)
+
+
+def open_statement(binary_stream):
+    """Text stream over an uploaded or opened statement: UTF-8, or Windows-1252 like many bank exports."""
+    buffered = io.BufferedReader(binary_stream) if not hasattr(binary_stream, 'peek') else binary_stream
+    sample = buffered.peek(65536)
+    try:
+        sample.decode('utf-8')
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut at the end of the sample is still UTF-8
+        encoding = 'utf-8-sig' if e.start > len(sample) - 4 else 'cp1252'
+    return io.TextIOWrapper(buffered, encoding=encoding, errors='replace', newline='')
+
+
+# --- Matching ---
+
+def match_key(text):
+    """Pix ids and statement words compared case- and accent-insensitively, letters and digits only."""
+    return _NON_ALNUM.sub('', normalize_name(text))
+
+
+class RSVPIndex(object):
+    def __init__(self, window_hours=DEFAULT_WINDOW_HOURS):
+        self.window = datetime.timedelta(hours=window_hours)
+        self.by_pix_id = defaultdict(list) # match key -> [(rsvp id, amount in cents, timestamp)]
+        self.by_amount = defaultdict(list) # amount in cents -> sorted [(timestamp, rsvp id)]
+        self.paid = set()
+
+    def load(self):
+        rows = db.session.query(RSVP.id, RSVP.names_str, RSVP.num_people, RSVP.timestamp).yield_per(5000)
+        for rsvp_id, names_str, num_people, timestamp in rows:
+            cents = PRICE_PER_PERSON_CENTS * num_people
+            key = match_key(pix_id_for(pix_description(split_names(names_str))))
+            if key:
+                self.by_pix_id[key].append((rsvp_id, cents, timestamp))
+            self.by_amount[cents].append((timestamp or datetime.datetime.min, rsvp_id))
+        for candidates in self.by_amount.values():
+            candidates.sort()
+        return self
+
+    def _in_window(self, timestamp, posted_at):
+        return posted_at is None or timestamp is None or abs(posted_at - timestamp) <= self.window
+
+    def match(self, line):
+        """Returns (status, rsvp id, candidate ids, note)."""
+        cents = int(line.amount * 100)
+        posted_at = statement_time_to_utc(line.posted_at)
+        description = normalize_name(line.description) # Once per line, not per word
+        words = {_NON_ALNUM.sub('', word) for word in _WORD_SEPARATORS.split(description)}
+        # Banks that show the payload description ("Ana Silva, Joao Souza") match as a whole
+        words.add(_NON_ALNUM.sub('', description))
+        words.discard('')
+
+        by_pix_id = [candidate for word in words for candidate in self.by_pix_id.get(word[:25], ())]
+        if by_pix_id:
+            fitting = sorted({
+                rsvp_id for rsvp_id, rsvp_cents, timestamp in by_pix_id
+                if rsvp_cents == cents and self._in_window(timestamp, posted_at)
+            })
+            unpaid = [rsvp_id for rsvp_id in fitting if rsvp_id not in self.paid]
+            if len(unpaid) == 1:
+                self.paid.add(unpaid[0])
+                return 'matched', unpaid[0], None, None
+            if len(unpaid) > 1:
+                return 'ambiguous', None, unpaid, "Mais de uma confirmação com este identificador"
+            if fitting:
+                return 'ambiguous', None, fitting, "Confirmação já paga por outra linha"
+            ids = sorted({rsvp_id for rsvp_id, _, _ in by_pix_id})
+            return 'ambiguous', None, ids, "Identificador encontrado, mas o valor ou a data não conferem"
+
+        # No pix id in the description (e.g. paid without the QR code): amount and time only
+        candidates = self.by_amount.get(cents, ())
+        if posted_at is not None and candidates:
+            start = bisect.bisect_left(candidates, (posted_at - self.window, -1))
+            end = bisect.bisect_right(candidates, (posted_at + self.window, float('inf')))
+            nearby = []
+            for i in range(start, min(end, len(candidates))):
+                if candidates[i][1] not in self.paid:
+                    nearby.append(candidates[i][1])
+                    if len(nearby) == MAX_CANDIDATES:
+                        break
+            if nearby:
+                return 'ambiguous', None, nearby, "Só valor e data conferem, sem identificador"
+        return 'unmatched', None, None, None
+
+
+def _save_matches(batch):
+    # Core executemany: the ORM bulk insert splits the batch whenever the None columns differ
+    db.session.execute(PaymentMatch.__table__.insert(), batch)
+
+
+def reconcile_statement(lines, window_hours=DEFAULT_WINDOW_HOURS):
+    """Matches the statement lines and saves the results. Returns (run id, counts per status)."""
+    index = RSVPIndex(window_hours).load()
+    run_id = uuid.uuid4().hex
+    counts = {'matched': 0, 'ambiguous': 0, 'unmatched': 0}
+    batch = []
+    for line in lines:
+        if line.amount <= 0:
+            continue # Payments made, not received
+        status, rsvp_id, candidate_ids, note = index.match(line)
+        counts[status] += 1
+        batch.append({
+            'run_id': run_id,
+            'line_number': line.line_number,
+            'posted_at': line.posted_at,
+            'amount': line.amount,
+            'description': line.description[:500],
+            'status': status,
+            'rsvp_id': rsvp_id,
+            'candidate_ids': ",".join(map(str, candidate_ids))[:200] if candidate_ids else None,
+            'note': note,
+            'created_at': datetime.datetime.utcnow(),
+        })
+        if len(batch) >= SAVE_BATCH_SIZE:
+            _save_matches(batch)
+            batch = []
+    if batch:
+        _save_matches(batch)
+    db.session.commit()
+    return run_id, counts
@@ -1,22 +1,24 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, current_app
-import re # Add re for regex validation
-
-from .models import db, RSVP
-from .utils import generate_pix_payload
+from flask import Blueprint, render_template, request, redirect, url_for, session, current_app, abort, stream_with_context, jsonify
+import csv
+import datetime
+import secrets
+from sqlalchemy import func
+
+from .models import db, RSVP, Guest, PaymentMatch, save_rsvps, count_repeated_rsvp
+from .utils import generate_pix_payload, get_pix_qr_png, render_qr_png, normalize_name, pix_description
+from .exports import parse_export_filters, csv_chunks, jsonl_chunks, gzip_chunks
+from .metrics import timed
+from .pagecache import cached_page
+from .live import POLL_INTERVAL, RECONNECT_MS, publish_rsvps, rsvp_stream
+from .reconcile import DEFAULT_WINDOW_HOURS, open_statement, parse_statement, reconcile_statement
+from .catalog import current_catalog
+from .validators import validate_num_people, validate_names, validate_phone, form_names
+from .qrpool import QRPoolBusy
 
 
 rsvp_bp = Blueprint('rsvp', __name__, template_folder='../templates')
 
-# Hardcoded city and group data
-CITY_GROUP_OPTIONS = {
-    "São José dos Campos": ["Família do Yuri", "Cia. do Trailer", "Teatro da Cidade", "Família Froes", "Chicos e Chicas", "Javanês"],
-    "Taubaté": ["Família da Laura", "Café 🏳️‍🌈", "Impostoras","Primos e Agregados","Dança Comigo","Mariposa Brasileiro","Med Lucinda"]
-}
-
-@rsvp_bp.route('/', methods=['GET', 'POST'])
-@rsvp_bp.route('/welcome')
-def welcome():
-    # Clear any existing session data when the user lands on the welcome page
+def _clear_rsvp_session():
     session.pop('city', None)
     session.pop('group', None)
     session.pop('number_of_people', None)
@@ -24,19 +26,34 @@ def welcome():
     session.pop('phone_number', None)
     session.pop('pix_qr_code', None) 
     session.pop('amount', None)
-    return render_template('welcome.html')
+    session.pop('confirmation_token', None)
+
+def _issue_confirmation_token():
+    # One token per RSVP in progress; every confirmation request for it carries the same token
+    if 'confirmation_token' not in session:
+        session['confirmation_token'] = secrets.token_urlsafe(16)
+
+@rsvp_bp.route('/', methods=['GET', 'POST'])
+@rsvp_bp.route('/welcome')
+def welcome():
+    # Clear any existing session data when the user lands on the welcome page
+    _clear_rsvp_session()
+    return cached_page('welcome.html')
 
 
 @rsvp_bp.route('/city', methods=['GET', 'POST'])
 def select_city():
+    catalog = current_catalog()
     if request.method == 'POST':
         city = request.form.get('city')
-        if city and city in CITY_GROUP_OPTIONS:
+        if catalog.is_city(city):
             session['city'] = city
             return redirect(url_for('rsvp.select_group'))
         else:
             error = "Por favor, selecione uma cidade válida."
-            return render_template('city_selection.html', cities=CITY_GROUP_OPTIONS.keys(), error=error)
+            # Not cached: the error and the submitted value are specific to this guest
+            return render_template('city_selection.html', city_options=catalog.city_options(city or session.get('city')),
+                                   error=error)
     
     # Session clearing moved to the welcome route
     # session.pop('city', None)
@@ -45,7 +62,8 @@ def select_city():
     # session.pop('names', None)
     # session.pop('phone_number', None)
 
-    return render_template('city_selection.html', cities=CITY_GROUP_OPTIONS.keys())
+    # The previously chosen city is preselected, so the options are part of the cache key
+    return cached_page('city_selection.html', city_options=catalog.city_options(session.get('city')))
 
 @rsvp_bp.route('/group', methods=['GET', 'POST'])
 def select_group():
@@ -53,22 +71,22 @@ def select_group():
         return redirect(url_for('rsvp.select_city'))
 
     city = session['city']
-    groups = CITY_GROUP_OPTIONS.get(city, [])
+    catalog = current_catalog()
 
     if request.method == 'POST':
         group = request.form.get('group')
-        if group and group in groups:
+        if catalog.is_group(city, group):
             session['group'] = group
             return redirect(url_for('rsvp.number_of_people'))
         else:
             error = "Por favor, selecione um grupo válido."
-            return render_template('group_selection.html', city=city, groups=groups, error=error)
+            return render_template('group_selection.html', group_options=catalog.group_options(city, group), error=error)
 
     session.pop('group', None)
     session.pop('number_of_people', None)
     session.pop('names', None)
     session.pop('phone_number', None)
-    return render_template('group_selection.html', city=city, groups=groups)
+    return render_template('group_selection.html', group_options=catalog.group_options(city))
 
 @rsvp_bp.route('/names', methods=['GET', 'POST'])
 def names_form():
@@ -78,36 +96,18 @@ def names_form():
         return redirect(url_for('rsvp.select_city'))
 
     num_people = session['number_of_people']
-    # Regex to allow letters (including accented) and spaces. Allows empty strings initially, 
-    # but the 'not name' check below handles empty required fields.
-    name_pattern = re.compile(r"^[a-zA-Z ]+$")
 
     if request.method == 'POST':
-        names = []
-        error_message = None
-        submitted_names = [request.form.get(f'name_{k}') or "" for k in range(1, num_people + 1)]
-
-        for i in range(1, num_people + 1):
-            name = request.form.get(f'name_{i}')
-            
-            if not name:
-                error_message = f"Por favor, informe o nome da pessoa {i}."
-                return render_template('names_form.html',
-                                       num_people=num_people,
-                                       error=error_message,
-                                       names=submitted_names)
-            
-            # Validate name format
-            if not name_pattern.match(name):
-                error_message = f"O nome da pessoa {i} ('{name}') deve conter apenas letras (sem acentos) e espaços."
-                return render_template('names_form.html',
-                                       num_people=num_people,
-                                       error=error_message,
-                                       names=submitted_names)
-
-            names.append(name)
+        submitted_names = form_names(request.form, num_people)
+
+        error_message = validate_names(submitted_names)
+        if error_message:
+            return render_template('names_form.html',
+                                   num_people=num_people,
+                                   error=error_message,
+                                   names=submitted_names)
         
-        session['names'] = names
+        session['names'] = submitted_names
         return redirect(url_for('rsvp.contact_form'))
 
     retrieved_names = session.get('names', [])
@@ -134,13 +134,7 @@ def contact_form():
 
     if request.method == 'POST':
         phone_number = request.form.get('phone_number')
-        error = None
-        if not phone_number:
-            error = "Por favor, informe seu telefone para contato."
-        elif not phone_number.isdigit():
-            error = "O telefone deve conter apenas números."
-        elif len(phone_number) > 20:
-            error = "O telefone deve ter no máximo 20 dígitos."
+        error = validate_phone(phone_number)
         
         if error:
             return render_template('contact_phone_form.html', error=error, phone_number=phone_number)
@@ -151,6 +145,15 @@ def contact_form():
     phone_number = session.get('phone_number', '')
     return render_template('contact_phone_form.html', phone_number=phone_number)
 
+def _session_pix_payload():
+    # The payload is derived from the session on demand (and cached in utils) instead of
+    # being stored in the session
+    with timed('pix'):
+        return generate_pix_payload(
+            amount=session['number_of_people'],
+            names=pix_description(session['names'])
+        )
+
 @rsvp_bp.route('/pix-payment', methods=['GET'])
 def pix_payment_form():
     if 'number_of_people' not in session or 'names' not in session or 'phone_number' not in session:
@@ -165,24 +168,15 @@ def pix_payment_form():
         return redirect(url_for('rsvp.select_city')) 
 
     num_people = session['number_of_people']
-    names = session['names']
     
     amount = 15 * num_people
     amount_str = f"{amount:.2f}"
     
-    pix_description = ", ".join(names)
-    if len(pix_description) > 70:
-        pix_description = pix_description[:67] + "..."
-
-    pix_payload, pix_image_b64 = generate_pix_payload(
-        amount=num_people,
-        names=pix_description
-    )
-    
+    pix_payload, qr_digest = _session_pix_payload()
     
-    session['amount'] = amount
-    session['pix_payload'] = pix_payload
-    session['pix_description'] = pix_description
+    if session.get('amount') != amount: # Avoid rewriting the stored session on every reload
+        session['amount'] = amount
+    _issue_confirmation_token()
 
     payment_instructions = (
         "Estamos arrecadando 15 reais por convidados. Teremos comidas de Festa Junina, Quentão e Vinho Quente.<br><br>"
@@ -193,63 +187,105 @@ def pix_payment_form():
 
     return render_template(
         'pix_payment.html',
-        qr_image=pix_image_b64,
+        qr_image=url_for('rsvp.pix_qr', digest=qr_digest),
         pix_payload=pix_payload,
         amount_str=amount_str,
         instructions=payment_instructions
     )
 
-@rsvp_bp.route('/confirmation')
-def confirmation():
-    required_session_keys = ['city', 'group', 'number_of_people', 'names', 'phone_number', 'pix_description', 'amount']
-    for key in required_session_keys:
-        if key not in session:
-            print(f"Missing session key: {key} during confirmation step.")
-            return redirect(url_for('rsvp.select_city')) 
-
-    city = session.get('city')
-    group = session.get('group')
-    num_people = session.get('number_of_people')
-    names = session.get('names')
-    phone_number = session.get('phone_number')
-
-    # For database storage
-    names_str_db = ", ".join(names)
-
+@rsvp_bp.route('/pix-qr/<digest>.png')
+def pix_qr(digest):
+    # The URL is content-addressed (digest of the Pix payload), so the image never changes
+    # and can be cached for as long as the browser or a proxy likes.
+    if request.if_none_match.contains(digest):
+        response = current_app.response_class(status=304)
+    else:
+        # Rendered in the QR process pool if there is one, so the worker keeps serving meanwhile
+        qr_pool = current_app.extensions.get('qr_pool')
+        render_png = qr_pool.render if qr_pool is not None else render_qr_png
+        try:
+            with timed('pix'):
+                png = get_pix_qr_png(digest, render_png=render_png)
+            if png is None and 'names' in session and 'number_of_people' in session:
+                # Not in this worker's cache (evicted, or the page came from another worker)
+                pix_payload, _ = _session_pix_payload()
+                with timed('pix'):
+                    png = get_pix_qr_png(digest, payload_string=pix_payload, render_png=render_png)
+        except QRPoolBusy:
+            response = current_app.response_class("QR Code indisponível no momento, recarregue a página.", status=503, mimetype='text/plain')
+            response.headers['Retry-After'] = '1'
+            response.cache_control.no_store = True
+            return response
+        if png is None:
+            abort(404)
+        response = current_app.response_class(png, mimetype='image/png')
+    response.set_etag(digest)
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response
+
+# Everything confirmation needs from the earlier steps
+REQUIRED_SESSION_KEYS = ['city', 'group', 'number_of_people', 'names', 'phone_number', 'amount']
+
+def _display_names(names):
     # For display on the confirmation page
     if not names: # Should not happen if validation is correct
-        display_names = ""
+        return ""
     elif len(names) == 1:
-        display_names = names[0]
+        return names[0]
     elif len(names) == 2:
-        display_names = " e ".join(names)
+        return " e ".join(names)
     else:
-        display_names = ", ".join(names[:-1]) + " e " + names[-1]
+        return ", ".join(names[:-1]) + " e " + names[-1]
+
+def _save_session_rsvp():
+    """Saves the RSVP described by the session, once per confirmation token.
+
+    Returns {'rsvp_id': ..., 'queued': ...}, or None if the write failed. In write-behind
+    mode the RSVP is only queued in the journal and its id isn't known yet.
+    """
+    names = session['names']
+    rsvp = {
+        'timestamp': datetime.datetime.utcnow(),
+        'city': session['city'],
+        'group': session['group'],
+        'num_people': session['number_of_people'],
+        'names': names,
+        'phone': session['phone_number'],
+        # Sessions started before tokens existed get one here, they just aren't protected against repeats
+        'confirmation_token': session.get('confirmation_token') or secrets.token_urlsafe(16),
+    }
+    journal = current_app.extensions.get('rsvp_journal')
 
     try:
-        new_rsvp = RSVP(
-            city=city,
-            group=group,
-            num_people=num_people,
-            names_str=names_str_db, # Use the original comma-separated string for DB
-            phone=phone_number,
-        )
-        db.session.add(new_rsvp)
+        if journal is not None and journal.append(rsvp):
+            print(f"RSVP data queued for the database: {', '.join(names)}")
+            return {'rsvp_id': None, 'queued': True}
+        ids = save_rsvps([rsvp])
         db.session.commit()
-        print(f"RSVP data saved to database: {names_str_db}")
+        print(f"RSVP data saved to database: {', '.join(names)}")
+        publish_rsvps([rsvp], ids) # Live admin page
+        return {'rsvp_id': ids[rsvp['confirmation_token']], 'queued': False}
     except Exception as e:
         db.session.rollback()
         print(f"Error saving RSVP to database: {e}")
-        return render_template('error.html', error_message="Ocorreu um erro ao salvar sua confirmação. Por favor, tente novamente. Se já fez o Pix, não precisa fazer novamente, apenas clique em Fiz o Pix!")
+        return None
 
-    session.pop('city', None)
-    session.pop('group', None)
-    session.pop('number_of_people', None)
-    session.pop('names', None)
-    session.pop('phone_number', None)
-    session.pop('pix_qr_code', None) 
-    session.pop('amount', None)
-    session.pop('pix_description', None)
+@rsvp_bp.route('/confirmation')
+def confirmation():
+    for key in REQUIRED_SESSION_KEYS:
+        if key not in session:
+            print(f"Missing session key: {key} during confirmation step.")
+            return redirect(url_for('rsvp.select_city')) 
+
+    num_people = session.get('number_of_people')
+    display_names = _display_names(session.get('names'))
+
+    if _save_session_rsvp() is None:
+        return cached_page('error.html', error_message="Ocorreu um erro ao salvar sua confirmação. Por favor, tente novamente. Se já fez o Pix, não precisa fazer novamente, apenas clique em Fiz o Pix!")
+
+    _clear_rsvp_session()
 
     event_address = current_app.config.get('EVENT_ADDRESS', 'LOCAL A SER DEFINIDO') # Get address from config
 
@@ -262,21 +298,12 @@ def number_of_people():
 
     if request.method == 'POST':
         num_people_str = request.form.get('num_people')
-        error = None
-        if not num_people_str:
-            error = "Por favor, informe o número de pessoas."
-        else:
-            try:
-                num_people = int(num_people_str)
-                if not 1 <= num_people <= 10:
-                    error = "O número de pessoas deve ser entre 1 e 10."
-                else:
-                    if session.get('number_of_people') != num_people:
-                        session.pop('names', None)
-                    session['number_of_people'] = num_people
-                    return redirect(url_for('rsvp.names_form'))
-            except ValueError:
-                error = "Por favor, insira um número válido."
+        num_people, error = validate_num_people(num_people_str)
+        if not error:
+            if session.get('number_of_people') != num_people:
+                session.pop('names', None)
+            session['number_of_people'] = num_people
+            return redirect(url_for('rsvp.names_form'))
 
         if error:
             return render_template('number_of_people.html', error=error, num_people=num_people_str)
@@ -284,28 +311,345 @@ def number_of_people():
     num_people_value = session.get('number_of_people', '') 
     return render_template('number_of_people.html', num_people=num_people_value)
 
+# --- JSON API ---
+# The same funnel in two requests, for clients on slow connections: /api/rsvp validates
+# everything and returns the Pix payment, /api/rsvp/confirm saves the RSVP after the Pix.
+# The validated data is kept in the session like in the HTML steps, so the QR image URL
+# and the HTML pages keep working for the same guest.
+
+def _api_error(message, field, status=400):
+    return jsonify(error=message, field=field), status
+
+@rsvp_bp.route('/api/rsvp', methods=['POST'])
+def api_rsvp():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return _api_error("Envie os dados da confirmação em JSON.", None)
+
+    catalog = current_catalog()
+    city = data.get('city')
+    if not isinstance(city, str) or not catalog.is_city(city):
+        return _api_error("Por favor, selecione uma cidade válida.", 'city')
+    group = data.get('group')
+    if not isinstance(group, str) or not catalog.is_group(city, group):
+        return _api_error("Por favor, selecione um grupo válido.", 'group')
+
+    num_people = data.get('num_people')
+    if isinstance(num_people, (bool, float)): # int() would silently accept them
+        num_people = str(num_people)
+    num_people, error = validate_num_people(num_people)
+    if error:
+        return _api_error(error, 'num_people')
+
+    names = data.get('names')
+    if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+        return _api_error("Por favor, informe os nomes em uma lista.", 'names')
+    names = names + [""] * (num_people - len(names)) # Missing names get the usual "informe o nome" error
+    error = validate_names(names)
+    if error:
+        return _api_error(error, 'names')
+    if len(names) > num_people:
+        return _api_error(f"Informe exatamente {num_people} nome(s).", 'names')
+
+    phone_number = data.get('phone_number')
+    if not isinstance(phone_number, str):
+        phone_number = None
+    error = validate_phone(phone_number)
+    if error:
+        return _api_error(error, 'phone_number')
+
+    _clear_rsvp_session()
+    session['city'] = city
+    session['group'] = group
+    session['number_of_people'] = num_people
+    session['names'] = names
+    session['phone_number'] = phone_number
+    session['amount'] = 15 * num_people
+    _issue_confirmation_token()
+
+    pix_payload, qr_digest = _session_pix_payload()
+    return jsonify(
+        amount=session['amount'],
+        amount_str=f"{session['amount']:.2f}",
+        pix_payload=pix_payload,
+        qr_image=url_for('rsvp.pix_qr', digest=qr_digest),
+        confirm_url=url_for('rsvp.api_rsvp_confirm'),
+        confirmation_token=session['confirmation_token'],
+    )
+
+def _repeated_api_confirmation(token):
+    """A confirmation of an RSVP that was already saved or queued: counts the repeat like save_rsvps does.
+
+    Returns {'rsvp_id': ..., 'queued': ..., 'names': [...], 'num_people': ...}, or None if the token is unknown.
+    Needs the journal checked first: a flush commits the RSVPs before deleting them from the journal.
+    """
+    journal = current_app.extensions.get('rsvp_journal')
+    if journal is not None:
+        rsvp = journal.count_repeat(token)
+        if rsvp is not None:
+            return {'rsvp_id': None, 'queued': True, 'names': rsvp['names'], 'num_people': rsvp['num_people']}
+    rsvp_id = count_repeated_rsvp(token)
+    if rsvp_id is None:
+        return None
+    db.session.commit()
+    rsvp = db.session.get(RSVP, rsvp_id)
+    names = [guest.name for guest in sorted(rsvp.guests, key=lambda guest: guest.id)]
+    return {'rsvp_id': rsvp_id, 'queued': False, 'names': names, 'num_people': rsvp.num_people}
+
+@rsvp_bp.route('/api/rsvp/confirm', methods=['POST'])
+def api_rsvp_confirm():
+    save_error = "Ocorreu um erro ao salvar sua confirmação. Por favor, tente novamente. Se já fez o Pix, não precisa fazer novamente."
+    # The token returned by /api/rsvp. A client that lost the 201 and retries gets it again
+    # with the same rsvp_id, instead of a 409 because the RSVP already left the session.
+    data = request.get_json(silent=True)
+    token = data.get('confirmation_token') if isinstance(data, dict) else None
+    if isinstance(token, str) and token != session.get('confirmation_token'):
+        try:
+            saved = _repeated_api_confirmation(token)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error counting a repeated confirmation: {e}")
+            return jsonify(error=save_error), 500
+        if saved is None:
+            return _api_error("Confirmação não encontrada, envie os dados para /api/rsvp primeiro.", 'confirmation_token', 409)
+        names, num_people = saved['names'], saved['num_people']
+    else:
+        for key in REQUIRED_SESSION_KEYS:
+            if key not in session:
+                return _api_error("Nenhuma confirmação em andamento, envie os dados para /api/rsvp primeiro.", key, 409)
+
+        names, num_people = session['names'], session['number_of_people']
+        saved = _save_session_rsvp()
+        if saved is None:
+            return jsonify(error=save_error), 500
+        _clear_rsvp_session()
+
+    return jsonify(
+        rsvp_id=saved['rsvp_id'],
+        queued=saved['queued'],
+        names=_display_names(names),
+        num_people=num_people,
+        event_address=current_app.config.get('EVENT_ADDRESS', 'LOCAL A SER DEFINIDO'),
+    ), 201
+
+# Number of RSVPs listed per group before the "Carregar mais" button
+GUESTS_PAGE_SIZE = 50
+
+def _group_rsvps_page(city, group, page):
+    """Returns one page of RSVPs for a group (only the displayed columns) and whether there are more."""
+    rows = (
+        db.session.query(RSVP.timestamp, RSVP.names_str, RSVP.num_people, RSVP.phone)
+        .filter(RSVP.city == city, RSVP.group == group)
+        .order_by(RSVP.timestamp, RSVP.id)
+        .offset((page - 1) * GUESTS_PAGE_SIZE)
+        .limit(GUESTS_PAGE_SIZE + 1)
+        .all()
+    )
+    return rows[:GUESTS_PAGE_SIZE], len(rows) > GUESTS_PAGE_SIZE
+
 @rsvp_bp.route('/confirmed-guests')
 def confirmed_guests():
-    # Get all RSVPs ordered by city and group
-    rsvps = RSVP.query.order_by(RSVP.city, RSVP.group, RSVP.timestamp).all()
-    
-    # Calculate total number of people
-    total_people = sum(rsvp.num_people for rsvp in rsvps)
-    
-    # Group RSVPs by city and group for better display
+    # Totals are computed by the database; only the first page of each group is loaded
+    group_totals = (
+        db.session.query(RSVP.city, RSVP.group, func.sum(RSVP.num_people), func.count(RSVP.id))
+        .group_by(RSVP.city, RSVP.group)
+        .order_by(RSVP.city, RSVP.group)
+        .all()
+    )
+
+    total_people = 0
+    total_rsvps = 0
     grouped_rsvps = {}
-    for rsvp in rsvps:
-        city = rsvp.city
-        group = rsvp.group
-        
-        if city not in grouped_rsvps:
-            grouped_rsvps[city] = {}
-        if group not in grouped_rsvps[city]:
-            grouped_rsvps[city][group] = []
-            
-        grouped_rsvps[city][group].append(rsvp)
-    
+    for city, group, group_people, group_rsvps in group_totals:
+        rsvps, has_more = _group_rsvps_page(city, group, 1)
+        grouped_rsvps.setdefault(city, {})[group] = {
+            'total_people': group_people,
+            'rsvps': rsvps,
+            'has_more': has_more,
+        }
+        total_people += group_people
+        total_rsvps += group_rsvps
+
+    # The live stream sends the RSVPs after this one
+    max_rsvp_id = db.session.query(func.max(RSVP.id)).scalar() or 0
+
     return render_template('confirmed_guests.html', 
                          total_people=total_people, 
                          grouped_rsvps=grouped_rsvps,
-                         total_rsvps=len(rsvps)) 
\ No newline at end of file
+                         total_rsvps=total_rsvps,
+                         max_rsvp_id=max_rsvp_id,
+                         live_reconnect_ms=max(POLL_INTERVAL * 1000, RECONNECT_MS))
+
+@rsvp_bp.route('/confirmed-guests/live')
+def confirmed_guests_live():
+    # Server-Sent Events with each new RSVP, see live.py. since is the last RSVP on the page;
+    # EventSource reconnects to the same URL and adds Last-Event-ID
+    since = request.args.get('since', 0, type=int)
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    # Sync workers (one request at a time, wsgi.multithread false) poll instead of holding a stream
+    poll_only = not request.environ.get('wsgi.multithread')
+    return current_app.response_class(
+        stream_with_context(rsvp_stream(since, last_event_id, poll_only=poll_only)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'}, # No proxy buffering (nginx)
+    )
+
+@rsvp_bp.route('/confirmed-guests/rows')
+def confirmed_guests_rows():
+    # Next page of a group's table, loaded by the "Carregar mais" button
+    city = request.args.get('city', '')
+    group = request.args.get('group', '')
+    page = request.args.get('page', 2, type=int)
+    if page < 1:
+        abort(400)
+
+    rsvps, has_more = _group_rsvps_page(city, group, page)
+    response = current_app.make_response(render_template('confirmed_guests_rows.html', rsvps=rsvps))
+    response.headers['X-Has-More'] = '1' if has_more else '0'
+    return response
+
+@rsvp_bp.route('/confirmed-guests/duplicates')
+def duplicate_confirmations():
+    # RSVPs that received repeated confirmations (reloads, double taps), which were not saved again
+    rsvps = (
+        db.session.query(RSVP.timestamp, RSVP.city, RSVP.group, RSVP.names_str, RSVP.num_people, RSVP.duplicate_count)
+        .filter(RSVP.duplicate_count > 0)
+        .order_by(RSVP.duplicate_count.desc(), RSVP.timestamp)
+        .all()
+    )
+    total_duplicates = sum(rsvp.duplicate_count for rsvp in rsvps)
+    return render_template('duplicate_confirmations.html', rsvps=rsvps, total_duplicates=total_duplicates)
+
+@rsvp_bp.route('/confirmed-guests/reconcile', methods=['GET', 'POST'])
+def reconcile_payments():
+    # Upload of the bank statement; the file is read as a stream, never saved to disk
+    error = None
+    if request.method == 'POST':
+        statement = request.files.get('statement')
+        if not statement or not statement.filename:
+            error = "Escolha o arquivo do extrato (CSV ou OFX)."
+        else:
+            try:
+                run_id, _ = reconcile_statement(
+                    parse_statement(open_statement(statement.stream), statement.filename),
+                    request.form.get('window_hours', DEFAULT_WINDOW_HOURS, type=int),
+                )
+                return redirect(url_for('rsvp.reconcile_results', run_id=run_id))
+            except (ValueError, UnicodeError, csv.Error) as e:
+                # Malformed upload (not a statement, NUL bytes, unknown columns...)
+                db.session.rollback()
+                error = f"Não foi possível ler o extrato: {e}"
+
+    # Previous runs, newest first
+    runs = (
+        db.session.query(PaymentMatch.run_id, func.min(PaymentMatch.created_at).label('created_at'), func.count(PaymentMatch.id).label('lines'))
+        .group_by(PaymentMatch.run_id)
+        .order_by(func.min(PaymentMatch.created_at).desc())
+        .limit(20)
+        .all()
+    )
+    return render_template('reconcile_payments.html', error=error, runs=runs, window_hours=DEFAULT_WINDOW_HOURS)
+
+# Statement lines shown on the results page; the rest is in the counts
+RECONCILE_RESULTS_LIMIT = 1000
+RECONCILE_STATUS_ORDER = {'ambiguous': 0, 'unmatched': 1, 'matched': 2}
+
+@rsvp_bp.route('/confirmed-guests/reconcile/<run_id>')
+def reconcile_results(run_id):
+    counts = dict(
+        db.session.query(PaymentMatch.status, func.count(PaymentMatch.id))
+        .filter(PaymentMatch.run_id == run_id)
+        .group_by(PaymentMatch.status)
+        .all()
+    )
+    if not counts:
+        abort(404)
+    # Lines that need a person first
+    status_order = db.case(RECONCILE_STATUS_ORDER, value=PaymentMatch.status)
+    matches = (
+        db.session.query(PaymentMatch, RSVP.names_str, RSVP.num_people)
+        .outerjoin(RSVP, PaymentMatch.rsvp_id == RSVP.id)
+        .filter(PaymentMatch.run_id == run_id)
+        .order_by(status_order, PaymentMatch.line_number)
+        .limit(RECONCILE_RESULTS_LIMIT)
+        .all()
+    )
+    total_matched = counts.get('matched', 0)
+    # Confirmations without a matched payment in this statement
+    unpaid = (
+        db.session.query(func.count(RSVP.id))
+        .filter(~db.exists().where(PaymentMatch.rsvp_id == RSVP.id, PaymentMatch.run_id == run_id))
+        .scalar()
+    )
+    return render_template(
+        'reconcile_results.html',
+        run_id=run_id,
+        counts=counts,
+        matches=matches,
+        total_lines=sum(counts.values()),
+        total_matched=total_matched,
+        unpaid=unpaid,
+        limit=RECONCILE_RESULTS_LIMIT,
+    )
+
+# Maximum number of results returned by the guest search
+GUEST_SEARCH_LIMIT = 50
+
+@rsvp_bp.route('/confirmed-guests/search')
+def search_guests():
+    # Prefix search on the normalized name, written as a range so the index is used
+    prefix = normalize_name(request.args.get('q', ''))
+    if not prefix:
+        return jsonify(guests=[])
+    upper_bound = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+    rows = (
+        db.session.query(Guest.name, RSVP.id, RSVP.city, RSVP.group, RSVP.timestamp)
+        .join(RSVP, Guest.rsvp_id == RSVP.id)
+        .filter(Guest.name_normalized >= prefix, Guest.name_normalized < upper_bound)
+        .order_by(Guest.name_normalized)
+        .limit(GUEST_SEARCH_LIMIT)
+        .all()
+    )
+    return jsonify(guests=[
+        {
+            'name': row.name,
+            'rsvp_id': row.id,
+            'city': row.city,
+            'group': row.group,
+            'timestamp': row.timestamp.isoformat(sep=' ', timespec='seconds') if row.timestamp else None,
+        }
+        for row in rows
+    ])
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', csv_chunks),
+    'jsonl': ('application/x-ndjson', jsonl_chunks),
+}
+
+@rsvp_bp.route('/confirmed-guests.<export_format>')
+def confirmed_guests_export(export_format):
+    if export_format not in EXPORT_FORMATS:
+        abort(404)
+    try:
+        filters = parse_export_filters(request.args)
+    except ValueError:
+        abort(400, "Parâmetro 'since' inválido, use o formato AAAA-MM-DD.")
+
+    mimetype, chunks_function = EXPORT_FORMATS[export_format]
+    chunks = chunks_function(filters)
+    headers = {
+        'Content-Disposition': f'attachment; filename=confirmados.{export_format}',
+        'Cache-Control': 'no-store',
+        'Vary': 'Accept-Encoding',
+    }
+    if 'gzip' in request.accept_encodings:
+        headers['Content-Encoding'] = 'gzip'
+        chunks = gzip_chunks(chunks)
+
+    # Rows are written as they are read from the database, so memory use doesn't grow with the table
+    return current_app.response_class(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers=headers,
+    )
@@ -0,0 +1,227 @@
+"""Server-side session storage.
+
+The cookie only carries a random session id; the session data lives in one of the stores
+below, selected by the SESSION_BACKEND config value:
+    'sql'    - table in the app database (SQLite or Postgres), shared by all workers (default)
+    'memory' - dict in the worker process, only for a single-process server (dev)
+    'redis'  - any Redis-compatible server at SESSION_REDIS_URL (needs the redis package)
+    'cookie' - Flask's default signed cookie session
+
+'sql' costs a primary key read per request, and a write when the session changed. It
+stays the default because the rate limiter keys guests by session id (see ratelimit.py),
+which the cookie session doesn't have; without it guests behind one carrier NAT share
+one budget. 'memory' is as fast as 'cookie' but isn't shared by gunicorn workers.
+The session id is replaced when a PIN is accepted (regenerate_session_id). Like Flask's
+own session, the cookie only outlives the browser when session.permanent is set; the
+stored data expires after SESSION_LIFETIME either way.
+"""
+import datetime
+import secrets
+import threading
+import time
+
+from flask import session
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from .models import db, ServerSession
+
+_serializer = TaggedJSONSerializer()
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.previous_sid = None
+
+    def regenerate(self):
+        """Moves the data to a new session id, so an id set before login (fixation) is worthless."""
+        if self.sid is None:
+            return
+        if not self.new:
+            self.previous_sid = self.sid
+        self.sid = secrets.token_urlsafe(24)
+        self.new = True
+        self.modified = True
+
+
+def regenerate_session_id():
+    """Gives the current session a new id when it gains access. The cookie backend has no id to change."""
+    regenerate = getattr(session, 'regenerate', None)
+    if regenerate is not None:
+        regenerate()
+
+
+class MemorySessionStore(object):
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._data = {}  # sid -> (expires_at, serialized data)
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            item = self._data.get(sid)
+        if item is None:
+            return None
+        expires_at, data = item
+        if expires_at < time.time():
+            self.delete(sid)
+            return None
+        return data
+
+    def set(self, sid, data, ttl):
+        with self._lock:
+            self._data[sid] = (time.time() + ttl, data)
+            if len(self._data) > self.max_entries:
+                self._evict()
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def _evict(self):
+        # Caller must hold self._lock. Drops expired sessions, then the oldest ones if still full
+        now = time.time()
+        for sid in [sid for sid, (expires_at, _) in self._data.items() if expires_at < now]:
+            del self._data[sid]
+        overflow = len(self._data) - self.max_entries
+        if overflow > 0:
+            oldest = sorted(self._data, key=lambda sid: self._data[sid][0])[:overflow]
+            for sid in oldest:
+                del self._data[sid]
+
+
+class SQLSessionStore(object):
+    # Expired rows are deleted every this many writes
+    EVICT_EVERY = 200
+
+    def __init__(self):
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _now(self):
+        return datetime.datetime.utcnow()
+
+    # Each call uses its own connection so it never commits (or rolls back) the view's db.session
+    def get(self, sid):
+        table = ServerSession.__table__
+        with db.engine.connect() as connection:
+            return connection.execute(
+                db.select(table.c.data).where(table.c.sid == sid, table.c.expires_at > self._now())
+            ).scalar()
+
+    def set(self, sid, data, ttl):
+        table = ServerSession.__table__
+        expires_at = self._now() + datetime.timedelta(seconds=ttl)
+        with db.engine.begin() as connection:
+            updated = connection.execute(
+                table.update().where(table.c.sid == sid).values(data=data, expires_at=expires_at)
+            ).rowcount
+            if not updated:
+                connection.execute(table.insert().values(sid=sid, data=data, expires_at=expires_at))
+
+            with self._lock:
+                self._writes += 1
+                evict = self._writes % self.EVICT_EVERY == 0
+            if evict:
+                connection.execute(table.delete().where(table.c.expires_at <= self._now()))
+
+    def delete(self, sid):
+        table = ServerSession.__table__
+        with db.engine.begin() as connection:
+            connection.execute(table.delete().where(table.c.sid == sid))
+
+
+class RedisSessionStore(object):
+    def __init__(self, url, prefix='session:'):
+        import redis  # Optional dependency, only needed for this backend
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, sid):
+        data = self.client.get(self.prefix + sid)
+        return data.decode('utf-8') if data is not None else None
+
+    def set(self, sid, data, ttl):
+        self.client.setex(self.prefix + sid, ttl, data)
+
+    def delete(self, sid):
+        self.client.delete(self.prefix + sid)
+
+
+class ServerSideSessionInterface(SessionInterface):
+    session_class = ServerSideSession
+
+    def __init__(self, store, ttl):
+        self.store = store
+        self.ttl = ttl
+
+    def open_session(self, app, request):
+        # Static files never use the session, so don't pay for a store lookup
+        if app.static_url_path and request.path.startswith(app.static_url_path + '/'):
+            return self.session_class(sid=None)
+
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            data = self.store.get(sid)
+            if data is not None:
+                try:
+                    return self.session_class(_serializer.loads(data), sid=sid)
+                except ValueError:
+                    pass
+        return self.session_class(sid=secrets.token_urlsafe(24), new=True)
+
+    def save_session(self, app, session, response):
+        if session.sid is None:
+            return
+        if session.previous_sid is not None:
+            self.store.delete(session.previous_sid)
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if not session.modified:
+            return
+        self.store.set(session.sid, _serializer.dumps(dict(session)), self.ttl)
+        # A permanent session's cookie is renewed with its data, like the store entry
+        if session.new or session.permanent:
+            response.set_cookie(
+                name,
+                session.sid,
+                max_age=self.ttl if session.permanent else None,
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                httponly=self.get_cookie_httponly(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+        response.vary.add('Cookie')
+
+
+def create_session_interface(config):
+    """Returns the session interface for SESSION_BACKEND, or None to keep Flask's cookie session."""
+    backend = config.get('SESSION_BACKEND', 'sql')
+    ttl = int(config.get('SESSION_LIFETIME', 7 * 24 * 3600))
+    if backend == 'cookie':
+        return None
+    if backend == 'memory':
+        return ServerSideSessionInterface(MemorySessionStore(), ttl)
+    if backend == 'sql':
+        return ServerSideSessionInterface(SQLSessionStore(), ttl)
+    if backend == 'redis':
+        return ServerSideSessionInterface(RedisSessionStore(config['SESSION_REDIS_URL']), ttl)
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
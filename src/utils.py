@@ -1,27 +1,136 @@
-import base64
-import io
-import qrcode
-from pybrcode.pix import generate_simple_pix
-import os
-from dotenv import load_dotenv
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# --- Guest Names ---
+def normalize_name(name):
+    """Lowercase, accent-free, single-spaced version of a name, used for searching guests."""
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(name.lower().split())
+
+
+def split_names(names_str):
+    # RSVP.names_str is the names joined with ", " (names can't contain commas)
+    return [name.strip() for name in names_str.split(',') if name.strip()]
+
+# --- Pix Payload / QR Cache ---
+# Guests often go back and forth through the funnel, which would otherwise rebuild the
+# same BR Code and re-render the same PNG on every reload. Entries are keyed by
+# (amount, description, pix_id) and also indexed by the payload digest used in the
+# /pix-qr/<digest>.png URL.
+PIX_CACHE_MAX_ENTRIES = 256
+
+_pix_cache = OrderedDict()  # (amount, description, pix_id) -> {'payload', 'digest', 'png'}
+_pix_cache_by_digest = {}  # digest -> cache key
+_pix_cache_lock = threading.Lock()
+_pix_cache_stats = {'hits': 0, 'misses': 0}
+
+
+def pix_payload_digest(payload_string):
+    return hashlib.sha256(payload_string.encode('utf-8')).hexdigest()[:32]
+
+
+def pix_cache_info():
+    with _pix_cache_lock:
+        return {
+            'hits': _pix_cache_stats['hits'],
+            'misses': _pix_cache_stats['misses'],
+            'size': len(_pix_cache),
+            'max_size': PIX_CACHE_MAX_ENTRIES,
+        }
+
+
+def _pix_cache_store(key, entry):
+    # Caller must hold _pix_cache_lock
+    _pix_cache[key] = entry
+    _pix_cache.move_to_end(key)
+    _pix_cache_by_digest[entry['digest']] = key
+    while len(_pix_cache) > PIX_CACHE_MAX_ENTRIES:
+        _, evicted = _pix_cache.popitem(last=False)
+        _pix_cache_by_digest.pop(evicted['digest'], None)
+
+
+def render_qr_png(payload_string):
+    from .brcode import qr_png  # Imported on first use, pages without a QR code never need it
+
+    # Same geometry pybrcode used for toBase64(): 10px modules, 4 module border
+    return qr_png(payload_string, box_size=10, border=4)
 
-load_dotenv()
 
 # --- Pix Helper Functions ---
+def pix_description(names):
+    """Description shown in the guest's bank app: the names, cut to fit the payload."""
+    description = ", ".join(names)
+    if len(description) > 70:
+        description = description[:67] + "..."
+    return description
+
+
+def pix_id_for(description):
+    """Transaction id (txid) of the payload, which banks show on the statement."""
+    return description.replace(" ", "").replace(",", "")[:25]
+
+
 def generate_pix_payload(amount, names):
-    pix_id = names.replace(" ", "").replace(",", "")
-    if len(pix_id) > 25:
-        pix_id = pix_id[:25]
-    else:
-        pix_id = pix_id
-    pix_obj = generate_simple_pix(
-        key=os.getenv('PIX_KEY'),
-        fullname=os.getenv('MERCHANT_NAME'),
-        city=os.getenv('MERCHANT_CITY'),
+    """Returns the Pix "Copia e Cola" payload and the digest used to fetch its QR image."""
+    pix_id = pix_id_for(names)
+
+    cache_key = (amount, names, pix_id)
+    with _pix_cache_lock:
+        entry = _pix_cache.get(cache_key)
+        if entry is not None:
+            _pix_cache.move_to_end(cache_key)
+            _pix_cache_stats['hits'] += 1
+            return entry['payload'], entry['digest']
+        _pix_cache_stats['misses'] += 1
+
+    from flask import current_app # Not at the top: the QR render processes import this module without Flask
+    from .brcode import build_pix_payload  # Imported on first use, like qr_png
+
+    config = current_app.config
+    payload_string = build_pix_payload( # This is the "Copia e Cola" text
+        key=config['PIX_KEY'],
+        name=config['MERCHANT_NAME'],
+        city=config['MERCHANT_CITY'],
         value=15*amount,
-        description=names,
-        pix_id=pix_id
+        txid=pix_id,
+        description=names
     )
-    payload_string = str(pix_obj) # This is the "Copia e Cola" text
-    payload_image_b64 = pix_obj.toBase64() # This is the QR code image in base64
-    return payload_string, payload_image_b64
+    digest = pix_payload_digest(payload_string)
+
+    # The PNG is rendered lazily by get_pix_qr_png, when the browser asks for the image
+    with _pix_cache_lock:
+        _pix_cache_store(cache_key, {'payload': payload_string, 'digest': digest, 'png': None})
+    return payload_string, digest
+
+
+def get_pix_qr_png(digest, payload_string=None, render_png=render_qr_png):
+    """Returns the QR code PNG bytes for a payload digest, or None if it is unknown.
+
+    payload_string is used to rebuild the image when the entry is not in this process'
+    cache (evicted, or the page was generated by another worker). It is only trusted
+    if it hashes to the requested digest. render_png renders it (see qrpool.py).
+    """
+    with _pix_cache_lock:
+        key = _pix_cache_by_digest.get(digest)
+        entry = _pix_cache.get(key) if key is not None else None
+        if entry is not None and entry['png'] is not None:
+            _pix_cache.move_to_end(key)
+            _pix_cache_stats['hits'] += 1
+            return entry['png']
+        _pix_cache_stats['misses'] += 1
+
+    if entry is not None:
+        payload_string = entry['payload']
+    elif not payload_string or pix_payload_digest(payload_string) != digest:
+        return None
+
+    png = render_png(payload_string)
+    with _pix_cache_lock:
+        if entry is not None:
+            entry['png'] = png
+        else:
+            # Not generated in this process; cache it by digest only
+            _pix_cache_store(('digest', digest), {'payload': payload_string, 'digest': digest, 'png': png})
+    return png
@@ -0,0 +1,55 @@
+"""Validation of the funnel's form fields, shared by the HTML steps and the JSON API.
+
+Each validator returns an error message (in Portuguese, shown to the guest) or None.
+The name pattern is compiled once, at import.
+"""
+import re
+
+# Letters and spaces only. Empty names are caught before the pattern is checked.
+NAME_PATTERN = re.compile(r"[a-zA-Z ]+")
+MAX_PEOPLE = 10
+# RSVP.names_str (500) holds up to MAX_PEOPLE names joined by ", "; Guest.name is 100
+MAX_NAME_LENGTH = 48
+MAX_PHONE_DIGITS = 20
+
+
+def validate_num_people(num_people_str):
+    """Returns (num_people, error)."""
+    if num_people_str is None or num_people_str == '':
+        return None, "Por favor, informe o número de pessoas."
+    try:
+        num_people = int(num_people_str)
+    except (TypeError, ValueError):
+        return None, "Por favor, insira um número válido."
+    if not 1 <= num_people <= MAX_PEOPLE:
+        return None, f"O número de pessoas deve ser entre 1 e {MAX_PEOPLE}."
+    return num_people, None
+
+
+def validate_names(names):
+    fullmatch = NAME_PATTERN.fullmatch
+    for i, name in enumerate(names, start=1):
+        if not name:
+            return f"Por favor, informe o nome da pessoa {i}."
+        if len(name) > MAX_NAME_LENGTH:
+            return f"O nome da pessoa {i} deve ter no máximo {MAX_NAME_LENGTH} caracteres."
+        if fullmatch(name) is None:
+            return f"O nome da pessoa {i} ('{name}') deve conter apenas letras (sem acentos) e espaços."
+    return None
+
+
+def validate_phone(phone_number):
+    if not phone_number:
+        return "Por favor, informe seu telefone para contato."
+    # str methods beat a regex here; isascii keeps out other scripts' digits, which isdigit accepts
+    if not (phone_number.isascii() and phone_number.isdigit()):
+        return "O telefone deve conter apenas números."
+    if len(phone_number) > MAX_PHONE_DIGITS:
+        return f"O telefone deve ter no máximo {MAX_PHONE_DIGITS} dígitos."
+    return None
+
+
+def form_names(form, num_people):
+    """The name_1 .. name_N fields of the names form, read once each; missing ones are ''."""
+    get = form.get
+    return [get(f'name_{i}') or "" for i in range(1, num_people + 1)]
@@ -0,0 +1,217 @@
+"""Write-behind mode for RSVP confirmations (RSVP_WRITE_MODE = 'journal').
+
+Instead of writing to the database while the guest waits, a confirmation is appended to
+a local SQLite journal (WAL with synchronous=FULL, so it is on disk when the append
+returns) and a background thread in each worker moves the journal to the database in
+batches, with multi-row INSERTs (see models.save_rsvps).
+
+The journal file is shared by the workers on the machine. A flushing worker claims a
+batch, inserts it and only then deletes it from the journal; if the process dies in
+between, the claim expires and the batch is inserted again, which the unique
+confirmation token turns into a no-op. Each RSVP row keeps the claim that inserted it,
+so the retry isn't counted as a repeated confirmation either. The journal is bounded by
+RSVP_JOURNAL_MAX_PENDING: when it is full, confirmations are written directly, so a
+slow database makes guests wait instead of growing the journal without limit.
+"""
+import atexit
+import datetime
+import json
+import os
+import secrets
+import threading
+import time
+
+from .engine import LocalSQLite
+from .live import publish_rsvps
+from .models import db, save_rsvps
+
+# A claimed batch that wasn't deleted after this many seconds belonged to a dead worker
+CLAIM_TIMEOUT = 60
+
+
+class RSVPJournal(object):
+    def __init__(self, path, max_pending=1000, batch_size=100, flush_interval=0.5):
+        self.path = path
+        self._db = LocalSQLite(
+            path,
+            'CREATE TABLE IF NOT EXISTS pending ('
+            ' confirmation_token TEXT PRIMARY KEY,'
+            ' rsvp TEXT NOT NULL,'
+            ' duplicate_count INTEGER NOT NULL DEFAULT 0,'
+            ' queued_at REAL NOT NULL,'
+            ' claimed_by TEXT,'
+            ' claimed_at REAL)',
+            timeout=30,
+            synchronous='FULL',
+        )
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+        self._app = None
+
+    def append(self, rsvp):
+        """Durably queues an RSVP dict (see models.save_rsvps). Returns False if the journal is full."""
+        record = dict(rsvp, timestamp=rsvp['timestamp'].isoformat())
+        connection = self._db.connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            pending = connection.execute('SELECT count(*) FROM pending').fetchone()[0]
+            if pending >= self.max_pending:
+                connection.execute('ROLLBACK')
+                return False
+            # A repeated confirmation that is still queued is only counted
+            connection.execute(
+                'INSERT INTO pending (confirmation_token, rsvp, queued_at) VALUES (?, ?, ?)'
+                ' ON CONFLICT (confirmation_token) DO UPDATE SET duplicate_count = duplicate_count + 1',
+                (rsvp['confirmation_token'], json.dumps(record), time.time()),
+            )
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        if pending + 1 >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def count_repeat(self, token):
+        """Counts a repeated confirmation of a queued RSVP. Returns the RSVP dict, or None if it isn't queued."""
+        connection = self._db.connect()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute('UPDATE pending SET duplicate_count = duplicate_count + 1 WHERE confirmation_token = ?', (token,))
+            row = connection.execute('SELECT rsvp FROM pending WHERE confirmation_token = ?', (token,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def pending(self):
+        return self._db.connect().execute('SELECT count(*) FROM pending').fetchone()[0]
+
+    def _claim_batch(self, claim):
+        """Claims the next batch. Returns (token, rsvp, duplicate_count, previous claim) rows."""
+        connection = self._db.connect()
+        now = time.time()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            # The previous claim is set when a worker died holding the batch
+            rows = connection.execute(
+                'SELECT confirmation_token, rsvp, duplicate_count, claimed_by FROM pending'
+                ' WHERE claimed_by IS NULL OR claimed_at < ? ORDER BY queued_at LIMIT ?',
+                (now - CLAIM_TIMEOUT, self.batch_size),
+            ).fetchall()
+            connection.executemany(
+                'UPDATE pending SET claimed_by = ?, claimed_at = ? WHERE confirmation_token = ?',
+                [(claim, now, row[0]) for row in rows],
+            )
+        return rows
+
+    def flush(self):
+        """Moves the queued RSVPs to the database. Needs an app context. Returns how many were moved."""
+        moved = 0
+        with self._flush_lock:
+            connection = self._db.connect()
+            while True:
+                claim = secrets.token_hex(8)
+                rows = self._claim_batch(claim)
+                if not rows:
+                    return moved
+
+                rsvps = []
+                for _, record, duplicate_count, previous_claim in rows:
+                    rsvp = json.loads(record)
+                    rsvp['timestamp'] = datetime.datetime.fromisoformat(rsvp['timestamp'])
+                    rsvp['duplicate_count'] = duplicate_count
+                    rsvp['journal_claim'] = claim
+                    rsvp['previous_claim'] = previous_claim
+                    rsvps.append(rsvp)
+                try:
+                    ids = save_rsvps(rsvps)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    # Release the claim so the batch is retried on the next flush, keeping the claim
+                    # of a dead worker that may have inserted it
+                    with connection:
+                        connection.executemany(
+                            'UPDATE pending SET claimed_by = ?, claimed_at = 0 WHERE claimed_by = ? AND confirmation_token = ?',
+                            [(previous_claim, claim, token) for token, _, _, previous_claim in rows],
+                        )
+                    raise
+                publish_rsvps(rsvps, ids) # Live admin page
+
+                with connection:
+                    connection.execute('BEGIN IMMEDIATE')
+                    connection.executemany(
+                        'DELETE FROM pending WHERE claimed_by = ? AND confirmation_token = ? AND duplicate_count = ?',
+                        [(claim, token, duplicate_count) for token, _, duplicate_count, _ in rows],
+                    )
+                    # Repeats that arrived during the insert stay queued; only the new ones get
+                    # counted when they are flushed (save_rsvps adds 1 + duplicate_count)
+                    connection.executemany(
+                        'UPDATE pending SET claimed_by = NULL, duplicate_count = duplicate_count - ? - 1'
+                        ' WHERE claimed_by = ? AND confirmation_token = ?',
+                        [(duplicate_count, claim, token) for token, _, duplicate_count, _ in rows],
+                    )
+                moved += len(rows)
+
+    def start(self, app):
+        """Starts the flush thread in this process if it isn't running (threads don't survive a fork)."""
+        if self._thread_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._app = app
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='rsvp-journal-flush', daemon=True)
+            self._thread.start()
+            self._thread_pid = os.getpid()
+            atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                with self._app.app_context():
+                    self.flush()
+            except Exception as e:
+                print(f"Error flushing the RSVP journal: {e}")
+
+    def stop(self):
+        """Stops the flush thread and flushes what is left. Called on worker exit."""
+        if self._thread_pid != os.getpid():
+            return
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join(timeout=30)
+        self._thread_pid = None
+        try:
+            with self._app.app_context():
+                self.flush()
+        except Exception as e:
+            print(f"Error flushing the RSVP journal on shutdown, it stays queued: {e}")
+
+
+def init_write_behind(app):
+    """Sets up the RSVP journal if RSVP_WRITE_MODE is 'journal'. It is in app.extensions['rsvp_journal']."""
+    mode = app.config.get('RSVP_WRITE_MODE', 'direct')
+    if mode == 'direct':
+        return
+    if mode != 'journal':
+        raise ValueError(f"Unknown RSVP_WRITE_MODE: {mode}")
+
+    journal = RSVPJournal(
+        app.config.get('RSVP_JOURNAL_PATH') or os.path.join(app.instance_path, 'rsvp_journal.sqlite'),
+        max_pending=int(app.config.get('RSVP_JOURNAL_MAX_PENDING', 1000)),
+        batch_size=int(app.config.get('RSVP_JOURNAL_BATCH_SIZE', 100)),
+        flush_interval=float(app.config.get('RSVP_JOURNAL_FLUSH_INTERVAL', 0.5)),
+    )
+    app.extensions['rsvp_journal'] = journal
+
+    # Started on the first request of each worker, never in the gunicorn master
+    app.before_request(lambda: journal.start(app))
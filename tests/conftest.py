@@ -0,0 +1,54 @@
+import datetime
+
+import pytest
+
+from src.app import create_app, create_schema
+from src.config import Config
+from src.models import db
+
+
+@pytest.fixture
+def app_config():
+    """Config values a test module needs on top of the defaults below."""
+    return {}
+
+
+@pytest.fixture
+def app(tmp_path, app_config):
+    app = create_app(type('TestConfig', (Config,), {
+        'TESTING': True,
+        'SECRET_KEY': 'test',
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.sqlite'}",
+        'ACCESS_PIN': '1234',
+        'ADMIN_PIN': '9999',
+        'PIX_KEY': '123e4567-e89b-12d3-a456-426614174000',
+        'MERCHANT_NAME': 'Arraia da Laura',
+        'MERCHANT_CITY': 'Sao Jose',
+        'SESSION_BACKEND': 'memory',
+        'RATE_LIMIT_BACKEND': 'off',
+        'RSVP_JOURNAL_PATH': str(tmp_path / 'journal.sqlite'),
+        'METRICS_PATH': str(tmp_path / 'metrics.sqlite'),
+        **app_config,
+    }))
+    with app.app_context():
+        create_schema()
+        yield app
+        db.session.remove()
+
+
+def _make_rsvp(token, names=('Ana Maria', 'Joao'), timestamp=None, **extra):
+    return dict({
+        'city': 'Taubaté',
+        'group': 'Impostoras',
+        'num_people': len(names),
+        'names': list(names),
+        'phone': '12999990000',
+        'confirmation_token': token,
+        'timestamp': timestamp or datetime.datetime(2025, 6, 1, 20, 0),
+    }, **extra)
+
+
+@pytest.fixture
+def make_rsvp():
+    """Builds an RSVP dict as models.save_rsvps takes it."""
+    return _make_rsvp
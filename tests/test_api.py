@@ -0,0 +1,60 @@
+from src.models import db, RSVP
+from src.writebehind import RSVPJournal
+
+RSVP_DATA = {
+    'city': 'Taubaté',
+    'group': 'Impostoras',
+    'num_people': 2,
+    'names': ['Ana Maria', 'Joao'],
+    'phone_number': '12999990000',
+}
+
+
+def start_rsvp(client):
+    response = client.post('/api/rsvp?access_pin=1234', json=RSVP_DATA)
+    assert response.status_code == 200
+    return response.get_json()['confirmation_token']
+
+
+def test_retried_confirmation_gets_the_same_rsvp(app):
+    client = app.test_client()
+    token = start_rsvp(client)
+
+    first = client.post('/api/rsvp/confirm', json={'confirmation_token': token})
+    assert first.status_code == 201
+    # The 201 was lost and the client retries: the RSVP already left the session
+    retry = client.post('/api/rsvp/confirm', json={'confirmation_token': token})
+    assert retry.status_code == 201
+    assert retry.get_json() == first.get_json()
+
+    rsvp = db.session.execute(db.select(RSVP)).scalar_one()
+    assert (rsvp.id, rsvp.duplicate_count) == (first.get_json()['rsvp_id'], 1)
+
+
+def test_confirmation_without_a_token_or_rsvp_is_a_conflict(app):
+    client = app.test_client()
+    token = start_rsvp(client)
+    assert client.post('/api/rsvp/confirm').status_code == 201
+    assert client.post('/api/rsvp/confirm').status_code == 409
+    unknown = client.post('/api/rsvp/confirm', json={'confirmation_token': token + 'x'})
+    assert unknown.status_code == 409
+    assert unknown.get_json()['field'] == 'confirmation_token'
+
+
+def test_retry_of_a_queued_confirmation(app, tmp_path):
+    journal = RSVPJournal(str(tmp_path / 'api-journal.sqlite'))
+    app.extensions['rsvp_journal'] = journal
+    client = app.test_client()
+    token = start_rsvp(client)
+
+    assert client.post('/api/rsvp/confirm', json={'confirmation_token': token}).get_json()['queued']
+    retry = client.post('/api/rsvp/confirm', json={'confirmation_token': token})
+    assert retry.status_code == 201
+    assert retry.get_json()['queued']
+    assert retry.get_json()['names'] == 'Ana Maria e Joao'
+
+    assert journal.flush() == 1
+    assert db.session.execute(db.select(RSVP.duplicate_count)).scalar_one() == 1
+    # After the flush the retry finds the saved RSVP
+    retry = client.post('/api/rsvp/confirm', json={'confirmation_token': token})
+    assert retry.get_json()['rsvp_id'] == db.session.execute(db.select(RSVP.id)).scalar_one()
@@ -0,0 +1,89 @@
+import io
+
+import pytest
+
+from src.brcode import build_pix_payload, crc16_ccitt, qr_matrix, qr_png
+
+# Payloads generated by pybrcode's generate_simple_pix() for the same arguments
+PYBRCODE_VECTORS = [
+    (
+        ('123e4567-e89b-12d3-a456-426614174000', 'Arraia da Laura', 'Sao Jose', 30, 'AnaMariaJoao', 'Ana Maria, Joao'),
+        '00020101021226770014BR.GOV.BCB.PIX0136123e4567-e89b-12d3-a456-4266141740000215Ana Maria, Joao'
+        '520400005303986540530.005802BR5915Arraia da Laura6008Sao Jose62160512AnaMariaJoao63045CAA',
+    ),
+    (
+        ('festa@example.com', 'Arraiá da Laura', 'São José', 15, 'Maria', 'Maria'),
+        '00020101021226480014BR.GOV.BCB.PIX0117festa@example.com0205Maria'
+        '520400005303986540515.005802BR5915Arraia da Laura6008Sao Jose62090505Maria6304C3D6',
+    ),
+    (
+        # Phone key; the description doesn't fit in field 26 and is left out
+        ('(12)99999-0000', 'Arraia', 'Taubate', 150, 'PedroPauloTiagoJoaoAndre',
+         'Pedro, Paulo, Tiago, Joao, Andre, Filipe, Bartolomeu, Tome, Mateus, Simao'[:67] + '...'),
+        '00020101021226360014BR.GOV.BCB.PIX0114+5512999990000'
+        '5204000053039865406150.005802BR5906Arraia6007Taubate62280524PedroPauloTiagoJoaoAndre6304B707',
+    ),
+]
+
+
+def parse_tlv(text):
+    fields = {}
+    while text:
+        field_id, length = text[:2], int(text[2:4])
+        fields[field_id] = text[4:4 + length]
+        text = text[4 + length:]
+    return fields
+
+
+def test_crc16_check_value():
+    # CRC-16/CCITT-FALSE check value
+    assert crc16_ccitt(b'123456789') == 0x29B1
+
+
+@pytest.mark.parametrize('arguments, expected', PYBRCODE_VECTORS)
+def test_payload_matches_pybrcode(arguments, expected):
+    key, name, city, value, txid, description = arguments
+    assert build_pix_payload(key, name, city, value, txid, description) == expected
+
+
+def test_payload_fields_and_crc():
+    payload = build_pix_payload('festa@example.com', 'Arraia da Laura', 'Sao Jose', 45, 'AnaMaria', 'Ana Maria')
+    fields = parse_tlv(payload)
+    assert fields['54'] == '45.00'
+    assert fields['53'] == '986'
+    assert fields['59'] == 'Arraia da Laura'
+    assert fields['60'] == 'Sao Jose'
+    assert parse_tlv(fields['26']) == {'00': 'BR.GOV.BCB.PIX', '01': 'festa@example.com', '02': 'Ana Maria'}
+    assert parse_tlv(fields['62']) == {'05': 'AnaMaria'}
+    assert fields['63'] == f"{crc16_ccitt(payload[:-4].encode('utf-8')):04X}"
+
+
+@pytest.mark.parametrize('key', ['not-a-key', '123.456.789-0', 'fulano@'])
+def test_invalid_keys_are_rejected(key):
+    with pytest.raises(ValueError):
+        build_pix_payload(key, 'Arraia', 'Taubate', 15, 'Maria')
+
+
+@pytest.mark.parametrize('text', [
+    PYBRCODE_VECTORS[0][1],
+    PYBRCODE_VECTORS[2][1],
+    '1234',
+    'HELLO WORLD',
+    'a' + '1' * 25 + 'b' + 'ABCDEFGHIJKLMNOPQRSTUVWXYZ',
+    'Convidados: São João, Conceição',
+    'x' * 400,
+])
+def test_qr_matrix_matches_qrcode(text):
+    qrcode = pytest.importorskip('qrcode')
+    reference = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_L, border=0)
+    reference.add_data(text)
+    reference.make(fit=True)
+    assert qr_matrix(text) == reference.get_matrix()
+
+
+def test_qr_png_is_a_readable_image():
+    image_module = pytest.importorskip('PIL.Image')
+    payload = PYBRCODE_VECTORS[0][1]
+    image = image_module.open(io.BytesIO(qr_png(payload, box_size=10, border=4)))
+    image.load()
+    assert image.size == ((len(qr_matrix(payload)) + 8) * 10,) * 2
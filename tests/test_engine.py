@@ -0,0 +1,21 @@
+from src.engine import engine_options, postgres_pool_size
+
+
+def test_pool_covers_two_connections_per_request_plus_the_flush():
+    assert postgres_pool_size(workers=3, concurrency=4) == (5, 4)
+    # The cap is shared by the workers
+    assert postgres_pool_size(workers=3, concurrency=4, max_connections=21) == (5, 2)
+    assert postgres_pool_size(workers=4, concurrency=4, max_connections=2) == (1, 0)
+
+
+def test_gevent_pool_is_sized_for_the_greenlets(monkeypatch):
+    monkeypatch.setenv('GUNICORN_WORKER_CLASS', 'gevent')
+    monkeypatch.setenv('WEB_CONCURRENCY', '2')
+    monkeypatch.setenv('GUNICORN_THREADS', '1')
+    monkeypatch.setenv('GUNICORN_WORKER_CONNECTIONS', '100')
+    options = engine_options({'DB_ENGINE_PROFILE': 'postgres', 'DB_MAX_CONNECTIONS': 60})
+    assert (options['pool_size'], options['max_overflow']) == (30, 0)
+
+    monkeypatch.setenv('GUNICORN_WORKER_CLASS', 'gthread')
+    options = engine_options({'DB_ENGINE_PROFILE': 'postgres', 'DB_MAX_CONNECTIONS': 60})
+    assert (options['pool_size'], options['max_overflow']) == (2, 1)
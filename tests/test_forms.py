@@ -0,0 +1,18 @@
+from src.validators import MAX_NAME_LENGTH, MAX_PEOPLE, MAX_PHONE_DIGITS
+
+
+def start_funnel(client):
+    client.get('/welcome?access_pin=1234')
+    client.post('/city', data={'city': 'Taubaté'})
+    client.post('/group', data={'group': 'Impostoras'})
+
+
+def test_form_limits_match_the_validators(app):
+    client = app.test_client()
+    start_funnel(client)
+    assert f'max="{MAX_PEOPLE}"' in client.get('/number-of-people').get_data(as_text=True)
+    client.post('/number-of-people', data={'num_people': '1'})
+    assert f'maxlength="{MAX_NAME_LENGTH}"' in client.get('/names').get_data(as_text=True)
+    client.post('/names', data={'name_1': 'Ana Maria'})
+    contact = client.get('/contact').get_data(as_text=True)
+    assert f'pattern="\\d{{1,{MAX_PHONE_DIGITS}}}" maxlength="{MAX_PHONE_DIGITS}"' in contact
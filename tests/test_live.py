@@ -0,0 +1,29 @@
+import json
+
+from src.live import POLL_OVERLAP, rsvp_stream
+from src.models import db, save_rsvps
+
+
+def event_ids(chunks):
+    return [json.loads(line[len('data: '):])['id'] for line in ''.join(chunks).splitlines() if line.startswith('data: ')]
+
+
+def save(make_rsvp, count):
+    ids = save_rsvps([make_rsvp(f"token-{i}") for i in range(count)])
+    db.session.commit()
+    return sorted(ids.values())
+
+
+def test_poll_goes_back_from_the_last_event_id(app, make_rsvp):
+    ids = save(make_rsvp, POLL_OVERLAP + 5)
+    # The page had the first RSVP; the browser last got the newest one
+    chunks = list(rsvp_stream(ids[0], ids[-1], poll_only=True))
+    assert chunks[0].startswith('retry: ')
+    assert event_ids(chunks) == ids[-POLL_OVERLAP:]
+
+
+def test_poll_never_sends_what_the_page_was_rendered_with(app, make_rsvp):
+    ids = save(make_rsvp, 5)
+    assert event_ids(rsvp_stream(ids[2], ids[3], poll_only=True)) == ids[3:]
+    # First request, no Last-Event-ID yet
+    assert event_ids(rsvp_stream(ids[2], poll_only=True)) == ids[3:]
@@ -0,0 +1,47 @@
+import json
+import re
+
+from src import metrics
+
+
+def scrape(client):
+    response = client.get('/metrics', headers={'Authorization': 'Bearer 9999'})
+    assert response.status_code == 200
+    return response.get_data(as_text=True)
+
+
+def sample(text, name, labels=''):
+    match = re.search(rf'^{re.escape(name + labels)} (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else 0
+
+
+def test_scrape_adds_up_every_worker(app):
+    client = app.test_client()
+    client.get('/robots.txt')
+    before = sample(scrape(client), 'http_responses_total', '{endpoint="robots_txt",status="200"}')
+
+    # Another worker, which has since exited, answered 5 requests and missed the Pix cache 3 times
+    other = {
+        'requests': [['robots_txt', [5] * len(metrics.LATENCY_BUCKETS), 5, 0.01]],
+        'statuses': [['robots_txt', 200, 5]],
+        'parts': [],
+        'counters': {'pix_cache_misses_total': 3},
+    }
+    store = app.extensions['metrics_store']
+    store._db.connect().execute(
+        'INSERT INTO process_metrics (process, data, updated_at) VALUES (?, ?, 0)', ('other', json.dumps(other))
+    )
+    text = scrape(client)
+    # The scrape itself counts once it's answered, so only robots.txt is compared
+    assert sample(text, 'http_responses_total', '{endpoint="robots_txt",status="200"}') == before + 5
+    assert sample(text, 'http_request_duration_seconds_count', '{endpoint="robots_txt"}') == before + 5
+    assert sample(text, 'pix_cache_misses_total') >= 3
+
+
+def test_counters_never_go_backwards_between_scrapes(app):
+    client = app.test_client()
+    totals = []
+    for _ in range(3):
+        client.get('/robots.txt')
+        totals.append(sample(scrape(client), 'http_responses_total', '{endpoint="robots_txt",status="200"}'))
+    assert totals[0] < totals[1] < totals[2]
@@ -0,0 +1,43 @@
+import pytest
+
+from src.models import db, save_rsvps, Guest, RSVP
+
+
+def saved():
+    return {
+        rsvp.confirmation_token: (rsvp.id, rsvp.duplicate_count, len(rsvp.guests))
+        for rsvp in RSVP.query.order_by(RSVP.id)
+    }
+
+
+@pytest.fixture(params=['upsert', 'savepoint'])
+def insert_path(request, app, monkeypatch):
+    # 'savepoint' is the path for databases without ON CONFLICT (MySQL...), forced on SQLite
+    if request.param == 'savepoint':
+        dialect = db.session.get_bind().dialect
+        monkeypatch.setattr(dialect, 'name', 'mysql')
+        monkeypatch.setattr(dialect, 'update_returning', False)
+    return request.param
+
+
+def test_save_rsvps_inserts_rsvps_and_guests(app, insert_path, make_rsvp):
+    ids = save_rsvps([make_rsvp('a'), make_rsvp('b', names=['Maria'])])
+    db.session.commit()
+
+    assert saved() == {'a': (ids['a'], 0, 2), 'b': (ids['b'], 0, 1)}
+    names = {guest.name: guest.name_normalized for guest in Guest.query}
+    assert names == {'Ana Maria': 'ana maria', 'Joao': 'joao', 'Maria': 'maria'}
+
+
+def test_repeated_confirmation_is_counted_not_saved_again(app, insert_path, make_rsvp):
+    first = save_rsvps([make_rsvp('a'), make_rsvp('b')])
+    db.session.commit()
+    # The caller already collapsed two more repeats of 'b' into this one
+    again = save_rsvps([make_rsvp('b', duplicate_count=2), make_rsvp('c')])
+    db.session.commit()
+    save_rsvps([make_rsvp('a')])
+    db.session.commit()
+
+    assert again['b'] == first['b']
+    assert saved() == {'a': (first['a'], 1, 2), 'b': (first['b'], 3, 2), 'c': (again['c'], 0, 2)}
+    assert Guest.query.count() == 6
@@ -0,0 +1,85 @@
+from collections import OrderedDict
+
+import pytest
+
+from src import utils
+from src.utils import generate_pix_payload, get_pix_qr_png, pix_payload_digest
+
+
+@pytest.fixture(autouse=True)
+def empty_pix_cache(monkeypatch):
+    monkeypatch.setattr(utils, '_pix_cache', OrderedDict())
+    monkeypatch.setattr(utils, '_pix_cache_by_digest', {})
+    monkeypatch.setattr(utils, '_pix_cache_stats', {'hits': 0, 'misses': 0})
+
+
+def counting_renderer(calls):
+    def render_png(payload_string):
+        calls.append(payload_string)
+        return b'png:' + payload_string.encode('utf-8')
+    return render_png
+
+
+def test_payload_is_built_once_per_amount_and_names(app):
+    payload, digest = generate_pix_payload(2, 'Ana Maria, Joao')
+    assert generate_pix_payload(2, 'Ana Maria, Joao') == (payload, digest)
+    assert digest == pix_payload_digest(payload)
+    assert generate_pix_payload(3, 'Ana Maria, Joao')[1] != digest
+    assert (utils.pix_cache_info()['hits'], utils.pix_cache_info()['misses']) == (1, 2)
+
+
+def test_least_recently_used_entry_is_evicted(app, monkeypatch):
+    monkeypatch.setattr(utils, 'PIX_CACHE_MAX_ENTRIES', 2)
+    _, first = generate_pix_payload(1, 'Ana')
+    _, second = generate_pix_payload(1, 'Bia')
+    generate_pix_payload(1, 'Ana') # Ana is now the most recently used
+    _, third = generate_pix_payload(1, 'Caio')
+
+    assert utils.pix_cache_info()['size'] == 2
+    assert set(utils._pix_cache_by_digest) == {first, third}
+    assert get_pix_qr_png(second) is None
+
+
+def test_qr_image_is_rendered_once(app):
+    calls = []
+    payload, digest = generate_pix_payload(2, 'Ana Maria, Joao')
+    png = get_pix_qr_png(digest, render_png=counting_renderer(calls))
+    assert get_pix_qr_png(digest, render_png=counting_renderer(calls)) == png
+    assert calls == [payload]
+
+
+def test_qr_image_from_another_worker_is_rebuilt_only_from_a_matching_payload(app):
+    calls = []
+    payload = generate_pix_payload(2, 'Ana Maria, Joao')[0]
+    utils._pix_cache.clear() # As if the page had been generated by another worker
+    utils._pix_cache_by_digest.clear()
+    digest = pix_payload_digest(payload)
+
+    assert get_pix_qr_png('0' * 32, payload_string=payload, render_png=counting_renderer(calls)) is None
+    assert get_pix_qr_png(digest, payload_string=payload, render_png=counting_renderer(calls)) is not None
+    assert get_pix_qr_png(digest, render_png=counting_renderer(calls)) is not None
+    assert calls == [payload]
+
+
+def test_qr_endpoint_is_cacheable_forever(app):
+    client = app.test_client()
+    response = client.post('/api/rsvp?access_pin=1234', json={
+        'city': 'Taubaté', 'group': 'Impostoras', 'num_people': 1, 'names': ['Ana Maria'], 'phone_number': '12999990000',
+    })
+    qr_image = response.get_json()['qr_image']
+    digest = qr_image.rsplit('/', 1)[1][:-len('.png')]
+
+    image = client.get(qr_image)
+    assert image.status_code == 200
+    assert image.mimetype == 'image/png'
+    assert image.data.startswith(b'\x89PNG')
+    assert image.headers['ETag'] == f'"{digest}"'
+    assert image.cache_control.public and image.cache_control.immutable
+    assert image.cache_control.max_age == 31536000
+
+    revalidated = client.get(qr_image, headers={'If-None-Match': f'"{digest}"'})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b''
+    assert revalidated.headers['ETag'] == f'"{digest}"'
+
+    assert client.get(f"/pix-qr/{'0' * 32}.png").status_code == 404
@@ -0,0 +1,53 @@
+import pytest
+
+
+@pytest.fixture
+def app_config():
+    return {
+        'RATE_LIMIT_BACKEND': 'memory',
+        'RATE_LIMITS': {None: (1, 3), 'landing': (1, 5), 'admin': (1, 2)},
+    }
+
+
+def test_wrong_pins_are_limited_by_ip(app):
+    client = app.test_client(use_cookies=False)
+    statuses = [client.get('/city?access_pin=0000').status_code for _ in range(4)]
+    assert statuses == [302, 302, 302, 429]
+
+
+def test_invite_link_has_its_own_looser_budget(app):
+    client = app.test_client(use_cookies=False)
+    statuses = [client.get('/welcome?access_pin=1234').status_code for _ in range(6)]
+    assert statuses == [302] * 5 + [429]
+    # The landing budget is separate from the one for every other page
+    assert client.get('/city?access_pin=0000').status_code == 302
+
+
+def test_right_pin_off_the_landing_page_is_limited(app):
+    client = app.test_client(use_cookies=False)
+    statuses = [client.get('/city?access_pin=1234').status_code for _ in range(4)]
+    assert statuses[-1] == 429
+    assert client.post('/?access_pin=1234').status_code == 429
+
+
+def test_admin_pin_guesses_are_limited_but_the_admin_is_not(app):
+    client = app.test_client(use_cookies=False)
+    statuses = [client.get(f"/confirmed-guests?admin_pin={pin}").status_code for pin in ('0000', '0001', '0002')]
+    assert statuses == [302, 302, 429]
+    assert client.get('/metrics', headers={'Authorization': 'Bearer 1111'}).status_code == 429
+
+    # A guesser on the same address doesn't lock the admin out
+    assert client.get('/metrics', headers={'Authorization': 'Bearer 9999'}).status_code == 200
+    admin = app.test_client()
+    assert admin.get('/confirmed-guests?admin_pin=9999').status_code == 302
+    for _ in range(5):
+        assert admin.get('/confirmed-guests').status_code == 200
+
+
+def test_guest_session_has_its_own_bucket(app):
+    guest = app.test_client()
+    assert guest.get('/welcome?access_pin=1234').status_code == 302
+    statuses = [guest.get('/city').status_code for _ in range(4)]
+    assert statuses == [200, 200, 200, 429]
+    # The IP address budget wasn't used by the guest's session
+    assert app.test_client(use_cookies=False).get('/city?access_pin=0000').status_code == 302
@@ -0,0 +1,88 @@
+import datetime
+import io
+from decimal import Decimal
+
+from src.models import db, save_rsvps, PaymentMatch
+from src.reconcile import StatementLine, open_statement, parse_ofx_date, parse_statement, reconcile_statement
+
+CONFIRMED_AT = datetime.datetime(2025, 6, 1, 20, 0)
+
+
+def line(number, amount, description, posted_at=CONFIRMED_AT + datetime.timedelta(minutes=5)):
+    return StatementLine(number, posted_at, Decimal(amount), description)
+
+
+def results(run_id):
+    return {
+        match.line_number: (match.status, match.rsvp_id, match.candidate_ids)
+        for match in PaymentMatch.query.filter_by(run_id=run_id)
+    }
+
+
+def test_reconcile_statement_matches_by_pix_id_amount_and_time(app, make_rsvp):
+    ids = save_rsvps([
+        make_rsvp('a', names=['Ana Maria', 'Joao']), # Pix id AnaMariaJoao, 30.00
+        make_rsvp('b', names=['Maria']), # Pix id Maria, 15.00
+        make_rsvp('c', names=['Pedro'], timestamp=CONFIRMED_AT + datetime.timedelta(hours=1)),
+    ])
+    db.session.commit()
+
+    run_id, counts = reconcile_statement([
+        line(1, '30.00', 'PIX RECEBIDO - ANA MARIA JOAO - AnaMariaJoao'),
+        line(2, '30.00', 'PIX RECEBIDO AnaMariaJoao'), # Same RSVP paid again
+        line(3, '45.00', 'PIX RECEBIDO Maria'), # Right pix id, wrong amount
+        line(4, '15.00', 'PIX RECEBIDO FULANO'), # No pix id: amount and time only
+        line(5, '99.00', 'TED RECEBIDA'),
+        line(6, '-30.00', 'PIX ENVIADO AnaMariaJoao'), # Outgoing, skipped
+        line(7, '15.00', 'Maria', posted_at=CONFIRMED_AT + datetime.timedelta(days=5)), # Outside the window
+    ], window_hours=48)
+
+    assert counts == {'matched': 1, 'ambiguous': 4, 'unmatched': 1}
+    assert results(run_id) == {
+        1: ('matched', ids['a'], None),
+        2: ('ambiguous', None, str(ids['a'])),
+        3: ('ambiguous', None, str(ids['b'])),
+        4: ('ambiguous', None, f"{ids['b']},{ids['c']}"),
+        5: ('unmatched', None, None),
+        7: ('ambiguous', None, str(ids['b'])),
+    }
+
+
+def test_csv_statement_in_windows_1252(app):
+    export = (
+        'Data;Histórico;Valor\n'
+        '01/06/2025 20:05;PIX RECEBIDO AnaMariaJoao;30,00\n'
+        '02/06/2025;Tarifa;-1.234,50\n'
+    ).encode('cp1252')
+
+    lines = list(parse_statement(open_statement(io.BytesIO(export)), 'extrato.csv'))
+
+    assert [(l.line_number, l.posted_at, l.amount, l.description) for l in lines] == [
+        (2, datetime.datetime(2025, 6, 1, 20, 5), Decimal('30.00'), 'PIX RECEBIDO AnaMariaJoao'),
+        (3, datetime.datetime(2025, 6, 2), Decimal('-1234.50'), 'Tarifa'),
+    ]
+
+
+def test_statement_times_are_local_and_rsvp_times_utc(app, make_rsvp):
+    # Confirmed at 01:00 UTC on June 2, which is 22:00 on June 1 in Brasília
+    ids = save_rsvps([
+        make_rsvp('a', names=['Ana Maria']),
+        make_rsvp('b', names=['Bia'], timestamp=datetime.datetime(2025, 6, 2, 1, 0)),
+    ])
+    db.session.commit()
+
+    run_id, counts = reconcile_statement([
+        # Paid 30 minutes later, on the same local evening
+        line(1, '15.00', 'PIX RECEBIDO Bia', posted_at=datetime.datetime(2025, 6, 1, 22, 30)),
+        # Same amount without a pix id: only RSVPs within the window in UTC are candidates
+        line(2, '15.00', 'PIX RECEBIDO', posted_at=datetime.datetime(2025, 6, 1, 23, 30)),
+    ], window_hours=1)
+
+    assert counts == {'matched': 1, 'ambiguous': 0, 'unmatched': 1}
+    assert results(run_id)[1] == ('matched', ids['b'], None)
+
+
+def test_ofx_dates_with_another_offset_are_moved_to_local_time():
+    assert parse_ofx_date('20250601223000[-3:BRT]') == datetime.datetime(2025, 6, 1, 22, 30)
+    assert parse_ofx_date('20250602013000.000[0:GMT]') == datetime.datetime(2025, 6, 1, 22, 30)
+    assert parse_ofx_date('20250601') == datetime.datetime(2025, 6, 1)
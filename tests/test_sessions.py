@@ -0,0 +1,54 @@
+from flask import session
+
+from src.sessions import _serializer, regenerate_session_id
+
+
+def session_cookie(response):
+    cookies = [value for value in response.headers.getlist('Set-Cookie') if value.startswith('session=')]
+    assert len(cookies) == 1
+    return cookies[0]
+
+
+def test_session_id_changes_when_the_pin_is_accepted(app):
+    # An attacker got a valid session id and planted it in the guest's browser (fixation)
+    store = app.session_interface.store
+    store.set('planted-id', _serializer.dumps({'city': 'Taubaté'}), 60)
+    client = app.test_client()
+    client.set_cookie('session', 'planted-id')
+
+    response = client.get('/welcome?access_pin=1234')
+    assert response.status_code == 302
+    sid = session_cookie(response).split(';')[0].split('=', 1)[1]
+    assert sid != 'planted-id'
+    assert store.get('planted-id') is None
+    assert client.get('/city').status_code == 200
+
+
+def test_old_session_id_is_deleted_when_rotated(app):
+    client = app.test_client()
+    client.get('/welcome?access_pin=1234')
+    old_sid = client.get_cookie('session').value
+    store = app.session_interface.store
+    assert store.get(old_sid) is not None
+
+    # The guest then opens the admin link: the session gains admin access and a new id
+    client.get('/confirmed-guests?admin_pin=9999')
+    new_sid = client.get_cookie('session').value
+    assert new_sid != old_sid
+    assert store.get(old_sid) is None
+    assert client.get('/confirmed-guests').status_code == 200
+
+
+def test_cookie_lasts_only_the_browser_session_unless_permanent(app):
+    with app.test_request_context():
+        session['pin_verified'] = True
+        regenerate_session_id()
+        response = app.response_class()
+        app.session_interface.save_session(app, session, response)
+        cookie = session_cookie(response)
+        assert 'Max-Age' not in cookie and 'Expires' not in cookie
+
+        session.permanent = True
+        response = app.response_class()
+        app.session_interface.save_session(app, session, response)
+        assert f"Max-Age={app.session_interface.ttl}" in session_cookie(response)
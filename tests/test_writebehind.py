@@ -0,0 +1,97 @@
+import time
+
+import pytest
+
+from src import writebehind
+from src.models import db, save_rsvps, RSVP
+from src.writebehind import RSVPJournal
+
+
+def journal_for(tmp_path, **options):
+    return RSVPJournal(str(tmp_path / 'journal.sqlite'), **options)
+
+
+def test_flush_moves_queued_rsvps_in_batches(app, tmp_path, make_rsvp):
+    journal = journal_for(tmp_path, batch_size=2)
+    for token in ('a', 'b', 'c'):
+        assert journal.append(make_rsvp(token))
+    assert journal.append(make_rsvp('a')) # Repeat while still queued: only counted
+    assert journal.pending() == 3
+
+    assert journal.flush() == 3
+    assert journal.pending() == 0
+    counts = dict(db.session.query(RSVP.confirmation_token, RSVP.duplicate_count))
+    assert counts == {'a': 1, 'b': 0, 'c': 0}
+
+
+def test_full_journal_refuses_appends(app, tmp_path, make_rsvp):
+    journal = journal_for(tmp_path, max_pending=2)
+    assert journal.append(make_rsvp('a'))
+    assert journal.append(make_rsvp('b'))
+    assert not journal.append(make_rsvp('c'))
+    assert journal.pending() == 2
+
+
+def test_claimed_batch_is_left_to_its_worker_until_the_claim_expires(app, tmp_path, make_rsvp, monkeypatch):
+    journal = journal_for(tmp_path)
+    journal.append(make_rsvp('a'))
+    # Another worker claimed the batch and died before deleting it
+    assert len(journal._claim_batch('dead-worker')) == 1
+
+    assert journal.flush() == 0
+    assert RSVP.query.count() == 0
+
+    monkeypatch.setattr(writebehind, 'CLAIM_TIMEOUT', 0)
+    time.sleep(0.01)
+    assert journal.flush() == 1
+    assert journal.pending() == 0
+    assert RSVP.query.count() == 1
+
+
+def test_batch_inserted_before_a_crash_is_not_saved_twice(app, tmp_path, make_rsvp, monkeypatch):
+    journal = journal_for(tmp_path)
+    journal.append(make_rsvp('a'))
+    journal.append(make_rsvp('b'))
+    # The worker inserted the batch but died before deleting it from the journal
+    rows = journal._claim_batch('dead-worker')
+    assert len(rows) == 2
+    save_rsvps([make_rsvp(token, journal_claim='dead-worker') for token, *_ in rows])
+    db.session.commit()
+
+    monkeypatch.setattr(writebehind, 'CLAIM_TIMEOUT', 0)
+    time.sleep(0.01)
+    assert journal.flush() == 2
+    assert journal.pending() == 0
+    # The retry isn't a repeated confirmation
+    counts = dict(db.session.query(RSVP.confirmation_token, RSVP.duplicate_count))
+    assert counts == {'a': 0, 'b': 0}
+
+
+def test_failed_retry_keeps_the_dead_workers_claim(app, tmp_path, make_rsvp, monkeypatch):
+    journal = journal_for(tmp_path)
+    journal.append(make_rsvp('a'))
+    rows = journal._claim_batch('dead-worker')
+    save_rsvps([make_rsvp('a', journal_claim='dead-worker')])
+    db.session.commit()
+    monkeypatch.setattr(writebehind, 'CLAIM_TIMEOUT', 0)
+    time.sleep(0.01)
+
+    # The retry fails before saving anything and releases the batch
+    def failing_save(rsvps):
+        raise RuntimeError('database is down')
+    monkeypatch.setattr(writebehind, 'save_rsvps', failing_save)
+    with pytest.raises(RuntimeError):
+        journal.flush()
+
+    monkeypatch.undo()
+    assert journal.flush() == 1
+    assert db.session.execute(db.select(RSVP.duplicate_count)).scalar_one() == 0
+
+
+def test_token_queued_again_after_a_flush_is_a_repeat(app, tmp_path, make_rsvp):
+    journal = journal_for(tmp_path)
+    journal.append(make_rsvp('a'))
+    assert journal.flush() == 1
+    journal.append(make_rsvp('a')) # Reload after the first one was flushed
+    assert journal.flush() == 1
+    assert db.session.execute(db.select(RSVP.duplicate_count)).scalar_one() == 1